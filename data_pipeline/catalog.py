@@ -0,0 +1,192 @@
+"""Scored, serialised and pre-sorted view of one version of the city dataset.
+
+Everything the city endpoints return is derived from the records alone, so the
+dataset-wide parts are computed once when a :class:`CityCatalog` is built,
+vectorised over :class:`~data_pipeline.columns.CityColumns`: suitability scores
+and priority bands, the record order for every sort option, the search index
+and the home-page aggregates.  Per-city records, payloads and their JSON are
+built from the columns the first time a city is served and kept, so a catalog
+over a memory-mapped snapshot does not decode every row up front.  ``version``
+is a hash of the columns and scores, and responses use it in their ETags so
+clients revalidate instead of downloading an unchanged list again.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, TypeVar
+
+import numpy as np
+
+from .columns import PRIORITY_BANDS, SORT_ORDERS, CityColumns
+from .loader import CityRecord, normalize_key
+from .search import SearchIndex
+from .snapshot import CitySnapshot
+
+DEFAULT_ORDER = "delay"
+SEARCH_LIMIT = 50
+SUGGEST_LIMIT = 8
+
+T = TypeVar("T")
+
+
+def _rationale(record: CityRecord) -> List[str]:
+    return [
+        f"Average delay of {record.avg_delay_minutes:.0f} minutes",
+        f"Peak speed around {record.avg_peak_speed_kmph:.0f} km/h",
+        f"Population ~{record.population_millions:.1f}M",
+    ]
+
+
+def score_city(record: CityRecord) -> Dict[str, Any]:
+    composite, bands = CityColumns.from_records([record]).scores()
+    return {"score": float(composite[0]), "priority": PRIORITY_BANDS[bands[0]], "rationale": _rationale(record)}
+
+
+def aggregate_home_metrics(records: List[CityRecord]) -> Dict[str, Any]:
+    columns = CityColumns.from_records(records)
+    return columns.home_metrics(columns.scores()[1])
+
+
+def record_to_payload(record: CityRecord, suitability: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    return {
+        "city": record.city,
+        "state": record.state,
+        "classification": record.classification,
+        "population_millions": record.population_millions,
+        "avg_peak_speed_kmph": record.avg_peak_speed_kmph,
+        "avg_delay_minutes": record.avg_delay_minutes,
+        "vehicle_mix": record.vehicle_mix,
+        "issues": record.issues,
+        "recommended_actions": record.recommended_actions,
+        "suitability": suitability or score_city(record),
+    }
+
+
+def _dumps(payload: Any) -> str:
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"))
+
+
+class _LazyRows(Sequence[T]):
+    """Per-record values made by ``build(number)`` on first access and kept."""
+
+    def __init__(self, size: int, build: Callable[[int], T]):
+        self._values: List[Optional[T]] = [None] * size
+        self._build = build
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __getitem__(self, number):
+        if isinstance(number, slice):
+            return [self[n] for n in range(*number.indices(len(self)))]
+        value = self._values[number]
+        if value is None:
+            # Two threads may both build a value; they are equal and either one is kept
+            value = self._values[number] = self._build(range(len(self))[number])
+        return value
+
+
+class CityCatalog:
+    def __init__(self, records: Iterable[CityRecord]):
+        if isinstance(records, CitySnapshot):
+            # A snapshot already holds the columns, so records are only built for the cities served
+            self.columns = records.columns()
+            self.records: Sequence[CityRecord] = _LazyRows(len(self.columns), self.columns.record)
+        else:
+            self.records = list(records)
+            self.columns = CityColumns.from_records(self.records)
+        size = len(self.columns)
+        city_keys = [normalize_key(city) for city in self.columns.city.values]
+        self.index: Dict[str, int] = {
+            city_keys[code]: number for number, code in enumerate(self.columns.city.codes.tolist())
+        }
+        composite, bands = self.columns.scores()
+        self._composite, self._bands = composite.tolist(), bands.tolist()
+        self.scores: Sequence[Dict[str, Any]] = _LazyRows(size, self._score)
+        self.payloads: Sequence[Dict[str, Any]] = _LazyRows(
+            size, lambda n: record_to_payload(self.records[n], self.scores[n])
+        )
+        self.payload_json: Sequence[str] = _LazyRows(size, lambda n: _dumps(self.payloads[n]))
+        self.orders: Dict[str, List[int]] = {}
+        # Place of each record in every order, for sorting search matches
+        self.ranks: Dict[str, List[int]] = {}
+        for name in SORT_ORDERS:
+            order = self.columns.order(name, composite)
+            rank = np.empty_like(order)
+            rank[order] = np.arange(order.size)
+            self.orders[name] = order.tolist()
+            self.ranks[name] = rank.tolist()
+        city, state, classification = self.columns.city, self.columns.state, self.columns.classification
+        self.search_index = SearchIndex(
+            [
+                (city.values[c], state.values[s], classification.values[k])
+                for c, s, k in zip(city.codes.tolist(), state.codes.tolist(), classification.codes.tolist())
+            ],
+            popularity=self.ranks[DEFAULT_ORDER],
+        )
+        self.home_metrics = self.columns.home_metrics(bands)
+        self.version = self._digest(composite, bands)
+        self._listings: Dict[str, str] = {}
+
+    def _score(self, number: int) -> Dict[str, Any]:
+        return {
+            "score": self._composite[number],
+            "priority": PRIORITY_BANDS[self._bands[number]],
+            "rationale": _rationale(self.records[number]),
+        }
+
+    def _digest(self, composite: np.ndarray, bands: np.ndarray) -> str:
+        # Payloads are made of the columns and scores alone, so hashing those changes exactly when a payload
+        # would, without building the payloads; lists and snapshots of the same rows give equal columns
+        columns = self.columns
+        digest = hashlib.sha256()
+        for column in (columns.city, columns.state, columns.classification):
+            digest.update(_dumps(column.values).encode("utf-8"))
+            digest.update(np.ascontiguousarray(column.codes, dtype="<i4").tobytes())
+        for array in (columns.population, columns.speed, columns.delay, columns.mix, composite):
+            digest.update(np.ascontiguousarray(array, dtype="<f8").tobytes())
+        digest.update(np.ascontiguousarray(bands, dtype="i1").tobytes())
+        digest.update(_dumps([columns.mix_keys, columns.issues, columns.recommended_actions]).encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    def lookup(self, slug: str) -> Optional[int]:
+        number = self.index.get(normalize_key(slug))
+        if number is None:
+            # allow matching on raw city names if slug not found
+            number = self.index.get(normalize_key(slug.replace("-", " ")))
+        return number
+
+    def search(self, query: str, order: Optional[str] = None) -> List[int]:
+        """Positions of records matching ``query``, best match first unless an ``order`` is given."""
+        if not query:
+            return self.orders[order or DEFAULT_ORDER]
+        matches = [number for number, _ in self.search_index.search(query, SEARCH_LIMIT)]
+        if order:
+            matches.sort(key=self.ranks[order].__getitem__)
+        return matches
+
+    def suggest_json(self, prefix: str, limit: int = SUGGEST_LIMIT) -> str:
+        city, state = self.columns.city, self.columns.state
+        items = [
+            {"city": city[n], "state": state[n], "slug": normalize_key(city[n])}
+            for n in self.search_index.complete(prefix, limit)
+        ]
+        return _dumps({"items": items})
+
+    def listing_json(self, positions: Sequence[int], cache_as: Optional[str] = None) -> str:
+        """Body of an ``/api/cities`` response; whole-dataset listings are kept per sort order."""
+        if cache_as is not None and cache_as in self._listings:
+            return self._listings[cache_as]
+        body = f'{{"count":{len(positions)},"items":[{",".join(self.payload_json[n] for n in positions)}]}}'
+        if cache_as is not None:
+            self._listings[cache_as] = body
+        return body
+
+    def etag(self, *parts: Any) -> str:
+        """Tag for a response derived from this dataset version and the request ``parts``."""
+        request_hash = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:12]
+        return f"{self.version}-{request_hash}"
@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 import json
+import os
 import pathlib
+import tempfile
 from dataclasses import dataclass
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Sequence
 
 BASE_DIR = pathlib.Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
@@ -38,15 +40,21 @@ class CityRecord:
         )
 
 
-def load_city_records(data_path: pathlib.Path | None = None) -> List[CityRecord]:
+def load_city_records(data_path: pathlib.Path | None = None) -> Sequence[CityRecord]:
+    """Records from ``data_path`` (or the latest/sample data); a binary snapshot is returned as a
+    lazily read :class:`~data_pipeline.snapshot.CitySnapshot` instead of a list."""
+    from .snapshot import SNAPSHOT_SUFFIX, read_snapshot  # the snapshot module builds on this one
+
     candidate_paths = []
     if data_path:
-        candidate_paths.append(data_path)
+        candidate_paths.append(pathlib.Path(data_path))
     else:
         candidate_paths.extend([LATEST_DATA_FILE, DATA_FILE])
 
     for path in candidate_paths:
         if path and path.exists():
+            if path.suffix == SNAPSHOT_SUFFIX:
+                return read_snapshot(path)
             with path.open("r", encoding="utf-8") as handle:
                 payload = json.load(handle)
             return [CityRecord.from_dict(item) for item in payload]
@@ -62,10 +70,24 @@ def normalize_key(value: str) -> str:
     return value.strip().lower().replace(" ", "-")
 
 
+def write_json_atomic(path: pathlib.Path, payload: Any, indent: int | None = None) -> None:
+    """Write ``payload`` to a temporary file beside ``path`` and rename it into place, so readers
+    see the old file or the new one, never a partial write."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    handle = tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=path.parent, prefix=f".{path.name}.", delete=False)
+    try:
+        with handle:
+            json.dump(payload, handle, ensure_ascii=False, indent=indent)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(handle.name, path)
+    except BaseException:
+        os.unlink(handle.name)
+        raise
+
+
 def write_city_records(records: List[CityRecord], path: pathlib.Path | None = None) -> None:
     target = path or LATEST_DATA_FILE
-    target.parent.mkdir(parents=True, exist_ok=True)
     serialisable = [record.__dict__ for record in records]
-    with target.open("w", encoding="utf-8") as handle:
-        json.dump(serialisable, handle, ensure_ascii=False, indent=2)
+    write_json_atomic(target, serialisable, indent=2)
 
@@ -1,28 +1,46 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import logging
 import os
+import pathlib
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from dataclasses import asdict
 from datetime import datetime
-from typing import Dict, Iterable, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from .loader import (
     DATA_FILE,
+    LATEST_DATA_FILE,
     CityRecord,
     build_index,
     load_city_records,
     normalize_key,
     write_city_records,
+    write_json_atomic,
 )
+from .snapshot import SNAPSHOT_SUFFIX, write_snapshot
 
 LOGGER = logging.getLogger(__name__)
 
 DATA_GOV_IN_API_BASE = "https://api.data.gov.in/resource/"
 DATA_GOV_IN_DEFAULT_LIMIT = 200
 
+FETCH_WORKERS = int(os.getenv("DATA_REFRESH_WORKERS", "4"))
+FETCH_RATE_LIMIT = float(os.getenv("DATA_REFRESH_RATE_LIMIT", "5"))  # requests per second per host
+FETCH_TIMEOUT = 15
+FETCH_RETRIES = 3
+FETCH_BACKOFF = 0.5
+FETCH_MAX_PAGES = 50  # per source
+
 # Configuration for potential public datasets. These IDs can be swapped with
 # production-ready resources when credentials are available.
 DATA_GOV_IN_SOURCES: List[Dict[str, str]] = [
@@ -85,84 +103,279 @@ def _normalise_city_record(payload: Dict[str, object]) -> Optional[CityRecord]:
     )
 
 
-def _fetch_data_gov_in_dataset(config: Dict[str, str]) -> List[CityRecord]:
-    api_key = os.getenv("DATA_GOV_IN_API_KEY")
-    if not api_key:
-        LOGGER.info("DATA_GOV_IN_API_KEY not set; skipping %s", config["name"])
-        return []
+class HostRateLimiter:
+    """Spaces out requests to each host so that it sees at most ``per_second`` of them."""
+
+    def __init__(self, per_second: float):
+        self.interval = 1.0 / per_second if per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot: Dict[str, float] = {}
+
+    def wait(self, url: str) -> None:
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _build_session(pool_size: int) -> requests.Session:
+    # Connections are kept alive per host; transient failures and 429s are retried with backoff
+    retry = Retry(
+        total=FETCH_RETRIES,
+        backoff_factor=FETCH_BACKOFF,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _map_source_record(config: Dict[str, str], item: Dict[str, object]) -> Optional[CityRecord]:
+    mapped_payload = {
+        "city": item.get(config.get("city_field", "city"), ""),
+        "state": item.get(config.get("state_field", "state"), ""),
+        "classification": item.get(config.get("classification_field", "classification"), ""),
+        "population_millions": item.get(config.get("population_field", "population_millions"), 0),
+        "avg_peak_speed_kmph": item.get(config.get("speed_field", "avg_speed_kmph"), 0),
+        "avg_delay_minutes": item.get(config.get("delay_field", "avg_delay_minutes"), 0),
+        "key_issues": item.get(config.get("issues_field", "key_issues"), []),
+        "recommended_actions": item.get(config.get("actions_field", "recommended_actions"), []),
+    }
+    return _normalise_city_record(mapped_payload)
 
-    resource_id = config["resource_id"]
+
+def _page_key(config: Dict[str, str], offset: int) -> str:
+    return f"{config['resource_id']}@{offset}"
+
+
+def _fetch_page(
+    session: requests.Session,
+    limiter: HostRateLimiter,
+    config: Dict[str, str],
+    api_key: str,
+    offset: int,
+    cached: Optional[Dict[str, object]] = None,
+) -> Tuple[Dict[str, object], bool]:
+    """One page of a source as a cache entry, and whether the server answered that ``cached`` is current.
+
+    The entry holds the page's normalised records, the number of raw items on
+    it, the source's total if reported and the validators to send next time.
+    """
+    url = f"{config.get('base_url', DATA_GOV_IN_API_BASE)}{config['resource_id']}"
     params = {
         "api-key": api_key,
         "format": "json",
         "limit": str(DATA_GOV_IN_DEFAULT_LIMIT),
+        "offset": str(offset),
+    }
+    headers = {}
+    if cached and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached and cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+    limiter.wait(url)
+    response = session.get(url, params=params, headers=headers, timeout=FETCH_TIMEOUT)
+    if response.status_code == 304 and cached:
+        return cached, True
+    response.raise_for_status()
+    data = response.json()
+
+    items = data.get("records", [])
+    records = [record for record in (_map_source_record(config, item) for item in items) if record]
+    total = data.get("total")
+    entry = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "count": len(items),
+        "total": int(_safe_float(total)) if total is not None else None,
+        "records": [asdict(record) for record in records],
+    }
+    return entry, False
+
+
+def fetch_source_records(
+    sources: Sequence[Dict[str, str]],
+    workers: int = FETCH_WORKERS,
+    rate_limit: float = FETCH_RATE_LIMIT,
+    cache: Optional[Dict[str, Dict[str, object]]] = None,
+) -> Iterator[Tuple[int, int, List[CityRecord], str]]:
+    """Yield ``(source index, page offset, records, status)`` for every page of every source as it arrives.
+
+    Pages are fetched concurrently over one pooled session.  Once a source's
+    first page reports its total the remaining pages are requested together;
+    a source without a total is paged through until a short page.  Pages in
+    ``cache`` (keyed by :func:`_page_key`) are requested conditionally and
+    the cache is updated with what comes back.  ``status`` is ``fetched``,
+    ``not_modified``, or ``cached`` for a page that failed after retries and
+    was served from the cache; a failed page that was never cached is logged
+    and skipped.
+    """
+    api_key = os.getenv("DATA_GOV_IN_API_KEY")
+    if not api_key:
+        for source in sources:
+            LOGGER.info("DATA_GOV_IN_API_KEY not set; skipping %s", source["name"])
+        return
+
+    cache = {} if cache is None else cache
+    page_size = DATA_GOV_IN_DEFAULT_LIMIT
+    limiter = HostRateLimiter(rate_limit)
+    with _build_session(workers) as session, ThreadPoolExecutor(workers, thread_name_prefix="refresh") as executor:
+        pending: Dict[Future, Tuple[int, int]] = {}
+
+        def submit(number: int, offset: int) -> None:
+            cached = cache.get(_page_key(sources[number], offset))
+            future = executor.submit(_fetch_page, session, limiter, sources[number], api_key, offset, cached)
+            pending[future] = (number, offset)
+
+        for number in range(len(sources)):
+            submit(number, 0)
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    number, offset = pending.pop(future)
+                    key = _page_key(sources[number], offset)
+                    try:
+                        entry, not_modified = future.result()
+                        status = "not_modified" if not_modified else "fetched"
+                    except Exception as exc:  # broad catch so we can continue gracefully
+                        LOGGER.warning("Failed to pull %s at offset %d: %s", sources[number]["name"], offset, exc)
+                        if key not in cache:
+                            continue
+                        entry, status = cache[key], "cached"
+                    cache[key] = entry
+
+                    total, last_offset = entry["total"], (FETCH_MAX_PAGES - 1) * page_size
+                    if total is not None:
+                        if offset == 0:
+                            for next_offset in range(page_size, min(total, last_offset + 1), page_size):
+                                submit(number, next_offset)
+                    elif entry["count"] >= page_size and offset < last_offset:
+                        submit(number, offset + page_size)
+                    yield number, offset, [CityRecord.from_dict(item) for item in entry["records"]], status
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def record_digest(record: CityRecord) -> str:
+    """Hash of a normalised record's content, independent of key order."""
+    return hashlib.sha1(json.dumps(asdict(record), sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def diff_records(previous: Iterable[CityRecord], current: Iterable[CityRecord]) -> Dict[str, object]:
+    """Cities added, removed and changed between two versions of the dataset, by record hash."""
+    before = {normalize_key(record.city): (record.city, record_digest(record)) for record in previous}
+    after = {normalize_key(record.city): (record.city, record_digest(record)) for record in current}
+    return {
+        "added": [after[key][0] for key in after if key not in before],
+        "removed": [before[key][0] for key in before if key not in after],
+        "changed": [after[key][0] for key in after if key in before and before[key][1] != after[key][1]],
+        "unchanged": sum(1 for key in after if key in before and before[key][1] == after[key][1]),
     }
 
-    url = f"{DATA_GOV_IN_API_BASE}{resource_id}"
-    try:
-        response = requests.get(url, params=params, timeout=15)
-        response.raise_for_status()
-        data = response.json()
-    except Exception as exc:  # broad catch so we can continue gracefully
-        LOGGER.warning("Failed to pull %s: %s", config["name"], exc)
-        return []
-
-    records = []
-    for item in data.get("records", []):
-        mapped_payload = {
-            "city": item.get(config.get("city_field", "city"), ""),
-            "state": item.get(config.get("state_field", "state"), ""),
-            "classification": item.get(config.get("classification_field", "classification"), ""),
-            "population_millions": item.get(config.get("population_field", "population_millions"), 0),
-            "avg_peak_speed_kmph": item.get(config.get("speed_field", "avg_speed_kmph"), 0),
-            "avg_delay_minutes": item.get(config.get("delay_field", "avg_delay_minutes"), 0),
-            "key_issues": item.get(config.get("issues_field", "key_issues"), []),
-            "recommended_actions": item.get(config.get("actions_field", "recommended_actions"), []),
-        }
-        record = _normalise_city_record(mapped_payload)
-        if record:
-            records.append(record)
-
-    LOGGER.info("Fetched %d records from %s", len(records), config["name"])
-    return records
-
-
-def _merge_records(primary: List[CityRecord], supplements: Iterable[CityRecord]) -> List[CityRecord]:
-    merged = build_index(primary)
-    for record in supplements:
-        key = normalize_key(record.city)
-        merged[key] = record
-    return list(merged.values())
-
-
-def refresh_city_dataset(include_baseline: bool = True, write_file: bool = True) -> Dict[str, object]:
-    baseline: List[CityRecord] = load_city_records(DATA_FILE if include_baseline else None)
-    merged_records = list(baseline)
-    source_counts: Dict[str, int] = {}
 
-    for source in DATA_GOV_IN_SOURCES:
-        results = _fetch_data_gov_in_dataset(source)
-        if results:
-            merged_records = _merge_records(merged_records, results)
-        source_counts[source["name"]] = len(results)
+def _page_cache_path(output: pathlib.Path) -> pathlib.Path:
+    return output.with_name(f"{output.stem}.pages.json")
 
-    if write_file:
-        write_city_records(merged_records)
+
+def _load_page_cache(path: pathlib.Path) -> Dict[str, Dict[str, object]]:
+    try:
+        with path.open("r", encoding="utf-8") as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def refresh_city_dataset(
+    include_baseline: bool = True,
+    write_file: bool = True,
+    sources: Optional[Sequence[Dict[str, str]]] = None,
+    workers: int = FETCH_WORKERS,
+    output: Optional[pathlib.Path] = None,
+) -> Dict[str, object]:
+    """Merge the baseline with every source and rewrite ``output`` only if the result differs from it.
+
+    Validators and records of each fetched page are kept next to ``output``,
+    so a refresh in which no source changed costs one 304 per page and no
+    write.
+    """
+    sources = DATA_GOV_IN_SOURCES if sources is None else sources
+    output = output or LATEST_DATA_FILE
+    cache_path = _page_cache_path(output)
+    cache = _load_page_cache(cache_path)
+
+    baseline: List[CityRecord] = load_city_records(DATA_FILE if include_baseline else None)
+    merged = build_index(baseline)
+    # Pages arrive in any order, so a city goes to the latest source (and page) listing it, as
+    # if the sources had been fetched one after another, and is placed where it was first listed
+    precedence: Dict[str, Tuple[int, int]] = {key: (-1, 0) for key in merged}
+    placement: Dict[str, Tuple[int, int, int]] = {key: (-1, 0, n) for n, key in enumerate(merged)}
+    source_counts: Dict[str, int] = {source["name"]: 0 for source in sources}
+    page_counts: Dict[str, int] = {"fetched": 0, "not_modified": 0, "cached": 0}
+    pages_seen = set()
+
+    for number, offset, records, status in fetch_source_records(sources, workers, cache=cache):
+        for position, record in enumerate(records):
+            key = normalize_key(record.city)
+            if precedence.get(key, (-1, 0)) <= (number, offset):
+                merged[key] = record
+                precedence[key] = (number, offset)
+            placement[key] = min(placement.get(key, (number, offset, position)), (number, offset, position))
+        source_counts[sources[number]["name"]] += len(records)
+        page_counts[status] += 1
+        pages_seen.add(_page_key(sources[number], offset))
+
+    for name, count in source_counts.items():
+        LOGGER.info("Fetched %d records from %s", count, name)
+    merged_records = [merged[key] for key in sorted(merged, key=placement.__getitem__)]
+
+    previous = load_city_records(output) if output.exists() else []
+    changes = diff_records(previous, merged_records)
+    unchanged = [record_digest(record) for record in previous] == [record_digest(record) for record in merged_records]
+    written = write_file and not unchanged
+    if written:
+        write_city_records(merged_records, output)
+    if write_file and (page_counts["fetched"] or pages_seen != set(cache)):
+        write_json_atomic(cache_path, {key: cache[key] for key in pages_seen})
 
     snapshot = {
+        "written": written,
         "written_records": len(merged_records),
         "source_counts": source_counts,
+        "pages": page_counts,
+        "changes": changes,
         "timestamp": datetime.utcnow().isoformat() + "Z",
     }
 
-    LOGGER.info("City dataset refresh summary: %s", snapshot)
+    LOGGER.info(
+        "City dataset refresh: %d added, %d removed, %d changed, %d unchanged%s",
+        len(changes["added"]),
+        len(changes["removed"]),
+        len(changes["changed"]),
+        changes["unchanged"],
+        "" if written else "; file left as is",
+    )
     return snapshot
 
 
 def save_snapshot(path: os.PathLike[str]) -> None:
+    """Save the current dataset, as a binary snapshot if ``path`` ends in ``.citysnap`` and as JSON otherwise."""
+    path = pathlib.Path(path)
     records = load_city_records()
-    with open(path, "w", encoding="utf-8") as handle:
-        json.dump([asdict(record) for record in records], handle, ensure_ascii=False, indent=2)
+    if path.suffix == SNAPSHOT_SUFFIX:
+        write_snapshot(records, path)
+    else:
+        write_json_atomic(path, [asdict(record) for record in records], indent=2)
 
 
 if __name__ == "__main__":
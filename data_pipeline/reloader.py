@@ -0,0 +1,103 @@
+"""Background reloading of the city dataset without restarting the web app.
+
+A daemon thread polls the dataset file's size and modification time.  When
+they change it loads the records and builds a new catalog on its own thread,
+then publishes it by replacing a single reference, so a request sees either
+the old or the new dataset in full and never waits for a rebuild.  A file
+that fails to parse (for instance one caught half-written) leaves the
+current dataset in place and is retried on the next poll.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import pathlib
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional, Tuple
+
+from .catalog import CityCatalog
+from .loader import LATEST_DATA_FILE, CityRecord, load_city_records
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class DatasetVersion:
+    number: int
+    catalog: CityCatalog
+    loaded_at: float
+    source: Optional[str]
+
+
+class DatasetReloader:
+    def __init__(
+        self,
+        path: pathlib.Path = LATEST_DATA_FILE,
+        interval: float = 5.0,
+        build: Callable[[Iterable[CityRecord]], CityCatalog] = CityCatalog,
+    ):
+        self.path = pathlib.Path(path)
+        self.interval = interval
+        self.build = build
+        self._signature = self._stat()
+        # The default file falls back to the bundled sample until a refresh has written it
+        initial = load_city_records(None if self.path == LATEST_DATA_FILE else self.path)
+        self._current = DatasetVersion(1, build(initial), time.time(), self._source())
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def current(self) -> DatasetVersion:
+        return self._current
+
+    @property
+    def catalog(self) -> CityCatalog:
+        return self._current.catalog
+
+    def start(self) -> "DatasetReloader":
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(name="city-dataset-reloader", target=self._watch, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def check(self) -> bool:
+        """Reload if the file changed since the last look; True when a new version was published."""
+        signature = self._stat()
+        if signature == self._signature or signature is None:
+            return False
+        try:
+            catalog = self.build(load_city_records(self.path))
+        except (OSError, ValueError, TypeError) as exc:
+            LOGGER.warning("Keeping city dataset v%d, could not load %s: %s", self._current.number, self.path, exc)
+            return False
+        self._signature = signature
+        if catalog.version == self._current.catalog.version:
+            return False
+        self._current = DatasetVersion(self._current.number + 1, catalog, time.time(), str(self.path))
+        LOGGER.info("City dataset v%d loaded from %s (%d records)", self._current.number, self.path, len(catalog))
+        return True
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:  # keep watching whatever a single reload does
+                LOGGER.exception("City dataset reload failed")
+
+    def _stat(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _source(self) -> Optional[str]:
+        return str(self.path) if self._signature is not None else None
@@ -0,0 +1,238 @@
+"""In-memory search over city, state and classification, built once per dataset.
+
+Every field is split into lower-case words.  A prefix trie over the words
+answers prefix matches and autocomplete.  A trigram index finds the words
+sharing trigrams with a query word, which are kept if they contain it
+(``bad`` finds Hyderabad), are similar enough by trigram overlap, or are
+within a small edit distance (``hydrabad``, ``pnue``), so no record is
+scanned.  Each query word is matched exactly, as a prefix, as an infix or
+fuzzily, weighted by the field it matched in; a record must match every
+query word and is ranked by the sum.
+
+The query word expected to match the fewest words is looked up first; once
+its records are fewer than another word's candidate words, that word is
+scored against those records' own words instead of through the index.
+Words shorter than three letters are matched by prefix only, expanded to the
+:data:`PREFIX_EXPANSION` words of the most popular records.
+"""
+from __future__ import annotations
+
+import heapq
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+FIELD_WEIGHTS: Tuple[float, ...] = (3.0, 1.5, 1.0)  # city, state, classification
+EXACT, PREFIX, INFIX = 1.0, 0.8, 0.6
+MIN_SIMILARITY = 0.3
+MIN_FUZZY_LENGTH = 3
+PREFIX_EXPANSION = 256
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def words(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+
+def trigrams(word: str) -> Set[str]:
+    padded = f"  {word} "
+    return {padded[k : k + 3] for k in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance (adjacent swaps count once), or ``limit + 1`` past ``limit``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if before is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+def typo_limit(word: str) -> int:
+    return 1 if len(word) <= 5 else 2
+
+
+class SearchIndex:
+    def __init__(self, documents: Sequence[Sequence[str]], popularity: Optional[Sequence[int]] = None):
+        """``documents`` holds each record's fields in :data:`FIELD_WEIGHTS` order; ``popularity``
+        is a rank per record (lower first) used to order autocomplete suggestions and break ties."""
+        self.size = len(documents)
+        self.popularity = list(popularity) if popularity is not None else list(range(self.size))
+        self.words: List[str] = []
+        # word id -> {record: weight of the best field containing the word}
+        self.postings: List[Dict[int, float]] = []
+        word_ids: Dict[str, int] = {}
+        for record, fields in enumerate(documents):
+            for field, text in enumerate(fields):
+                weight = FIELD_WEIGHTS[min(field, len(FIELD_WEIGHTS) - 1)]
+                for word in words(text):
+                    if word not in word_ids:
+                        word_ids[word] = len(self.words)
+                        self.words.append(word)
+                        self.postings.append({})
+                    posting = self.postings[word_ids[word]]
+                    posting[record] = max(posting.get(record, 0.0), weight)
+        self._word_ids = word_ids
+        self._record_words: List[List[int]] = [[] for _ in range(self.size)]
+        for word_id, posting in enumerate(self.postings):
+            for record in posting:
+                self._record_words[record].append(word_id)
+
+        # Trie node: child characters plus "" -> ids of every word below the node, those of the most
+        # popular records first so that short prefixes can be cut off
+        best = [min(map(self.popularity.__getitem__, posting)) for posting in self.postings]
+        self._trie: Dict[str, dict] = {"": []}
+        for word_id in sorted(range(len(self.words)), key=best.__getitem__):
+            word = self.words[word_id]
+            node = self._trie
+            node[""].append(word_id)
+            for char in word:
+                node = node.setdefault(char, {"": []})
+                node[""].append(word_id)
+
+        self._trigrams: Dict[str, List[int]] = {}
+        for word_id, word in enumerate(self.words):
+            for gram in trigrams(word):
+                self._trigrams.setdefault(gram, []).append(word_id)
+
+        # Records whose city (first field) starts with each word, for autocomplete
+        self._city_words: List[Set[int]] = [set() for _ in self.words]
+        for record, fields in enumerate(documents):
+            for word in words(fields[0]) if fields else ():
+                self._city_words[word_ids[word]].add(record)
+
+    def _prefixed(self, prefix: str) -> List[int]:
+        node = self._trie
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+        return node[""]
+
+    def _expanded(self, prefix: str, bounded: bool = True) -> List[int]:
+        prefixed = self._prefixed(prefix)
+        return prefixed[:PREFIX_EXPANSION] if bounded and len(prefix) < MIN_FUZZY_LENGTH else prefixed
+
+    def _cost(self, query_word: str) -> int:
+        """Candidate words :meth:`match_word` would look at, without looking at them."""
+        cost = len(self._prefixed(query_word))
+        if len(query_word) >= MIN_FUZZY_LENGTH:
+            cost += sum(len(self._trigrams.get(gram, ())) for gram in trigrams(query_word))
+        return cost
+
+    def _fuzzy(self, query_word: str, grams: Set[str], word: str, count: int) -> float:
+        """Strength of ``word`` sharing ``count`` of the query word's trigrams ``grams``."""
+        if query_word in word:
+            return INFIX
+        strength = 0.0
+        similarity = count / (len(grams) + len(trigrams(word)) - count)
+        if similarity >= MIN_SIMILARITY and (count >= 2 or all(" " in gram for gram in grams)):
+            strength = similarity * INFIX
+        # Short words share few trigrams with their typos, so those are checked by edit distance
+        if len(query_word) >= 4:
+            limit = typo_limit(query_word)
+            distance = edit_distance(query_word, word, limit)
+            if distance <= limit:
+                strength = max(strength, (1.0 - distance / len(word)) * INFIX)
+        return strength
+
+    def match_word(self, query_word: str, bounded: bool = True) -> Dict[int, float]:
+        """Best score per record for one query word; ``bounded`` cuts off the expansion of short prefixes."""
+        strengths: Dict[int, float] = {}
+
+        def add(word_id: int, strength: float) -> None:
+            if strengths.get(word_id, 0.0) < strength:
+                strengths[word_id] = strength
+
+        exact = self._word_ids.get(query_word)
+        if exact is not None:
+            add(exact, EXACT)
+        for word_id in self._expanded(query_word, bounded):
+            add(word_id, PREFIX)
+
+        # Below three letters only words sharing the query's leading trigrams pass the similarity bar,
+        # and those are prefix matches already
+        if len(query_word) >= MIN_FUZZY_LENGTH:
+            grams = trigrams(query_word)
+            shared: Dict[int, int] = {}
+            for gram in grams:
+                for word_id in self._trigrams.get(gram, ()):
+                    shared[word_id] = shared.get(word_id, 0) + 1
+            for word_id, count in shared.items():
+                strength = self._fuzzy(query_word, grams, self.words[word_id], count)
+                if strength:
+                    add(word_id, strength)
+
+        scores: Dict[int, float] = {}
+        for word_id, strength in strengths.items():
+            for record, weight in self.postings[word_id].items():
+                score = strength * weight
+                if scores.get(record, 0.0) < score:
+                    scores[record] = score
+        return scores
+
+    def score_records(self, query_word: str, records: Iterable[int]) -> Dict[int, float]:
+        """:meth:`match_word` restricted to ``records``, checked against each record's own words."""
+        grams = trigrams(query_word)
+        strengths: Dict[int, float] = {}
+        scores: Dict[int, float] = {}
+        for record in records:
+            best = 0.0
+            for word_id in self._record_words[record]:
+                strength = strengths.get(word_id)
+                if strength is None:
+                    word = self.words[word_id]
+                    if word == query_word:
+                        strength = EXACT
+                    elif word.startswith(query_word):
+                        strength = PREFIX
+                    elif len(query_word) >= MIN_FUZZY_LENGTH:
+                        count = len(grams & trigrams(word))
+                        strength = self._fuzzy(query_word, grams, word, count) if count else 0.0
+                    else:
+                        strength = 0.0
+                    strengths[word_id] = strength
+                if strength:
+                    best = max(best, strength * self.postings[word_id][record])
+            if best:
+                scores[record] = best
+        return scores
+
+    def search(self, query: str, limit: int = 50) -> List[Tuple[int, float]]:
+        """(record, score) pairs matching every word of ``query``, best first."""
+        query_words = sorted(set(words(query)), key=self._cost)
+        if not query_words:
+            return []
+        # A single word only needs its best matches, so a short one may skip less popular words; with
+        # more words every record matching the first has to be kept for the intersection
+        totals = self.match_word(query_words[0], bounded=len(query_words) == 1)
+        for query_word in query_words[1:]:
+            if not totals:
+                return []
+            if len(totals) < self._cost(query_word):
+                scores = self.score_records(query_word, totals)
+            else:
+                scores = self.match_word(query_word, bounded=False)
+            totals = {record: total + scores[record] for record, total in totals.items() if record in scores}
+        return heapq.nsmallest(limit, totals.items(), key=lambda item: (-item[1], self.popularity[item[0]]))
+
+    def complete(self, prefix: str, limit: int = 8) -> List[int]:
+        """Records whose city has a word starting with ``prefix``, most popular first."""
+        prefix_words = words(prefix)
+        if not prefix_words:
+            return []
+        records: Set[int] = set()
+        for word_id in self._expanded(prefix_words[-1]):
+            records.update(self._city_words[word_id])
+        if len(prefix_words) > 1:
+            earlier = self.search(" ".join(prefix_words[:-1]), limit=self.size)
+            records &= {record for record, _ in earlier}
+        return heapq.nsmallest(limit, records, key=self.popularity.__getitem__)
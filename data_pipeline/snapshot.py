@@ -0,0 +1,210 @@
+"""Compact binary snapshot of the city dataset, read through a memory map.
+
+A snapshot stores the same columns as :class:`~data_pipeline.columns.CityColumns`:
+numeric fields as float64 arrays, the vehicle-mix matrix, city, state and
+classification as int32 codes into string tables, and issues and actions as
+flattened codes into a shared text table with per-record offsets.  Each string
+table is one UTF-8 blob plus byte offsets.
+
+The file starts with a magic string and a JSON header giving every array's
+dtype, shape and position; the arrays follow, 64-byte aligned and
+uncompressed, so opening a snapshot maps the file and parses only the header.
+Records are built on access, and the catalog takes the columns straight from
+the mapped arrays.  Snapshots are written to a temporary file and renamed into
+place, so a file that is still mapped by a reader is never modified.  JSON
+remains the import/export format; ``python -m data_pipeline.snapshot`` converts
+between the two.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import mmap
+import os
+import pathlib
+import tempfile
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .columns import CityColumns, StringColumn
+from .loader import CityRecord, load_city_records, write_city_records
+
+SNAPSHOT_MAGIC = b"CITYSNP1"
+SNAPSHOT_SUFFIX = ".citysnap"
+ALIGNMENT = 64
+STRING_TABLES: Tuple[str, ...] = ("city", "state", "classification")
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _string_table(values: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _ragged(rows: Sequence[Sequence[str]], table: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(row) for row in rows], out=offsets[1:])
+    codes = [table.setdefault(value, len(table)) for row in rows for value in row]
+    return np.asarray(codes, dtype=np.int32), offsets
+
+
+def write_snapshot(records: Iterable[CityRecord], path: pathlib.Path) -> None:
+    path = pathlib.Path(path)
+    records = records if isinstance(records, CitySnapshot) else list(records)
+    columns = records.columns() if isinstance(records, CitySnapshot) else CityColumns.from_records(records)
+    arrays: Dict[str, np.ndarray] = {
+        "population": columns.population,
+        "speed": columns.speed,
+        "delay": columns.delay,
+        "mix": columns.mix,
+    }
+    for name in STRING_TABLES:
+        column: StringColumn = getattr(columns, name)
+        arrays[f"{name}_codes"] = column.codes
+        arrays[f"{name}_blob"], arrays[f"{name}_offsets"] = _string_table(column.values)
+    text: Dict[str, int] = {}
+    arrays["issues_codes"], arrays["issues_offsets"] = _ragged(columns.issues, text)
+    arrays["actions_codes"], arrays["actions_offsets"] = _ragged(columns.recommended_actions, text)
+    arrays["text_blob"], arrays["text_offsets"] = _string_table(list(text))
+
+    layout: Dict[str, Dict[str, object]] = {}
+    position = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        arrays[name] = array
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": position}
+        position = _align(position + array.nbytes)
+    header = json.dumps({"rows": len(columns), "mix_keys": list(columns.mix_keys), "arrays": layout}).encode("utf-8")
+    data_start = _align(len(SNAPSHOT_MAGIC) + 8 + len(header))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    handle = tempfile.NamedTemporaryFile("wb", dir=path.parent, prefix=f".{path.name}.", delete=False)
+    try:
+        with handle:
+            handle.write(SNAPSHOT_MAGIC + len(header).to_bytes(8, "little") + header)
+            for name, array in arrays.items():
+                handle.seek(data_start + layout[name]["offset"])
+                handle.write(array.tobytes())
+            handle.truncate(data_start + position)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(handle.name, path)
+    except BaseException:
+        os.unlink(handle.name)
+        raise
+
+
+class CitySnapshot(Sequence[CityRecord]):
+    """Read-only records of a snapshot file, backed by a memory map."""
+
+    def __init__(self, path: pathlib.Path):
+        self.path = pathlib.Path(path)
+        with self.path.open("rb") as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[: len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError(f"{self.path} is not a city snapshot")
+        start = len(SNAPSHOT_MAGIC) + 8
+        header_length = int.from_bytes(self._map[len(SNAPSHOT_MAGIC) : start], "little")
+        header = json.loads(self._map[start : start + header_length].decode("utf-8"))
+        data_start = _align(start + header_length)
+
+        self.rows: int = header["rows"]
+        self.mix_keys: Tuple[str, ...] = tuple(header["mix_keys"])
+        self.arrays: Dict[str, np.ndarray] = {}
+        for name, spec in header["arrays"].items():
+            dtype, shape = np.dtype(spec["dtype"]), tuple(spec["shape"])
+            count = int(np.prod(shape)) if shape else 1
+            array = np.frombuffer(self._map, dtype=dtype, count=count, offset=data_start + spec["offset"])
+            self.arrays[name] = array.reshape(shape)
+        self._tables: Dict[str, List[str]] = {}
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def __getitem__(self, number: Union[int, slice]) -> Union[CityRecord, List[CityRecord]]:
+        if isinstance(number, slice):
+            return [self[n] for n in range(*number.indices(self.rows))]
+        if not -self.rows <= number < self.rows:
+            raise IndexError("snapshot record out of range")
+        number %= self.rows
+        row = self.arrays["mix"][number]
+        return CityRecord(
+            city=self._string("city", self.arrays["city_codes"][number]),
+            state=self._string("state", self.arrays["state_codes"][number]),
+            classification=self._string("classification", self.arrays["classification_codes"][number]),
+            population_millions=float(self.arrays["population"][number]),
+            avg_peak_speed_kmph=float(self.arrays["speed"][number]),
+            avg_delay_minutes=float(self.arrays["delay"][number]),
+            vehicle_mix={key: float(row[k]) for k, key in enumerate(self.mix_keys) if not np.isnan(row[k])},
+            issues=self._texts("issues", number),
+            recommended_actions=self._texts("actions", number),
+        )
+
+    def _string(self, table: str, code: int) -> str:
+        if table in self._tables:
+            return self._tables[table][code]
+        offsets = self.arrays[f"{table}_offsets"]
+        return self.arrays[f"{table}_blob"][offsets[code] : offsets[code + 1]].tobytes().decode("utf-8")
+
+    def _texts(self, field: str, number: int) -> List[str]:
+        offsets = self.arrays[f"{field}_offsets"]
+        codes = self.arrays[f"{field}_codes"][offsets[number] : offsets[number + 1]]
+        return [self._string("text", code) for code in codes.tolist()]
+
+    def table(self, name: str) -> List[str]:
+        """Every string of table ``name``, decoded once and kept."""
+        if name not in self._tables:
+            raw, offsets = self.arrays[f"{name}_blob"].tobytes(), self.arrays[f"{name}_offsets"].tolist()
+            self._tables[name] = [raw[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+        return self._tables[name]
+
+    def columns(self) -> CityColumns:
+        """The dataset as :class:`CityColumns`; numeric columns are views of the mapped file."""
+        text = self.table("text")
+
+        def ragged(field: str) -> List[List[str]]:
+            offsets = self.arrays[f"{field}_offsets"].tolist()
+            codes = self.arrays[f"{field}_codes"].tolist()
+            return [[text[code] for code in codes[start:end]] for start, end in zip(offsets, offsets[1:])]
+
+        return CityColumns(
+            city=StringColumn(codes=self.arrays["city_codes"], values=self.table("city")),
+            state=StringColumn(codes=self.arrays["state_codes"], values=self.table("state")),
+            classification=StringColumn(codes=self.arrays["classification_codes"], values=self.table("classification")),
+            population=self.arrays["population"],
+            speed=self.arrays["speed"],
+            delay=self.arrays["delay"],
+            mix_keys=self.mix_keys,
+            mix=self.arrays["mix"],
+            issues=ragged("issues"),
+            recommended_actions=ragged("actions"),
+        )
+
+
+def read_snapshot(path: pathlib.Path) -> CitySnapshot:
+    return CitySnapshot(path)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Convert city data between JSON and binary snapshots.")
+    parser.add_argument("source", type=pathlib.Path, help="JSON file or snapshot to read")
+    parser.add_argument("target", type=pathlib.Path, help=f"file to write, a snapshot if it ends in {SNAPSHOT_SUFFIX}")
+    args = parser.parse_args(argv)
+
+    records = load_city_records(args.source)
+    if args.target.suffix == SNAPSHOT_SUFFIX:
+        write_snapshot(records, args.target)
+    else:
+        write_city_records(list(records), args.target)
+    print(f"Wrote {len(records)} records to {args.target}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
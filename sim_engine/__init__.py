@@ -0,0 +1,14 @@
+"""Headless, array-backed simulation engine for the adaptive signal intersection."""
+from .config import DIRECTIONS, VEHICLE_CLASSES, SimConfig
+from .engine import Engine, EngineSnapshot
+from .policies import (
+    AdaptiveFormulaPolicy,
+    FixedTimePolicy,
+    LongestQueueFirstPolicy,
+    MaxPressurePolicy,
+    OldestWaitFirstPolicy,
+    PhaseDecision,
+    QueueView,
+    SignalPolicy,
+    make_policy,
+)
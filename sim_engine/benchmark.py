@@ -0,0 +1,241 @@
+"""Benchmark how fast the headless engine steps at fixed vehicle densities.
+
+Each scenario pre-fills the approaches with N queued vehicles and tops the
+road back up to N every frame, then times the signal-update, spawn, move and
+render phases separately.  ``--simulation SECONDS`` also runs ``simulation.py``
+itself on SDL's dummy video driver and reports its frame times, so the pygame
+simulation can be compared run over run as well.  Results are written as JSON:
+
+    python -m sim_engine.benchmark --densities 50 500 5000 --simulation 20 --output bench.json
+    python -m sim_engine.benchmark --simulation 20 --output new.json --baseline bench.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import pathlib
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .config import SimConfig
+from .engine import Engine
+
+PHASES = ("signals", "spawn", "move", "render")
+SIMULATION_SCRIPT = pathlib.Path(__file__).resolve().parent.parent / "simulation.py"
+
+
+def _load_renderer() -> Optional[Any]:
+    try:
+        from .render import SceneRenderer
+    except ImportError:  # pygame is optional for headless benchmarks
+        return None
+    return SceneRenderer()
+
+
+def _phase_calls(engine: Engine, density: int, renderer: Optional[Any]) -> Dict[str, Callable[[], Any]]:
+    fps = engine.config.frames_per_second
+    calls: Dict[str, Callable[[], Any]] = {
+        "signals": lambda: engine._update_signals() if engine.frame % fps == 0 else None,
+        "spawn": lambda: engine.populate(density),
+        "move": engine._move,
+    }
+    if renderer is not None:
+        calls["render"] = lambda: renderer.draw(engine)
+    return calls
+
+
+def _advance(engine: Engine) -> None:
+    engine.frame += 1
+    if engine.frame % engine.config.frames_per_second == 0:
+        engine.time_elapsed += 1
+
+
+def _scenario(density: int, seed: int) -> Engine:
+    # No clock-driven arrivals: the spawn phase keeps the road at `density` vehicles instead
+    config = SimConfig(sim_time=10**9, spawn_interval=float(10**9))
+    engine = Engine(config, seed=seed)
+    engine.spawn_clock = 0.0  # the clock starts full so the first frame would spawn; it never fills again
+    engine.populate(density)
+    return engine
+
+
+def run_scenario(density: int, steps: int, seed: int = 0, render: bool = True) -> Dict[str, Any]:
+    renderer = _load_renderer() if render else None
+    engine = _scenario(density, seed)
+    calls = _phase_calls(engine, density, renderer)
+    timings = {name: np.empty(steps) for name in calls}
+    updated = 0
+
+    started = time.perf_counter()
+    for step in range(steps):
+        for name, call in calls.items():
+            t0 = time.perf_counter()
+            call()
+            timings[name][step] = time.perf_counter() - t0
+        updated += int(engine.active[: engine.count].sum())
+        _advance(engine)
+    elapsed = time.perf_counter() - started
+
+    # Separate, shorter pass for memory: tracemalloc would distort the timings above
+    engine = _scenario(density, seed)
+    calls = _phase_calls(engine, density, renderer)
+    peaks = {name: 0 for name in calls}
+    tracemalloc.start()
+    try:
+        for _ in range(min(steps, 120)):
+            for name, call in calls.items():
+                tracemalloc.reset_peak()
+                before, _ = tracemalloc.get_traced_memory()
+                call()
+                _, peak = tracemalloc.get_traced_memory()
+                peaks[name] = max(peaks[name], peak - before)
+            _advance(engine)
+    finally:
+        tracemalloc.stop()
+
+    phases: Dict[str, Optional[Dict[str, float]]] = {}
+    for name in PHASES:
+        if name not in timings:
+            phases[name] = None
+            continue
+        samples_ms = timings[name] * 1000.0
+        phases[name] = {
+            "mean_ms": round(float(samples_ms.mean()), 4),
+            "p50_ms": round(float(np.percentile(samples_ms, 50)), 4),
+            "p95_ms": round(float(np.percentile(samples_ms, 95)), 4),
+            "p99_ms": round(float(np.percentile(samples_ms, 99)), 4),
+            "peak_kib": round(peaks[name] / 1024.0, 1),
+        }
+    step_ms = sum(timings.values()) * 1000.0
+    return {
+        "density": density,
+        "steps": steps,
+        "steps_per_sec": round(steps / elapsed, 1),
+        "vehicles_updated_per_sec": round(updated / elapsed, 1),
+        "step_p50_ms": round(float(np.percentile(step_ms, 50)), 4),
+        "step_p95_ms": round(float(np.percentile(step_ms, 95)), 4),
+        "step_p99_ms": round(float(np.percentile(step_ms, 99)), 4),
+        "phases": phases,
+    }
+
+
+def run_simulation(seconds: int, seed: int = 0) -> Dict[str, Any]:
+    """Run ``simulation.py`` headless for ``seconds`` and collect its FRAME_STATS and final SUMMARY line."""
+    env = dict(
+        os.environ,
+        SDL_VIDEODRIVER="dummy",
+        SIM_TIME=str(seconds),
+        SIM_SEED=str(seed),
+        SIM_FRAME_STATS="1",
+    )
+    completed = subprocess.run(
+        [sys.executable, str(SIMULATION_SCRIPT)],
+        cwd=SIMULATION_SCRIPT.parent,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=seconds + 60,
+    )
+    fields: Dict[str, Dict[str, str]] = {}
+    for line in completed.stdout.splitlines():
+        key, _, rest = line.partition(" ")
+        if key in ("FRAME_STATS", "SUMMARY"):
+            # other threads print too, so a line can carry unrelated words; keep the key=value pairs
+            fields[key] = dict(pair.split("=", 1) for pair in rest.split() if "=" in pair)
+    if "FRAME_STATS" not in fields:
+        raise RuntimeError(f"simulation.py exited with {completed.returncode}: {completed.stderr.strip()[-500:]}")
+
+    frames = fields["FRAME_STATS"]
+    return {
+        "seconds": seconds,
+        "frames": int(frames["frames"]),
+        "frames_per_sec": round(int(frames["frames"]) / seconds, 1),
+        "frame_mean_ms": float(frames["mean_ms"]),
+        "frame_p50_ms": float(frames["p50_ms"]),
+        "frame_p95_ms": float(frames["p95_ms"]),
+        "frame_p99_ms": float(frames["p99_ms"]),
+        "vehicles_crossed": int(fields.get("SUMMARY", {}).get("total", 0)),
+    }
+
+
+def run_benchmarks(
+    densities: Sequence[int],
+    steps: int,
+    seed: int = 0,
+    render: bool = True,
+    simulation_seconds: int = 0,
+) -> Dict[str, Any]:
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "seed": seed,
+        },
+        "results": [run_scenario(density, steps, seed=seed, render=render) for density in densities],
+        "simulation": run_simulation(simulation_seconds, seed=seed) if simulation_seconds > 0 else None,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    previous = {row["density"]: row for row in baseline.get("results", [])}
+    lines = []
+    for row in current["results"]:
+        old = previous.get(row["density"])
+        if not old:
+            continue
+        speedup = row["steps_per_sec"] / old["steps_per_sec"] if old["steps_per_sec"] else float("nan")
+        lines.append(
+            f"density={row['density']:>6}  steps/s {old['steps_per_sec']:>10} -> {row['steps_per_sec']:>10}"
+            f"  ({speedup:.2f}x)"
+        )
+    simulation, old = current.get("simulation"), baseline.get("simulation")
+    if simulation and old:
+        lines.append(
+            f"simulation.py  frame p50 {old['frame_p50_ms']} ms -> {simulation['frame_p50_ms']} ms"
+            f"  p95 {old['frame_p95_ms']} ms -> {simulation['frame_p95_ms']} ms"
+        )
+    return lines
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--densities", type=int, nargs="+", default=[50, 500, 5000])
+    parser.add_argument("--steps", type=int, default=600, help="frames per scenario")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-render", action="store_true", help="skip the pygame render phase")
+    parser.add_argument("--simulation", type=int, default=0, metavar="SECONDS",
+                        help="also time simulation.py headless for this many simulated seconds")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(
+        args.densities,
+        args.steps,
+        seed=args.seed,
+        render=not args.no_render,
+        simulation_seconds=args.simulation,
+    )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(text)
+    print(text)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as handle:
+            for line in compare(report, json.load(handle)):
+                print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""What-if branching: fork a running engine and play the branches out in worker processes."""
+from __future__ import annotations
+
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Dict, Optional
+
+from .engine import Engine, EngineSnapshot
+from .policies import SignalPolicy
+
+
+def run_branch(
+    payload: bytes,
+    seconds: int,
+    green_extension: int = 0,
+    policy: Optional[SignalPolicy] = None,
+) -> Dict[str, Any]:
+    engine = Engine.from_snapshot(EngineSnapshot.from_bytes(payload), policy=policy)
+    if green_extension:
+        engine.extend_green(green_extension)
+    engine.run_for(seconds)
+    return engine.summary()
+
+
+def compare_what_if(
+    engine: Engine,
+    seconds: int,
+    green_extension: int,
+    executor: Optional[Executor] = None,
+) -> Dict[str, Any]:
+    """Continue ``engine`` as-is and with its current green extended, side by side.
+
+    Both branches start from the same snapshot, including the random generator
+    state, so they see identical arrivals and differ only by the intervention.
+    """
+    payload = engine.snapshot().to_bytes()
+    owns_executor = executor is None
+    pool = executor or ProcessPoolExecutor(max_workers=2)
+    try:
+        baseline_future = pool.submit(run_branch, payload, seconds, 0, engine.policy)
+        branch_future = pool.submit(run_branch, payload, seconds, green_extension, engine.policy)
+        baseline = baseline_future.result()
+        branch = branch_future.result()
+    finally:
+        if owns_executor:
+            pool.shutdown()
+
+    delta = {
+        key: round(branch[key] - baseline[key], 3)
+        for key in ("total", "throughput", "average_wait", "p95_wait", "queued")
+    }
+    return {"baseline": baseline, "branch": branch, "delta": delta}
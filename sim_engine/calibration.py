@@ -0,0 +1,276 @@
+"""Fit pass times, speeds and arrival rates to logs from junction footage.
+
+Two logs are read:
+
+* detections, JSON lines with one frame of one approach camera each::
+
+      {"time": 12.48, "approach": "right", "detections": [<TFNet.return_predict() result>]}
+
+* crossings, CSV with a header row ``time,approach,label``: one row per
+  vehicle crossing the stop line.
+
+Pass times come from saturated discharge: consecutive crossings of an
+approach less than ``max_headway`` apart form a platoon, and
+``(no_of_lanes + 1) * duration = sum(count_c * pass_time_c)`` is solved by
+least squares over all platoons, as setTime() sizes a green.  Speeds are the
+least-squares slope of displacement against time for boxes matched between
+consecutive frames, and the arrival rate of an approach is the slope of
+vehicles crossed so far plus vehicles in view.  The result is a scenario file
+for ``SimConfig.from_scenario`` or ``SIM_SCENARIO=<file> python simulation.py``:
+
+    python -m sim_engine.calibration --detections junction.jsonl --crossings crossings.csv --output scenario.json
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+import numpy as np
+
+from .config import DIRECTIONS, VEHICLE_CLASSES, SimConfig
+
+LOGGER = logging.getLogger(__name__)
+
+# darkflow labels of the vehicle classes; anything else in a frame is ignored
+DETECTION_LABELS: Dict[str, str] = {
+    "car": "car",
+    "bus": "bus",
+    "truck": "truck",
+    "rickshaw": "rickshaw",
+    "bike": "bike",
+    "motorbike": "bike",
+    "bicycle": "bike",
+}
+
+
+@dataclass
+class DetectionLog:
+    """One row per detected vehicle box; ``frame`` numbers frames across the whole log."""
+
+    frame: np.ndarray
+    time: np.ndarray
+    approach: np.ndarray
+    vclass: np.ndarray
+    cx: np.ndarray
+    cy: np.ndarray
+    # time and approach of every frame, including frames with nothing detected
+    frame_time: np.ndarray
+    frame_approach: np.ndarray
+
+
+@dataclass
+class CrossingLog:
+    time: np.ndarray
+    approach: np.ndarray
+    vclass: np.ndarray
+
+
+def _class_index(label: str) -> int:
+    name = DETECTION_LABELS.get(str(label).lower())
+    return VEHICLE_CLASSES.index(name) if name else -1
+
+
+def read_detections(lines: Iterable[str]) -> DetectionLog:
+    frame, times, approach, vclass, cx, cy = [], [], [], [], [], []
+    frame_time, frame_approach = [], []
+    for line in lines:
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        number = len(frame_time)
+        direction = DIRECTIONS.index(entry["approach"])
+        frame_time.append(float(entry["time"]))
+        frame_approach.append(direction)
+        for box in entry.get("detections", ()):
+            index = _class_index(box["label"])
+            if index < 0:
+                continue
+            frame.append(number)
+            times.append(float(entry["time"]))
+            approach.append(direction)
+            vclass.append(index)
+            cx.append((box["topleft"]["x"] + box["bottomright"]["x"]) / 2.0)
+            cy.append((box["topleft"]["y"] + box["bottomright"]["y"]) / 2.0)
+    return DetectionLog(
+        frame=np.asarray(frame, dtype=np.int64),
+        time=np.asarray(times, dtype=np.float64),
+        approach=np.asarray(approach, dtype=np.int64),
+        vclass=np.asarray(vclass, dtype=np.int64),
+        cx=np.asarray(cx, dtype=np.float64),
+        cy=np.asarray(cy, dtype=np.float64),
+        frame_time=np.asarray(frame_time, dtype=np.float64),
+        frame_approach=np.asarray(frame_approach, dtype=np.int64),
+    )
+
+
+def read_crossings(rows: Iterable[Dict[str, str]]) -> CrossingLog:
+    times, approach, vclass = [], [], []
+    for row in rows:
+        index = _class_index(row["label"])
+        if index < 0:
+            continue
+        times.append(float(row["time"]))
+        approach.append(DIRECTIONS.index(row["approach"]))
+        vclass.append(index)
+    return CrossingLog(
+        time=np.asarray(times, dtype=np.float64),
+        approach=np.asarray(approach, dtype=np.int64),
+        vclass=np.asarray(vclass, dtype=np.int64),
+    )
+
+
+def fit_pass_times(
+    crossings: CrossingLog, no_of_lanes: int = 2, max_headway: float = 4.0
+) -> Dict[str, Any]:
+    order = np.lexsort((crossings.time, crossings.approach))
+    t, approach, vclass = crossings.time[order], crossings.approach[order], crossings.vclass[order]
+    if t.size < 2:
+        return {"pass_times": {}, "platoons": 0, "rmse": None}
+
+    headway = np.diff(t)
+    follows = (approach[1:] == approach[:-1]) & (headway <= max_headway)
+    platoon = np.concatenate([[0], np.cumsum(~follows)])
+    # Each headway is charged to the vehicle that closes it
+    rows, cols = platoon[1:][follows], vclass[1:][follows]
+    counts = np.zeros((platoon[-1] + 1, len(VEHICLE_CLASSES)))
+    np.add.at(counts, (rows, cols), 1)
+    work = np.bincount(rows, weights=headway[follows] * (no_of_lanes + 1), minlength=counts.shape[0])
+
+    used = counts.any(axis=1)
+    counts, work = counts[used], work[used]
+    observed = counts.any(axis=0)
+    if not observed.any():
+        return {"pass_times": {}, "platoons": 0, "rmse": None}
+    solution, *_ = np.linalg.lstsq(counts[:, observed], work, rcond=None)
+    residual = counts[:, observed] @ solution - work
+    fitted = dict(zip(np.asarray(VEHICLE_CLASSES)[observed].tolist(), np.maximum(solution, 0.1).round(3).tolist()))
+    return {
+        "pass_times": fitted,
+        "platoons": int(counts.shape[0]),
+        "samples": {VEHICLE_CLASSES[c]: int(n) for c, n in enumerate(counts.sum(axis=0)) if n},
+        "rmse": round(float(np.sqrt(np.mean(residual**2))), 4),
+    }
+
+
+def fit_speeds(
+    detections: DetectionLog,
+    frames_per_second: int = 60,
+    pixels_per_unit: float = 1.0,
+    max_jump: float = 80.0,
+    min_move: float = 2.0,
+) -> Dict[str, Any]:
+    """Match each box to the nearest same-class box in the next frame of its camera."""
+    displacement, elapsed, classes = [], [], []
+    starts = np.searchsorted(detections.frame, np.arange(detections.frame_time.size + 1))
+    for direction in range(len(DIRECTIONS)):
+        frames = np.flatnonzero(detections.frame_approach == direction)
+        for current, following in zip(frames[:-1], frames[1:]):
+            a = slice(starts[current], starts[current + 1])
+            b = slice(starts[following], starts[following + 1])
+            if a.start == a.stop or b.start == b.stop:
+                continue
+            dx = detections.cx[b][None, :] - detections.cx[a][:, None]
+            dy = detections.cy[b][None, :] - detections.cy[a][:, None]
+            distance = np.hypot(dx, dy)
+            distance[detections.vclass[a][:, None] != detections.vclass[b][None, :]] = np.inf
+            nearest = distance.argmin(axis=1)
+            step = distance[np.arange(nearest.size), nearest]
+            keep = (step <= max_jump) & (step >= min_move)
+            displacement.append(step[keep])
+            elapsed.append(np.full(int(keep.sum()), detections.frame_time[following] - detections.frame_time[current]))
+            classes.append(detections.vclass[a][keep])
+    if not displacement:
+        return {"speeds": {}, "samples": {}}
+
+    d, dt, vclass = np.concatenate(displacement), np.concatenate(elapsed), np.concatenate(classes)
+    # Least-squares slope through the origin per class: sum(d * dt) / sum(dt ** 2)
+    numerator = np.bincount(vclass, weights=d * dt, minlength=len(VEHICLE_CLASSES))
+    denominator = np.bincount(vclass, weights=dt * dt, minlength=len(VEHICLE_CLASSES))
+    samples = np.bincount(vclass, minlength=len(VEHICLE_CLASSES))
+    speeds = {}
+    for c, name in enumerate(VEHICLE_CLASSES):
+        if samples[c] and denominator[c] > 0:
+            per_second = numerator[c] / denominator[c] / pixels_per_unit
+            speeds[name] = round(float(per_second / frames_per_second), 4)
+    return {"speeds": speeds, "samples": {VEHICLE_CLASSES[c]: int(n) for c, n in enumerate(samples) if n}}
+
+
+def fit_arrival_rates(detections: DetectionLog, crossings: CrossingLog) -> Dict[str, Any]:
+    """Per approach, least-squares slope of (vehicles crossed so far + vehicles in view) over time."""
+    in_view = np.bincount(detections.frame, minlength=detections.frame_time.size)
+    rates: Dict[str, float] = {}
+    for direction, name in enumerate(DIRECTIONS):
+        frames = np.flatnonzero(detections.frame_approach == direction)
+        if frames.size < 2:
+            continue
+        t = detections.frame_time[frames]
+        crossed = np.sort(crossings.time[crossings.approach == direction])
+        arrived = np.searchsorted(crossed, t, side="right") + in_view[frames]
+        design = np.stack([t, np.ones_like(t)], axis=1)
+        (slope, _), *_ = np.linalg.lstsq(design, arrived.astype(np.float64), rcond=None)
+        rates[name] = round(max(float(slope), 0.0), 5)
+    return rates
+
+
+def calibrate(
+    detections: DetectionLog,
+    crossings: CrossingLog,
+    base: Optional[SimConfig] = None,
+    max_headway: float = 4.0,
+    pixels_per_unit: float = 1.0,
+) -> Dict[str, Any]:
+    """Scenario dict: fitted values merged into ``base`` under "config", fit diagnostics under "fit"."""
+    base = base or SimConfig()
+    pass_fit = fit_pass_times(crossings, base.no_of_lanes, max_headway)
+    speed_fit = fit_speeds(detections, base.frames_per_second, pixels_per_unit)
+    rates = fit_arrival_rates(detections, crossings)
+
+    config: Dict[str, Any] = {
+        "pass_times": {**base.pass_times, **pass_fit["pass_times"]},
+        "speeds": {**base.speeds, **speed_fit["speeds"]},
+    }
+    total_rate = sum(rates.values())
+    if total_rate > 0:
+        config["spawn_interval"] = round(1.0 / total_rate, 4)
+        config["direction_weights"] = [int(round(1000 * rates.get(name, 0.0) / total_rate)) for name in DIRECTIONS]
+    if crossings.vclass.size:
+        share = np.bincount(crossings.vclass, minlength=len(VEHICLE_CLASSES)) / crossings.vclass.size
+        config["class_weights"] = share.round(4).tolist()
+    return {
+        "config": config,
+        "fit": {
+            "pass_times": pass_fit,
+            "speeds": speed_fit,
+            "arrival_rates": rates,
+            "frames": int(detections.frame_time.size),
+            "crossings": int(crossings.time.size),
+        },
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Calibrate simulation parameters from detection logs")
+    parser.add_argument("--detections", required=True, help="JSON lines of per-frame return_predict() output")
+    parser.add_argument("--crossings", required=True, help="CSV of stop-line crossings: time,approach,label")
+    parser.add_argument("--output", required=True, help="scenario JSON to write")
+    parser.add_argument("--max-headway", type=float, default=4.0, help="largest gap, seconds, inside a platoon")
+    parser.add_argument("--pixels-per-unit", type=float, default=1.0, help="footage pixels per simulator pixel")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    with open(args.detections, "r", encoding="utf-8") as handle:
+        detections = read_detections(handle)
+    with open(args.crossings, "r", encoding="utf-8", newline="") as handle:
+        crossings = read_crossings(csv.DictReader(handle))
+    scenario = calibrate(detections, crossings, max_headway=args.max_headway, pixels_per_unit=args.pixels_per_unit)
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(scenario, handle, indent=2)
+    LOGGER.info("wrote %s from %d frames and %d crossings", args.output, detections.frame_time.size, crossings.time.size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Tunables and intersection geometry for the headless simulation engine.
+
+The values mirror the module-level constants in ``simulation.py`` so that a
+headless run behaves like the pygame simulation with the same settings.
+"""
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+DIRECTIONS: Tuple[str, ...] = ("right", "down", "left", "up")
+VEHICLE_CLASSES: Tuple[str, ...] = ("car", "bus", "truck", "rickshaw", "bike")
+LANES_PER_APPROACH = 3
+
+# Average times for vehicles to pass the intersection
+PASS_TIMES: Dict[str, float] = {"car": 2.0, "bus": 2.5, "truck": 2.5, "rickshaw": 2.25, "bike": 1.0}
+
+# Average speeds of vehicles in pixels per frame
+SPEEDS: Dict[str, float] = {"car": 1.575, "bus": 1.26, "truck": 1.26, "rickshaw": 1.4, "bike": 1.75}
+
+# Sprite footprint (length along the direction of travel, width across it) of images/<direction>/<class>.png
+VEHICLE_SIZES: Dict[str, Tuple[int, int]] = {
+    "car": (54, 22),
+    "bus": (76, 26),
+    "truck": (62, 26),
+    "rickshaw": (47, 32),
+    "bike": (38, 17),
+}
+
+# Each approach is modelled as a one-dimensional path.  Distances are measured
+# from the entry edge of the screen to the front of the vehicle and are derived
+# from stopLines, defaultStop and mid in simulation.py.
+APPROACHES: Dict[str, Dict[str, float]] = {
+    "right": {"stop": 580, "stop_line": 590, "mid": 705, "length": 1400},
+    "down": {"stop": 320, "stop_line": 330, "mid": 450, "length": 800},
+    "left": {"stop": 590, "stop_line": 600, "mid": 705, "length": 1400},
+    "up": {"stop": 255, "stop_line": 265, "mid": 400, "length": 800},
+}
+
+# (axis, origin, sign): the front of a vehicle sits at origin + sign * distance on axis
+APPROACH_AXES: Dict[str, Tuple[str, int, int]] = {
+    "right": ("x", 0, 1),
+    "down": ("y", 0, 1),
+    "left": ("x", 1400, -1),
+    "up": ("y", 800, -1),
+}
+
+# Lateral coordinate of each lane (the start coordinates x/y in simulation.py)
+LANE_OFFSETS: Dict[str, Tuple[int, int, int]] = {
+    "right": (348, 370, 398),
+    "down": (755, 727, 697),
+    "left": (498, 466, 436),
+    "up": (602, 627, 657),
+}
+
+# vehicle_mix keys in data/traffic_*.json for each vehicle class
+VEHICLE_MIX_KEYS: Dict[str, str] = {
+    "car": "car_pct",
+    "bus": "bus_pct",
+    "truck": "truck_pct",
+    "rickshaw": "auto_pct",
+    "bike": "two_wheeler_pct",
+}
+
+# Turning vehicles leave the junction heading this way
+TURN_DIRECTIONS: Dict[str, str] = {"right": "down", "down": "left", "left": "up", "up": "right"}
+
+
+def _env_int(name: str, fallback: int) -> int:
+    try:
+        return int(os.environ.get(name, str(fallback)))
+    except ValueError:
+        return fallback
+
+
+@dataclass
+class SimConfig:
+    default_red: int = 150
+    default_yellow: int = 5
+    default_green: int = 20
+    min_green: int = 10
+    max_green: int = 60
+    sim_time: int = 120
+    detection_time: int = 5
+    no_of_lanes: int = 2
+    pass_times: Dict[str, float] = field(default_factory=lambda: dict(PASS_TIMES))
+    speeds: Dict[str, float] = field(default_factory=lambda: dict(SPEEDS))
+    spawn_interval: float = 0.75
+    direction_weights: Tuple[int, ...] = (300, 300, 200, 200)
+    # Relative frequency of each class in VEHICLE_CLASSES order; None draws them uniformly like simulation.py
+    class_weights: Optional[Tuple[float, ...]] = None
+    turn_probability: float = 0.6
+    # The pygame loop is uncapped; this fixes how many movement frames make up one simulated second.
+    frames_per_second: int = 60
+    gap: float = 15.0
+    moving_gap: float = 15.0
+
+    @classmethod
+    def from_env(cls) -> "SimConfig":
+        # Same environment variables simulation.py honours
+        scenario = os.environ.get("SIM_SCENARIO")
+        config = cls.from_scenario(scenario) if scenario else cls()
+        config.min_green = _env_int("MIN_GREEN_TIME", config.min_green)
+        config.max_green = _env_int("MAX_GREEN_TIME", config.max_green)
+        config.sim_time = _env_int("SIM_TIME", config.sim_time)
+        return config
+
+    @classmethod
+    def from_scenario(cls, path: str) -> "SimConfig":
+        """Defaults overlaid with the ``config`` block of a scenario file (see sim_engine.calibration)."""
+        with open(path, "r", encoding="utf-8") as handle:
+            scenario = json.load(handle)
+        return cls.from_dict({**cls().to_dict(), **scenario.get("config", {})})
+
+    @classmethod
+    def from_dict(cls, payload: Dict[str, Any]) -> "SimConfig":
+        known = {name: payload[name] for name in cls.__dataclass_fields__ if name in payload}
+        for name in ("direction_weights", "class_weights"):
+            if known.get(name) is not None:
+                known[name] = tuple(known[name])
+        return cls(**known)
+
+    def to_dict(self) -> Dict[str, Any]:
+        payload = asdict(self)
+        payload["direction_weights"] = list(self.direction_weights)
+        if self.class_weights is not None:
+            payload["class_weights"] = list(self.class_weights)
+        return payload
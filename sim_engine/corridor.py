@@ -0,0 +1,304 @@
+"""Arterial corridor of junctions, each an engine, sharded across worker processes.
+
+Junction ``j`` sits between ``j - 1`` to the west and ``j + 1`` to the east.
+Eastbound (``right``) vehicles that go straight through a junction arrive on
+the ``right`` approach of the next one, westbound (``left``) vehicles on the
+``left`` approach of the previous one; turning and north/south traffic leaves
+the corridor.  Every junction keeps its own random side-street arrivals.
+
+Junctions are split into contiguous blocks, one per worker process.  The
+workers advance in lock-step one simulated second at a time and hand the
+vehicles crossing a block boundary to their neighbour through a
+:class:`BoundaryChannel` in shared memory.  A worker that fails aborts the
+barrier so its neighbours stop too, and the error is raised in the parent.
+
+    python -m sim_engine.corridor --junctions 24 --workers 4 --seconds 600 --offset 8
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing as mp
+import queue
+import threading
+import time
+import traceback
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .config import DIRECTIONS, SimConfig
+from .engine import Engine
+
+_EAST = DIRECTIONS.index("right")
+_WEST = DIRECTIONS.index("left")
+# Longest a worker waits for its neighbours to finish a simulated second
+BARRIER_TIMEOUT = 120.0
+
+
+class BoundaryChannel:
+    """Batch of (lane, class) records handed from one worker to the next each second.
+
+    Row 0 of the shared array holds the number of records in the batch and
+    the channel's capacity, which a process attaching by ``name`` reads back.
+    The lock-step barriers guarantee the producer only writes while the
+    consumer is not reading, so no further locking is needed.
+    """
+
+    def __init__(self, capacity: int = 4096, name: Optional[str] = None):
+        size = (capacity + 1) * 2 * np.dtype(np.int32).itemsize
+        self._shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self._owner = name is None
+        if not self._owner:
+            capacity = int(np.ndarray((2,), dtype=np.int32, buffer=self._shm.buf)[1])
+        self.capacity = capacity
+        self._array = np.ndarray((capacity + 1, 2), dtype=np.int32, buffer=self._shm.buf)
+        if self._owner:
+            self._array[0] = (0, capacity)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def send(self, records: np.ndarray) -> None:
+        count = len(records)
+        if count > self.capacity:
+            raise OverflowError(f"{count} boundary vehicles exceed channel capacity {self.capacity}")
+        self._array[1 : count + 1] = records
+        self._array[0, 0] = count
+
+    def receive(self) -> np.ndarray:
+        count = int(self._array[0, 0])
+        records = self._array[1 : count + 1].copy()
+        self._array[0, 0] = 0
+        return records
+
+    def close(self) -> None:
+        # Drop our view before closing, SharedMemory refuses while buffers are exported
+        del self._array
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+def partition(junctions: int, workers: int) -> List[range]:
+    bounds = np.linspace(0, junctions, min(workers, junctions) + 1).astype(int)
+    return [range(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def _through(engine: Engine, gone: np.ndarray, direction: int) -> np.ndarray:
+    leaving = gone[(engine.direction[gone] == direction) & ~engine.will_turn[gone]]
+    return np.stack([engine.lane[leaving], engine.vclass[leaving]], axis=1).astype(np.int32)
+
+
+def _inject(engine: Engine, direction: int, records: np.ndarray) -> None:
+    for lane, vehicle_class in records.tolist():
+        engine.inject(direction, lane, vehicle_class)
+
+
+def _worker(
+    block: range,
+    junctions: int,
+    seconds: int,
+    seed: int,
+    offset: int,
+    config: SimConfig,
+    channels: Dict[str, Optional[str]],
+    barrier: Any,
+    results: Any,
+) -> None:
+    # Whatever happens, the parent gets one message per worker: the block's report or its error
+    opened: List[BoundaryChannel] = []
+    try:
+        engines = []
+        for j in block:
+            engine = Engine(config, seed=seed + j)
+            engine.exit_log = []
+            engine.shift_signals(offset * j)
+            engines.append(engine)
+
+        def open_channel(key: str) -> Optional[BoundaryChannel]:
+            if not channels[key]:
+                return None
+            opened.append(BoundaryChannel(name=channels[key]))
+            return opened[-1]
+
+        east_out, west_out = open_channel("east_out"), open_channel("west_out")
+        east_in, west_in = open_channel("east_in"), open_channel("west_in")
+
+        corridor_exits = 0
+        handed_over = 0
+        started = time.perf_counter()
+        for _ in range(seconds):
+            for engine in engines:
+                engine.run_for(1)
+
+            eastbound: List[np.ndarray] = []
+            westbound: List[np.ndarray] = []
+            for k, engine in enumerate(engines):
+                gone = engine.drain_exits()
+                east, west = _through(engine, gone, _EAST), _through(engine, gone, _WEST)
+                j = block[k]
+                if j + 1 >= junctions:
+                    corridor_exits += len(east)
+                elif k + 1 < len(engines):
+                    _inject(engines[k + 1], _EAST, east)
+                    handed_over += len(east)
+                else:
+                    eastbound.append(east)
+                if j == 0:
+                    corridor_exits += len(west)
+                elif k > 0:
+                    _inject(engines[k - 1], _WEST, west)
+                    handed_over += len(west)
+                else:
+                    westbound.append(west)
+
+            for channel, batch in ((east_out, eastbound), (west_out, westbound)):
+                if channel is not None:
+                    records = np.concatenate(batch) if batch else np.zeros((0, 2), np.int32)
+                    channel.send(records)
+                    handed_over += len(records)
+            barrier.wait(BARRIER_TIMEOUT)
+            # east_in carries eastbound traffic from the block to our west, and vice versa
+            if east_in is not None:
+                _inject(engines[0], _EAST, east_in.receive())
+            if west_in is not None:
+                _inject(engines[-1], _WEST, west_in.receive())
+            barrier.wait(BARRIER_TIMEOUT)
+
+        report = {
+            "block": [block.start, block.stop],
+            "wall_seconds": time.perf_counter() - started,
+            "corridor_exits": corridor_exits,
+            "handed_over": handed_over,
+            "junctions": {j: engine.summary() for j, engine in zip(block, engines)},
+        }
+    except BaseException as exc:
+        # Release the neighbours blocked on the barrier instead of leaving them waiting for us
+        barrier.abort()
+        report = {
+            "block": [block.start, block.stop],
+            "error": f"{type(exc).__name__}: {exc}",
+            "broken_barrier": isinstance(exc, threading.BrokenBarrierError),
+            "traceback": traceback.format_exc(),
+        }
+    finally:
+        for channel in opened:
+            channel.close()
+    results.put(report)
+
+
+def _collect(processes: List[Any], results: Any, barrier: Any) -> List[Dict[str, Any]]:
+    """One report per worker; raises if a worker failed or died without reporting."""
+    reports: List[Dict[str, Any]] = []
+    while len(reports) < len(processes):
+        try:
+            reports.append(results.get(timeout=1.0))
+            continue
+        except queue.Empty:
+            pass
+        # A worker killed outright (segfault, OOM) never reports; once it has exited its message would have arrived
+        dead = [process for process in processes if process.exitcode not in (None, 0)]
+        if dead:
+            try:
+                reports.append(results.get(timeout=1.0))
+                continue
+            except queue.Empty:
+                barrier.abort()
+                raise RuntimeError(f"corridor worker {dead[0].name} exited with code {dead[0].exitcode}")
+
+    failed = [report for report in reports if "error" in report]
+    if failed:
+        # Neighbours of the failing worker report a broken barrier; the cause is the other one
+        cause = next((report for report in failed if not report["broken_barrier"]), failed[0])
+        start, stop = cause["block"]
+        raise RuntimeError(
+            f"corridor worker for junctions {start}-{stop - 1} failed: {cause['error']}\n{cause['traceback']}"
+        )
+    return reports
+
+
+def run_corridor(
+    junctions: int = 20,
+    workers: int = 4,
+    seconds: int = 600,
+    seed: int = 0,
+    offset: int = 0,
+    config: Optional[SimConfig] = None,
+    channel_capacity: int = 4096,
+) -> Dict[str, Any]:
+    """Simulate the corridor; ``offset`` delays each junction's signal cycle by that many seconds per position."""
+    config = config or SimConfig()
+    blocks = partition(junctions, workers)
+    context = mp.get_context()
+    barrier = context.Barrier(len(blocks))
+    results = context.Queue()
+
+    # Between neighbouring blocks b and b + 1: one channel eastbound, one westbound
+    eastbound = [BoundaryChannel(channel_capacity) for _ in blocks[:-1]]
+    westbound = [BoundaryChannel(channel_capacity) for _ in blocks[:-1]]
+    processes = []
+    started = time.perf_counter()
+    try:
+        for b, block in enumerate(blocks):
+            channels = {
+                "east_out": eastbound[b].name if b + 1 < len(blocks) else None,
+                "west_in": westbound[b].name if b + 1 < len(blocks) else None,
+                "east_in": eastbound[b - 1].name if b > 0 else None,
+                "west_out": westbound[b - 1].name if b > 0 else None,
+            }
+            process = context.Process(
+                target=_worker,
+                args=(block, junctions, seconds, seed, offset, config, channels, barrier, results),
+                daemon=True,
+            )
+            process.start()
+            processes.append(process)
+        reports = _collect(processes, results, barrier)
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for channel in eastbound + westbound:
+            channel.close()
+    elapsed = time.perf_counter() - started
+
+    per_junction: Dict[int, Dict[str, Any]] = {}
+    for report in reports:
+        per_junction.update(report["junctions"])
+    summaries = [per_junction[j] for j in range(junctions)]
+    waits = [summary["average_wait"] for summary in summaries]
+    return {
+        "junctions": junctions,
+        "workers": len(blocks),
+        "seconds": seconds,
+        "offset": offset,
+        "wall_seconds": round(elapsed, 2),
+        "speedup_vs_real_time": round(seconds / elapsed, 2) if elapsed else None,
+        "crossed": sum(summary["total"] for summary in summaries),
+        "through_transfers": sum(report["handed_over"] for report in reports),
+        "corridor_exits": sum(report["corridor_exits"] for report in reports),
+        "average_wait": round(float(np.mean(waits)), 3),
+        "per_junction": summaries,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Sharded multi-junction corridor simulation")
+    parser.add_argument("--junctions", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seconds", type=int, default=600)
+    parser.add_argument("--offset", type=int, default=0, help="signal offset between neighbours, seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    report = run_corridor(args.junctions, args.workers, args.seconds, args.seed, args.offset)
+    report.pop("per_junction")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
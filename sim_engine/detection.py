@@ -0,0 +1,230 @@
+"""Detection in the loop: plan greens from counts detected in rendered frames.
+
+setTime() in simulation.py counts vehicles from its own state.  Here the
+intersection is rendered off-screen when the decision is due, the queue area
+of each approach is cropped out of the frame and the four crops go through
+the detector in one batch (``TFNet.return_predict_batch``, or one
+``return_predict`` call per crop for detectors without it).  The detected
+boxes are turned back into per-lane, per-class counts and handed to the
+wrapped policy in place of the true ones.
+
+:func:`compare_with_ground_truth` runs the same seeded demand with true and
+with detected counts and reports decision latency, counting errors and the
+effect on throughput and waiting:
+
+    python -m sim_engine.detection --model cfg/yolo.cfg --load bin/yolov2.weights --seeds 2 --sim-time 300
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from dataclasses import replace
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .calibration import DETECTION_LABELS
+from .config import (
+    APPROACH_AXES,
+    APPROACHES,
+    DIRECTIONS,
+    LANE_OFFSETS,
+    LANES_PER_APPROACH,
+    VEHICLE_CLASSES,
+    VEHICLE_SIZES,
+    SimConfig,
+)
+from .engine import Engine
+from .policies import AdaptiveFormulaPolicy, PhaseDecision, QueueView, SignalPolicy
+
+Region = Tuple[int, int, int, int]
+
+
+def approach_regions(size: Tuple[int, int]) -> List[Region]:
+    """Screen rectangle (x0, y0, x1, y1) of each approach's lanes up to the stop line, clipped to the screen."""
+    width, height = size
+    widest = max(dims[1] for dims in VEHICLE_SIZES.values())
+    regions = []
+    for name in DIRECTIONS:
+        axis, origin, sign = APPROACH_AXES[name]
+        ends = sorted((origin, origin + sign * APPROACHES[name]["stop_line"]))
+        offsets = LANE_OFFSETS[name]
+        across = (min(offsets), max(offsets) + widest)
+        x, y = (ends, across) if axis == "x" else (across, ends)
+        regions.append(
+            (max(0, int(x[0])), max(0, int(y[0])), min(width, int(x[1])), min(height, int(y[1])))
+        )
+    return regions
+
+
+class DetectionPolicy(SignalPolicy):
+    """Wraps a policy so that it sees detected instead of true queue counts."""
+
+    name = "detected"
+
+    def __init__(self, detector: Any, inner: Optional[SignalPolicy] = None, renderer: Any = None):
+        if renderer is None:
+            from .render import SceneRenderer
+
+            renderer = SceneRenderer()
+        self.detector = detector
+        self.inner = inner or AdaptiveFormulaPolicy()
+        self.renderer = renderer
+        self.regions = approach_regions(renderer.surface.get_size())
+        self.engine: Optional[Engine] = None
+        self.decisions: List[Dict[str, Any]] = []
+
+    def attach(self, engine: Engine) -> "DetectionPolicy":
+        self.engine = engine
+        return self
+
+    def decide(self, view: QueueView) -> PhaseDecision:
+        if self.engine is None:
+            raise RuntimeError("DetectionPolicy needs attach(engine) before the first decision")
+        started = time.perf_counter()
+        crops = self.capture()
+        captured = time.perf_counter()
+        results = self.predict(crops)
+        detected = time.perf_counter()
+        counts = self.counts(results)
+        decision = self.inner.decide(replace(view, counts=counts))
+        finished = time.perf_counter()
+
+        self.decisions.append(
+            {
+                "time": view.time_elapsed,
+                "capture_ms": (captured - started) * 1000.0,
+                "inference_ms": (detected - captured) * 1000.0,
+                "total_ms": (finished - started) * 1000.0,
+                "true": view.counts.sum(axis=1),
+                "detected": counts.sum(axis=1),
+            }
+        )
+        return decision
+
+    def capture(self) -> List[np.ndarray]:
+        import pygame
+
+        surface = self.renderer.draw(self.engine)
+        pixels = pygame.surfarray.pixels3d(surface)
+        try:
+            # surfarray is (x, y, RGB); the detector expects OpenCV's (y, x, BGR)
+            return [
+                np.ascontiguousarray(pixels[x0:x1, y0:y1].transpose(1, 0, 2)[:, :, ::-1])
+                for x0, y0, x1, y1 in self.regions
+            ]
+        finally:
+            del pixels
+
+    def predict(self, crops: List[np.ndarray]) -> List[List[Dict[str, Any]]]:
+        batch = getattr(self.detector, "return_predict_batch", None)
+        if batch is not None:
+            return batch(crops)
+        return [self.detector.return_predict(crop) for crop in crops]
+
+    def counts(self, results: List[List[Dict[str, Any]]]) -> np.ndarray:
+        counts = np.zeros((len(DIRECTIONS), LANES_PER_APPROACH, len(VEHICLE_CLASSES)), dtype=np.int64)
+        for direction, (boxes, (x0, y0, _, _)) in enumerate(zip(results, self.regions)):
+            name = DIRECTIONS[direction]
+            offsets = np.asarray(LANE_OFFSETS[name], dtype=np.float64)
+            horizontal = APPROACH_AXES[name][0] == "x"
+            for box in boxes:
+                label = DETECTION_LABELS.get(str(box["label"]).lower())
+                if label is None:
+                    continue
+                # The lane whose near edge is closest to the box's, in screen coordinates
+                near_edge = box["topleft"]["y"] + y0 if horizontal else box["topleft"]["x"] + x0
+                lane = int(np.argmin(np.abs(offsets - near_edge)))
+                counts[direction, lane, VEHICLE_CLASSES.index(label)] += 1
+        counts.setflags(write=False)
+        return counts
+
+
+def _percentiles(values: Sequence[float]) -> Dict[str, float]:
+    values = np.asarray(values, dtype=np.float64)
+    if not values.size:
+        return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+    return {
+        "p50": round(float(np.percentile(values, 50)), 2),
+        "p95": round(float(np.percentile(values, 95)), 2),
+        "max": round(float(values.max()), 2),
+    }
+
+
+def compare_with_ground_truth(
+    detector: Any,
+    seeds: Sequence[int] = (0,),
+    config: Optional[SimConfig] = None,
+    inner: Optional[SignalPolicy] = None,
+    renderer: Any = None,
+) -> Dict[str, Any]:
+    config = config or SimConfig()
+    inner = inner or AdaptiveFormulaPolicy()
+    truth_runs, detected_runs, decisions = [], [], []
+    for seed in seeds:
+        truth_runs.append(Engine(config, seed=seed, policy=inner).run())
+        policy = DetectionPolicy(detector, inner=inner, renderer=renderer)
+        engine = Engine(config, seed=seed, policy=policy)
+        policy.attach(engine)
+        detected_runs.append(engine.run())
+        decisions.extend(policy.decisions)
+        renderer = policy.renderer
+
+    def mean(runs: List[Dict[str, Any]], metric: str) -> float:
+        return round(float(np.mean([run[metric] for run in runs])), 3)
+
+    metrics = ("throughput", "average_wait", "p95_wait", "total")
+    truth = {metric: mean(truth_runs, metric) for metric in metrics}
+    detected = {metric: mean(detected_runs, metric) for metric in metrics}
+    if decisions:
+        true_counts = np.stack([d["true"] for d in decisions])
+        detected_counts = np.stack([d["detected"] for d in decisions])
+        errors = detected_counts - true_counts
+        per_class_error = {
+            name: round(float(np.abs(errors[..., k]).mean()), 3) for k, name in enumerate(VEHICLE_CLASSES)
+        }
+        count_bias = round(float(errors.sum(axis=(1, 2)).mean()), 3)
+    else:
+        per_class_error, count_bias = {}, 0.0
+    latency = [d["total_ms"] for d in decisions]
+    return {
+        "seeds": list(seeds),
+        "decisions": len(decisions),
+        "latency_ms": {
+            "capture": _percentiles([d["capture_ms"] for d in decisions]),
+            "inference": _percentiles([d["inference_ms"] for d in decisions]),
+            "total": _percentiles(latency),
+        },
+        # Decisions that took longer than the detection lead would have missed their green in real time
+        "late_decisions": int(sum(ms > config.detection_time * 1000.0 for ms in latency)),
+        "count_error": {"mean_abs_per_class": per_class_error, "mean_total_bias": count_bias},
+        "ground_truth": truth,
+        "detected": detected,
+        "delta": {metric: round(detected[metric] - truth[metric], 3) for metric in metrics},
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Signal decisions from detected vs. true counts")
+    parser.add_argument("--model", default="cfg/yolo.cfg")
+    parser.add_argument("--load", default="bin/yolov2.weights")
+    parser.add_argument("--threshold", type=float, default=0.3)
+    parser.add_argument("--gpu", type=float, default=0.0)
+    parser.add_argument("--seeds", type=int, default=1)
+    parser.add_argument("--sim-time", type=int, default=300)
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    from darkflow.net.build import TFNet
+
+    tfnet = TFNet({"model": args.model, "load": args.load, "threshold": args.threshold, "gpu": args.gpu})
+    config = SimConfig.from_env()
+    config.sim_time = args.sim_time
+    report = compare_with_ground_truth(tfnet, seeds=range(args.seeds), config=config)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,546 @@
+"""Array-backed, headless version of the intersection in simulation.py.
+
+All vehicle state lives in flat NumPy columns indexed by spawn order and all
+signal state in a handful of scalars, so an engine can be stepped at full
+speed without pygame, snapshotted cheaply and restored in another process.
+"""
+from __future__ import annotations
+
+import io
+import json
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .config import (
+    APPROACH_AXES,
+    APPROACHES,
+    DIRECTIONS,
+    LANE_OFFSETS,
+    LANES_PER_APPROACH,
+    TURN_DIRECTIONS,
+    VEHICLE_CLASSES,
+    VEHICLE_SIZES,
+    SimConfig,
+)
+from .policies import AdaptiveFormulaPolicy, QueueView, SignalPolicy
+
+if TYPE_CHECKING:
+    from .conflicts import ConflictDetector
+    from .recorder import TrajectoryRecorder
+    from .replay import ReplayDemand
+
+# Per-vehicle columns and their dtypes
+VEHICLE_FIELDS: Dict[str, Any] = {
+    "direction": np.int8,
+    "lane": np.int8,
+    "vclass": np.int8,
+    "will_turn": np.bool_,
+    "pos": np.float64,
+    "crossed": np.bool_,
+    "active": np.bool_,
+    "leader": np.int32,
+    "spawn_time": np.float64,
+    "cross_time": np.float64,
+    "wait": np.float64,
+}
+
+# Per-signal timers, indexed by direction number
+SIGNAL_FIELDS = ("red", "yellow", "green", "total_green")
+
+_SCALAR_FIELDS = (
+    "count",
+    "frame",
+    "time_elapsed",
+    "current_green",
+    "next_green",
+    "current_yellow",
+    "spawn_clock",
+    "retired",
+)
+
+_INITIAL_CAPACITY = 256
+
+
+def _turn_exit(direction: str) -> float:
+    # Distance a turning vehicle covers after the turn before it leaves the screen
+    turn = TURN_DIRECTIONS[direction]
+    _, origin, sign = APPROACH_AXES[turn]
+    far_edge = origin + sign * APPROACHES[turn]["length"]
+    return float(abs(far_edge - LANE_OFFSETS[direction][LANES_PER_APPROACH - 1]))
+
+
+@dataclass
+class EngineSnapshot:
+    config: Dict[str, Any]
+    scalars: Dict[str, Any]
+    arrays: Dict[str, np.ndarray]
+    rng_state: Dict[str, Any]
+
+    def to_bytes(self) -> bytes:
+        meta = json.dumps({"config": self.config, "scalars": self.scalars, "rng_state": self.rng_state})
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, __meta__=np.frombuffer(meta.encode("utf-8"), dtype=np.uint8), **self.arrays)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> "EngineSnapshot":
+        with np.load(io.BytesIO(payload)) as archive:
+            meta = json.loads(archive["__meta__"].tobytes().decode("utf-8"))
+            arrays = {name: archive[name] for name in archive.files if name != "__meta__"}
+        return cls(config=meta["config"], scalars=meta["scalars"], arrays=arrays, rng_state=meta["rng_state"])
+
+
+class Engine:
+    def __init__(
+        self,
+        config: Optional[SimConfig] = None,
+        seed: Optional[int] = None,
+        policy: Optional[SignalPolicy] = None,
+        conflicts: Optional["ConflictDetector"] = None,
+        demand: Optional["ReplayDemand"] = None,
+    ):
+        self.config = config or SimConfig()
+        self.policy = policy or AdaptiveFormulaPolicy()
+        self.conflicts = conflicts
+        # Arrivals come from the demand object when set, otherwise they are drawn like generateVehicles()
+        self.demand = demand
+        self.rng = np.random.default_rng(seed)
+        self._build_tables()
+
+        self.count = 0
+        self.frame = 0
+        self.time_elapsed = 0
+        self.current_green = 0
+        self.next_green = 1
+        self.current_yellow = 0
+        # Start primed so the first vehicle appears on the first frame, as in generateVehicles()
+        self.spawn_clock = self.config.spawn_interval
+        self.retired = 0
+        # Set to a list to collect the indices of vehicles as they leave the screen
+        self.exit_log: Optional[List[np.ndarray]] = None
+        # Set to a TrajectoryRecorder to log every vehicle's position each frame
+        self.recorder: Optional["TrajectoryRecorder"] = None
+
+        self._allocate(_INITIAL_CAPACITY)
+        self.tail = np.full((len(DIRECTIONS), LANES_PER_APPROACH), -1, dtype=np.int32)
+        self.crossed_counts = np.zeros((len(DIRECTIONS), len(VEHICLE_CLASSES)), dtype=np.int64)
+        self._initialize_signals()
+
+    # ------------------------------------------------------------------ setup
+    def _build_tables(self) -> None:
+        config = self.config
+        self._speed = np.array([config.speeds[name] for name in VEHICLE_CLASSES], dtype=np.float64)
+        self._length = np.array([VEHICLE_SIZES[name][0] for name in VEHICLE_CLASSES], dtype=np.float64)
+        self._pass_time = np.array([config.pass_times[name] for name in VEHICLE_CLASSES], dtype=np.float64)
+        self._stop = np.array([APPROACHES[name]["stop"] for name in DIRECTIONS], dtype=np.float64)
+        self._stop_line = np.array([APPROACHES[name]["stop_line"] for name in DIRECTIONS], dtype=np.float64)
+        self._mid = np.array([APPROACHES[name]["mid"] for name in DIRECTIONS], dtype=np.float64)
+        self._road_length = np.array([APPROACHES[name]["length"] for name in DIRECTIONS], dtype=np.float64)
+        self._turn_exit = np.array([_turn_exit(name) for name in DIRECTIONS], dtype=np.float64)
+        self._width = np.array([VEHICLE_SIZES[name][1] for name in VEHICLE_CLASSES], dtype=np.float64)
+        self._horizontal = np.array([APPROACH_AXES[name][0] == "x" for name in DIRECTIONS])
+        self._axis_origin = np.array([APPROACH_AXES[name][1] for name in DIRECTIONS], dtype=np.float64)
+        self._axis_sign = np.array([APPROACH_AXES[name][2] for name in DIRECTIONS], dtype=np.float64)
+        self._turn_sign = np.array([APPROACH_AXES[TURN_DIRECTIONS[name]][2] for name in DIRECTIONS], dtype=np.float64)
+        self._lane_offset = np.array([LANE_OFFSETS[name] for name in DIRECTIONS], dtype=np.float64)
+        self._turn_lane_offset = np.array(
+            [LANE_OFFSETS[TURN_DIRECTIONS[name]][LANES_PER_APPROACH - 1] for name in DIRECTIONS], dtype=np.float64
+        )
+        weights = np.asarray(config.direction_weights, dtype=np.float64)
+        self._direction_cdf = np.cumsum(weights) / weights.sum()
+        self._class_cdf = None
+        if config.class_weights is not None:
+            class_weights = np.asarray(config.class_weights, dtype=np.float64)
+            self._class_cdf = np.cumsum(class_weights) / class_weights.sum()
+
+    def _allocate(self, capacity: int) -> None:
+        self.capacity = capacity
+        for name, dtype in VEHICLE_FIELDS.items():
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        self.leader[:] = -1
+        self.cross_time[:] = np.nan
+
+    def _grow(self) -> None:
+        old_count = self.count
+        old = {name: getattr(self, name)[:old_count] for name in VEHICLE_FIELDS}
+        self._allocate(self.capacity * 2)
+        for name, values in old.items():
+            getattr(self, name)[:old_count] = values
+
+    def _initialize_signals(self) -> None:
+        config = self.config
+        signal_count = len(DIRECTIONS)
+        self.red = np.full(signal_count, config.default_red, dtype=np.int64)
+        self.yellow = np.full(signal_count, config.default_yellow, dtype=np.int64)
+        self.green = np.full(signal_count, config.default_green, dtype=np.int64)
+        self.total_green = np.zeros(signal_count, dtype=np.int64)
+        # Same staggering as initialize() in simulation.py
+        self.red[0] = 0
+        self.red[1] = config.default_yellow + config.default_green
+
+    # --------------------------------------------------------------- stepping
+    @property
+    def now(self) -> float:
+        return self.frame / self.config.frames_per_second
+
+    @property
+    def finished(self) -> bool:
+        return self.time_elapsed >= self.config.sim_time
+
+    def step(self) -> None:
+        fps = self.config.frames_per_second
+        if self.frame % fps == 0:
+            self._update_signals()
+        self._spawn()
+        self._move()
+        if self.conflicts is not None:
+            self.conflicts.update(self)
+        if self.recorder is not None:
+            self.recorder.record(self)
+        self.frame += 1
+        if self.frame % fps == 0:
+            self.time_elapsed += 1
+
+    def run_for(self, seconds: int) -> None:
+        target = self.time_elapsed + seconds
+        while self.time_elapsed < target:
+            self.step()
+
+    def run(self) -> Dict[str, Any]:
+        while not self.finished:
+            self.step()
+        return self.summary()
+
+    def shift_signals(self, seconds: int) -> None:
+        """Run only the signal timers forward, e.g. to offset junctions along a corridor."""
+        for _ in range(seconds):
+            self._update_signals()
+
+    def extend_green(self, seconds: int) -> None:
+        """Lengthen the active green (or the upcoming one while yellow is showing)."""
+        if self.current_yellow:
+            self.green[self.next_green] += seconds
+        else:
+            self.green[self.current_green] += seconds
+            self.red[self.next_green] += seconds
+
+    # ----------------------------------------------------------------- signals
+    def _update_signals(self) -> None:
+        # One second of repeat()/updateValues() from simulation.py
+        config = self.config
+        cg = self.current_green
+        if not self.current_yellow and self.green[cg] <= 0:
+            self.current_yellow = 1
+        if self.current_yellow and self.yellow[cg] <= 0:
+            self.current_yellow = 0
+            self.green[cg] = config.default_green
+            self.yellow[cg] = config.default_yellow
+            self.red[cg] = config.default_red
+            self.current_green = self.next_green
+            self.next_green = (self.current_green + 1) % len(DIRECTIONS)
+            cg = self.current_green
+            self.red[self.next_green] = self.yellow[cg] + self.green[cg]
+
+        self.red -= 1
+        self.red[cg] += 1
+        if self.current_yellow:
+            self.yellow[cg] -= 1
+        else:
+            self.green[cg] -= 1
+            self.total_green[cg] += 1
+            if self.red[self.next_green] == config.detection_time:
+                self._plan_next_green()
+
+    def queue_counts(self) -> np.ndarray:
+        """Uncrossed vehicles per (approach, lane, class), the quantities setTime() counts."""
+        n = self.count
+        mask = self.active[:n] & ~self.crossed[:n]
+        flat = (
+            self.direction[:n][mask].astype(np.int64) * LANES_PER_APPROACH + self.lane[:n][mask]
+        ) * len(VEHICLE_CLASSES) + self.vclass[:n][mask]
+        counts = np.bincount(flat, minlength=len(DIRECTIONS) * LANES_PER_APPROACH * len(VEHICLE_CLASSES))
+        return counts.reshape(len(DIRECTIONS), LANES_PER_APPROACH, len(VEHICLE_CLASSES))
+
+    def queue_view(self) -> QueueView:
+        n = self.count
+        mask = self.active[:n] & ~self.crossed[:n]
+        counts = self.queue_counts()
+        waits = np.bincount(self.direction[:n][mask], weights=self.wait[:n][mask], minlength=len(DIRECTIONS))
+        counts.setflags(write=False)
+        waits.setflags(write=False)
+        return QueueView(
+            counts=counts,
+            waits=waits,
+            current_green=self.current_green,
+            next_green=self.next_green,
+            time_elapsed=self.time_elapsed,
+            config=self.config,
+        )
+
+    def _plan_next_green(self) -> None:
+        # Decision point: setTime() in simulation.py
+        decision = self.policy.decide(self.queue_view())
+        phase = int(decision.phase)
+        if phase == self.current_green:
+            raise ValueError(f"{self.policy.name} policy chose the approach that is already green")
+        if phase != self.next_green:
+            self.red[phase] = self.red[self.next_green]
+            self.red[self.next_green] = self.config.default_red
+            self.next_green = phase
+        self.green[phase] = int(decision.green)
+
+    # ---------------------------------------------------------------- vehicles
+    def _spawn(self) -> None:
+        if self.demand is not None:
+            self.demand.spawn(self)
+            return
+        config = self.config
+        self.spawn_clock += 1.0 / config.frames_per_second
+        while self.spawn_clock >= config.spawn_interval:
+            self.spawn_clock -= config.spawn_interval
+            self._spawn_random()
+
+    def _spawn_random(self) -> None:
+        # Same draw sequence as generateVehicles() in simulation.py
+        if self._class_cdf is None:
+            vehicle_class = int(self.rng.integers(0, len(VEHICLE_CLASSES)))
+        else:
+            vehicle_class = int(np.searchsorted(self._class_cdf, self.rng.random(), side="right"))
+        if VEHICLE_CLASSES[vehicle_class] == "bike":
+            lane = 0
+        else:
+            lane = int(self.rng.integers(0, 2)) + 1
+        will_turn = lane == 2 and self.rng.random() < self.config.turn_probability
+        direction = int(np.searchsorted(self._direction_cdf, self.rng.random(), side="right"))
+        self.add_vehicle(direction, lane, vehicle_class, will_turn)
+
+    def populate(self, target: int) -> int:
+        """Spawn random vehicles until ``target`` are on the road; returns how many were added."""
+        missing = max(0, target - int(self.active[: self.count].sum()))
+        for _ in range(missing):
+            self._spawn_random()
+        return missing
+
+    def inject(self, direction: int, lane: int, vehicle_class: int) -> int:
+        """Bring in a vehicle arriving from outside, e.g. from an upstream junction."""
+        will_turn = lane == 2 and self.rng.random() < self.config.turn_probability
+        return self.add_vehicle(direction, lane, vehicle_class, will_turn)
+
+    def drain_exits(self) -> np.ndarray:
+        """Indices of the vehicles that left the screen since the last call (needs ``exit_log``)."""
+        if not self.exit_log:
+            return np.zeros(0, dtype=np.int64)
+        gone = np.concatenate(self.exit_log)
+        self.exit_log.clear()
+        return gone
+
+    def add_vehicle(self, direction: int, lane: int, vehicle_class: int, will_turn: bool = False) -> int:
+        if self.count == self.capacity:
+            self._grow()
+        i = self.count
+        pos = 0.0
+        tail = int(self.tail[direction, lane])
+        if tail >= 0 and self.active[tail]:
+            # queue up behind the last vehicle in the lane if it has not cleared the entry yet
+            rear = self.pos[tail] - self._length[self.vclass[tail]]
+            pos = min(pos, rear - self.config.gap)
+        self.direction[i] = direction
+        self.lane[i] = lane
+        self.vclass[i] = vehicle_class
+        self.will_turn[i] = will_turn
+        self.pos[i] = pos
+        self.crossed[i] = False
+        self.active[i] = True
+        self.leader[i] = tail
+        self.spawn_time[i] = self.now
+        self.cross_time[i] = np.nan
+        self.wait[i] = 0.0
+        self.tail[direction, lane] = i
+        self.count += 1
+        return i
+
+    def _move(self) -> None:
+        n = self.count
+        idx = np.flatnonzero(self.active[:n])
+        if not idx.size:
+            return
+        config = self.config
+        direction = self.direction[idx]
+        vclass = self.vclass[idx]
+        pos = self.pos[idx]
+        crossed = self.crossed[idx]
+        will_turn = self.will_turn[idx]
+
+        green = (direction == self.current_green) & (self.current_yellow == 0)
+        can_go = (pos <= self._stop[direction]) | crossed | green
+        if self.conflicts is not None and self.conflicts.gap_acceptance:
+            can_go &= ~self.conflicts.must_yield(self, idx, pos + self._speed[vclass])
+
+        # A leader blocks while it is still on our path: it has not turned off it,
+        # or we are turning the same way behind it.
+        leader = self.leader[idx]
+        has_leader = leader >= 0
+        lead = np.where(has_leader, leader, 0)
+        lead_turned = self.will_turn[lead] & (self.pos[lead] > self._mid[direction])
+        blocking = has_leader & self.active[lead] & (~lead_turned | will_turn)
+        lead_rear = self.pos[lead] - self._length[self.vclass[lead]]
+        free = ~blocking | (pos < lead_rear - config.moving_gap)
+
+        moving = can_go & free
+        pos = pos + np.where(moving, self._speed[vclass], 0.0)
+        self.pos[idx] = pos
+
+        dt = 1.0 / config.frames_per_second
+        waiting = ~moving & ~crossed
+        if waiting.any():
+            self.wait[idx[waiting]] += dt
+
+        newly_crossed = ~crossed & (pos > self._stop_line[direction])
+        if newly_crossed.any():
+            crossed_idx = idx[newly_crossed]
+            self.crossed[crossed_idx] = True
+            self.cross_time[crossed_idx] = self.now
+            np.add.at(self.crossed_counts, (direction[newly_crossed], vclass[newly_crossed]), 1)
+
+        limit = np.where(
+            will_turn,
+            self._mid[direction] + self._turn_exit[direction],
+            self._road_length[direction] + self._length[vclass],
+        )
+        gone = pos > limit
+        if gone.any():
+            self.active[idx[gone]] = False
+            self.retired += int(gone.sum())
+            if self.exit_log is not None:
+                self.exit_log.append(idx[gone])
+
+    # ---------------------------------------------------------------- geometry
+    def boxes(self, idx: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Screen-space bounding boxes (x0, y0, x1, y1) of the given (default: active) vehicles."""
+        if idx is None:
+            idx = np.flatnonzero(self.active[: self.count])
+        return self.boxes_at(self.direction[idx], self.lane[idx], self.vclass[idx], self.will_turn[idx], self.pos[idx])
+
+    def boxes_at(
+        self,
+        direction: np.ndarray,
+        lane: np.ndarray,
+        vclass: np.ndarray,
+        will_turn: np.ndarray,
+        pos: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        length = self._length[vclass]
+        width = self._width[vclass]
+        sign = self._axis_sign[direction]
+        mid = self._mid[direction]
+        turned = will_turn & (pos > mid)
+
+        # Along the approach axis: the vehicle body, or the lane it turned into at mid
+        front = self._axis_origin[direction] + sign * pos
+        back = front - sign * length
+        turn_lane = self._turn_lane_offset[direction]
+        along0 = np.where(turned, turn_lane, np.minimum(front, back))
+        along1 = np.where(turned, turn_lane + width, np.maximum(front, back))
+
+        # Across it: the lane, or the body travelling away from mid after the turn
+        offset = self._lane_offset[direction, lane]
+        turn_sign = self._turn_sign[direction]
+        lateral_front = offset + turn_sign * (pos - mid)
+        lateral_back = lateral_front - turn_sign * length
+        across0 = np.where(turned, np.minimum(lateral_front, lateral_back), offset)
+        across1 = np.where(turned, np.maximum(lateral_front, lateral_back), offset + width)
+
+        horizontal = self._horizontal[direction]
+        return (
+            np.where(horizontal, along0, across0),
+            np.where(horizontal, across0, along0),
+            np.where(horizontal, along1, across1),
+            np.where(horizontal, across1, along1),
+        )
+
+    # ------------------------------------------------------------------- stats
+    def lane_stats(self) -> List[Dict[str, int]]:
+        stats = []
+        for number in range(len(DIRECTIONS)):
+            row = {"lane": number + 1, "total": int(self.crossed_counts[number].sum())}
+            row.update({name: int(self.crossed_counts[number, k]) for k, name in enumerate(VEHICLE_CLASSES)})
+            stats.append(row)
+        return stats
+
+    def summary(self) -> Dict[str, Any]:
+        n = self.count
+        total = int(self.crossed_counts.sum())
+        throughput = total / self.time_elapsed if self.time_elapsed > 0 else 0.0
+        waits = self.wait[:n][self.crossed[:n]]
+        return {
+            "total": total,
+            "time": self.time_elapsed,
+            "throughput": round(throughput, 3),
+            "average_wait": round(float(waits.mean()), 3) if waits.size else 0.0,
+            "p95_wait": round(float(np.percentile(waits, 95)), 3) if waits.size else 0.0,
+            "spawned": n,
+            "queued": int((self.active[:n] & ~self.crossed[:n]).sum()),
+        }
+
+    # --------------------------------------------------------------- snapshots
+    def snapshot(self) -> EngineSnapshot:
+        n = self.count
+        arrays = {name: getattr(self, name)[:n].copy() for name in VEHICLE_FIELDS}
+        arrays.update({name: getattr(self, name).copy() for name in SIGNAL_FIELDS})
+        arrays["tail"] = self.tail.copy()
+        arrays["crossed_counts"] = self.crossed_counts.copy()
+        scalars = {name: getattr(self, name) for name in _SCALAR_FIELDS}
+        scalars = {name: value.item() if isinstance(value, np.generic) else value for name, value in scalars.items()}
+        return EngineSnapshot(
+            config=self.config.to_dict(),
+            scalars=scalars,
+            arrays=arrays,
+            rng_state=self.rng.bit_generator.state,
+        )
+
+    def restore(self, snapshot: EngineSnapshot) -> None:
+        self.config = SimConfig.from_dict(snapshot.config)
+        self._build_tables()
+        for name, value in snapshot.scalars.items():
+            setattr(self, name, value)
+        capacity = _INITIAL_CAPACITY
+        while capacity < self.count:
+            capacity *= 2
+        self._allocate(capacity)
+        for name in VEHICLE_FIELDS:
+            getattr(self, name)[: self.count] = snapshot.arrays[name]
+        for name in SIGNAL_FIELDS:
+            setattr(self, name, snapshot.arrays[name].astype(np.int64))
+        self.tail = snapshot.arrays["tail"].astype(np.int32)
+        self.crossed_counts = snapshot.arrays["crossed_counts"].astype(np.int64)
+        self.rng = np.random.default_rng()
+        self.rng.bit_generator.state = snapshot.rng_state
+
+    @classmethod
+    def from_snapshot(
+        cls,
+        snapshot: EngineSnapshot,
+        policy: Optional[SignalPolicy] = None,
+        demand: Optional["ReplayDemand"] = None,
+    ) -> "Engine":
+        engine = cls.__new__(cls)
+        engine.policy = policy or AdaptiveFormulaPolicy()
+        engine.conflicts = None
+        engine.demand = demand
+        engine.exit_log = None
+        engine.recorder = None
+        engine.restore(snapshot)
+        return engine
+
+    def fork(self, seed: Optional[int] = None) -> "Engine":
+        """Independent copy of this engine.
+
+        Without a seed the fork replays the same random arrivals as the
+        original, which is what a fair what-if comparison needs.
+        """
+        engine = Engine.from_snapshot(self.snapshot(), policy=self.policy, demand=self.demand)
+        if seed is not None:
+            engine.rng = np.random.default_rng(seed)
+        return engine
@@ -0,0 +1,349 @@
+"""Search signal-timing parameters with CMA-ES over seeded headless runs.
+
+The searched parameters are the ones simulation.py hard-codes: the minimum
+and maximum green, the yellow time, the detection lead and the per-class pass
+times used by the setTime() formula.  Each candidate is run for a set of
+seeds in a process pool; results are cached by (configuration, seed) so
+repeated candidates, restarts and later searches reuse earlier runs.
+
+Throughput and p95 wait pull in opposite directions, so the search is
+repeated for several trade-off weights of the scalarised objective
+``-throughput + weight * p95_wait / 60`` and the Pareto front is taken over
+every candidate evaluated for the demand profile.
+
+    python -m sim_engine.optimize --city "Delhi NCR" --city Indore --generations 8 --cache optimize_cache.json
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pathlib
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import replace
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .config import VEHICLE_CLASSES, SimConfig
+from .engine import Engine
+from .mesoscopic import CityDemand
+
+LOGGER = logging.getLogger(__name__)
+
+# (name, low, high, integer); pass times are rounded to 0.1 s
+PARAMETERS: Tuple[Tuple[str, float, float, bool], ...] = (
+    ("min_green", 5, 40, True),
+    ("max_green", 20, 120, True),
+    ("default_yellow", 2, 8, True),
+    ("detection_time", 1, 10, True),
+) + tuple((f"pass_time_{name}", 0.5, 5.0, False) for name in VEHICLE_CLASSES)
+
+_METRICS = ("throughput", "p95_wait", "average_wait")
+
+
+def engine_version() -> str:
+    """Hash of the sim_engine sources, so cached results do not outlive changes to the engine."""
+    digest = hashlib.sha256()
+    for path in sorted(pathlib.Path(__file__).resolve().parent.glob("*.py")):
+        digest.update(path.name.encode("utf-8"))
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def decode(x: np.ndarray, default_green: int = SimConfig.default_green) -> Dict[str, float]:
+    """Map a point of the unit cube onto a valid parameter set; ``default_green`` is the first green of a run."""
+    params: Dict[str, float] = {}
+    for value, (name, low, high, integer) in zip(np.clip(x, 0.0, 1.0), PARAMETERS):
+        scaled = low + float(value) * (high - low)
+        params[name] = int(round(scaled)) if integer else round(scaled, 1)
+    params["max_green"] = max(params["max_green"], params["min_green"])
+    # The policy is asked when the next signal's red countdown equals detection_time during a green, when it
+    # runs from yellow + green - 1 down to yellow; outside that window every cycle would be the fixed default
+    earliest = params["default_yellow"] + min(params["min_green"], default_green) - 1
+    params["detection_time"] = min(max(params["detection_time"], params["default_yellow"]), earliest)
+    return params
+
+
+def encode(params: Dict[str, float]) -> np.ndarray:
+    return np.array([(params[name] - low) / (high - low) for name, low, high, _ in PARAMETERS])
+
+
+def current_params(config: SimConfig) -> Dict[str, float]:
+    params: Dict[str, float] = {
+        "min_green": config.min_green,
+        "max_green": config.max_green,
+        "default_yellow": config.default_yellow,
+        "detection_time": config.detection_time,
+    }
+    for name in VEHICLE_CLASSES:
+        params[f"pass_time_{name}"] = config.pass_times[name]
+    return params
+
+
+def apply_params(config: SimConfig, params: Dict[str, float]) -> SimConfig:
+    pass_times = {name: params[f"pass_time_{name}"] for name in VEHICLE_CLASSES}
+    return replace(
+        config,
+        min_green=params["min_green"],
+        max_green=params["max_green"],
+        default_yellow=params["default_yellow"],
+        detection_time=params["detection_time"],
+        pass_times=pass_times,
+    )
+
+
+def city_profile(record: Any, base: Optional[SimConfig] = None) -> SimConfig:
+    """Demand of a ``CityRecord``: arrival rate scaled by its delay level, classes by its vehicle mix."""
+    base = base or SimConfig()
+    demand = CityDemand.from_city_record(record)
+    level = demand.local_rate / CityDemand.local_rate
+    return replace(base, spawn_interval=base.spawn_interval / level, class_weights=tuple(demand.class_mix))
+
+
+def pareto_front(points: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Points not dominated on (higher throughput, lower p95 wait), by increasing p95 wait."""
+    ordered = sorted(points, key=lambda point: (point["p95_wait"], -point["throughput"]))
+    front: List[Dict[str, Any]] = []
+    best = -np.inf
+    for point in ordered:
+        if point["throughput"] > best:
+            front.append(point)
+            best = point["throughput"]
+    return front
+
+
+class CMAES:
+    """(mu/mu_w, lambda)-CMA-ES minimising over the unit cube; samples are clipped into it."""
+
+    def __init__(self, dim: int, mean: np.ndarray, sigma: float = 0.3, popsize: Optional[int] = None, seed: Optional[int] = None):
+        self.dim = dim
+        self.mean = np.asarray(mean, dtype=np.float64).copy()
+        self.sigma = sigma
+        self.popsize = popsize or 4 + int(3 * np.log(dim))
+        self.rng = np.random.default_rng(seed)
+
+        mu = self.popsize // 2
+        weights = np.log(mu + 0.5) - np.log(np.arange(1, mu + 1))
+        self.weights = weights / weights.sum()
+        self.mueff = 1.0 / np.sum(self.weights**2)
+        n = dim
+        self.cc = (4 + self.mueff / n) / (n + 4 + 2 * self.mueff / n)
+        self.cs = (self.mueff + 2) / (n + self.mueff + 5)
+        self.c1 = 2 / ((n + 1.3) ** 2 + self.mueff)
+        self.cmu = min(1 - self.c1, 2 * (self.mueff - 2 + 1 / self.mueff) / ((n + 2) ** 2 + self.mueff))
+        self.damps = 1 + 2 * max(0.0, np.sqrt((self.mueff - 1) / (n + 1)) - 1) + self.cs
+        self.chi_n = np.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n**2))
+
+        self.pc = np.zeros(n)
+        self.ps = np.zeros(n)
+        self.C = np.eye(n)
+        self.generation = 0
+
+    def ask(self) -> np.ndarray:
+        eigenvalues, self._B = np.linalg.eigh(self.C)
+        self._D = np.sqrt(np.maximum(eigenvalues, 1e-20))
+        z = self.rng.standard_normal((self.popsize, self.dim))
+        return np.clip(self.mean + self.sigma * (z * self._D) @ self._B.T, 0.0, 1.0)
+
+    def tell(self, solutions: np.ndarray, fitness: Sequence[float]) -> None:
+        n = self.dim
+        order = np.argsort(fitness)[: len(self.weights)]
+        y = (solutions[order] - self.mean) / self.sigma
+        y_w = self.weights @ y
+        self.mean = self.mean + self.sigma * y_w
+
+        inv_sqrt_c = self._B @ np.diag(1 / self._D) @ self._B.T
+        self.ps = (1 - self.cs) * self.ps + np.sqrt(self.cs * (2 - self.cs) * self.mueff) * inv_sqrt_c @ y_w
+        norm_ps = np.linalg.norm(self.ps)
+        hsig = norm_ps / np.sqrt(1 - (1 - self.cs) ** (2 * (self.generation + 1))) / self.chi_n < 1.4 + 2 / (n + 1)
+        self.pc = (1 - self.cc) * self.pc + hsig * np.sqrt(self.cc * (2 - self.cc) * self.mueff) * y_w
+
+        rank_mu = (y.T * self.weights) @ y
+        self.C = (
+            (1 - self.c1 - self.cmu) * self.C
+            + self.c1 * (np.outer(self.pc, self.pc) + (1 - hsig) * self.cc * (2 - self.cc) * self.C)
+            + self.cmu * rank_mu
+        )
+        self.C = (self.C + self.C.T) / 2
+        self.sigma *= np.exp(self.cs / self.damps * (norm_ps / self.chi_n - 1))
+        self.generation += 1
+
+
+class ResultCache:
+    """Run summaries keyed by the full configuration, seed and engine version, optionally persisted as JSON.
+
+    Entries written by another version of the engine are dropped when the file is loaded.
+    """
+
+    def __init__(self, path: Optional[str] = None, version: Optional[str] = None):
+        self.path = path
+        self.version = version or engine_version()
+        self.entries: Dict[str, Dict[str, float]] = {}
+        self.hits = 0
+        self.misses = 0
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as handle:
+                stored = json.load(handle)
+            self.entries = {key: result for key, result in stored.items() if self._version_of(key) == self.version}
+
+    @staticmethod
+    def _version_of(key: str) -> Optional[str]:
+        try:
+            return json.loads(key).get("version")
+        except (ValueError, AttributeError):
+            return None
+
+    def key(self, config: SimConfig, seed: int) -> str:
+        return json.dumps({"config": config.to_dict(), "seed": seed, "version": self.version}, sort_keys=True)
+
+    def get(self, config: SimConfig, seed: int) -> Optional[Dict[str, float]]:
+        found = self.entries.get(self.key(config, seed))
+        if found is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return found
+
+    def put(self, config: SimConfig, seed: int, result: Dict[str, float]) -> None:
+        self.entries[self.key(config, seed)] = result
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            json.dump(self.entries, handle)
+        os.replace(tmp_path, self.path)
+
+
+def _run(config: SimConfig, seed: int) -> Dict[str, float]:
+    summary = Engine(config, seed=seed).run()
+    return {metric: float(summary[metric]) for metric in _METRICS}
+
+
+def evaluate_batch(
+    configs: Sequence[SimConfig], seeds: Sequence[int], cache: ResultCache, pool: Executor
+) -> List[Dict[str, float]]:
+    """Mean metrics over ``seeds`` for each configuration; only uncached runs go to the pool."""
+    pending = {}
+    for config in configs:
+        for seed in seeds:
+            key = cache.key(config, seed)
+            if key not in pending and cache.get(config, seed) is None:
+                pending[key] = (config, seed, pool.submit(_run, config, seed))
+    for config, seed, future in pending.values():
+        cache.put(config, seed, future.result())
+
+    results = []
+    for config in configs:
+        runs = [cache.entries[cache.key(config, seed)] for seed in seeds]
+        results.append({metric: round(float(np.mean([run[metric] for run in runs])), 4) for metric in _METRICS})
+    return results
+
+
+def optimize_profile(
+    name: str,
+    config: SimConfig,
+    pool: Executor,
+    cache: ResultCache,
+    seeds: Sequence[int] = (0, 1),
+    generations: int = 8,
+    popsize: int = 8,
+    trade_offs: Sequence[float] = (0.0, 0.5, 2.0),
+    seed: int = 0,
+) -> Dict[str, Any]:
+    start = current_params(config)
+    baseline = {"params": start, **evaluate_batch([config], seeds, cache, pool)[0]}
+    evaluated: Dict[str, Dict[str, Any]] = {json.dumps(start, sort_keys=True): baseline}
+    best: Dict[str, Dict[str, Any]] = {}
+
+    for k, weight in enumerate(trade_offs):
+        search = CMAES(len(PARAMETERS), encode(start), popsize=popsize, seed=seed + k)
+        for _ in range(generations):
+            candidates = search.ask()
+            params = [decode(x, config.default_green) for x in candidates]
+            results = evaluate_batch([apply_params(config, p) for p in params], seeds, cache, pool)
+            fitness = [-result["throughput"] + weight * result["p95_wait"] / 60.0 for result in results]
+            search.tell(candidates, fitness)
+            for p, result, value in zip(params, results, fitness):
+                point = {"params": p, **result}
+                evaluated[json.dumps(p, sort_keys=True)] = point
+                if str(weight) not in best or value < best[str(weight)]["objective"]:
+                    best[str(weight)] = {**point, "objective": round(value, 4)}
+        LOGGER.info("%s: trade-off %s done, %d candidates so far", name, weight, len(evaluated))
+
+    return {
+        "profile": name,
+        "sim_time": config.sim_time,
+        "seeds": list(seeds),
+        "candidates": len(evaluated),
+        "baseline": baseline,
+        "best": best,
+        "pareto": pareto_front(list(evaluated.values())),
+    }
+
+
+def optimize_profiles(
+    profiles: Dict[str, SimConfig],
+    cache_path: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    **kwargs: Any,
+) -> List[Dict[str, Any]]:
+    cache = ResultCache(cache_path)
+    reports = []
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        try:
+            for name, config in profiles.items():
+                reports.append(optimize_profile(name, config, pool, cache, **kwargs))
+        finally:
+            cache.save()
+    LOGGER.info("cache: %d hits, %d misses", cache.hits, cache.misses)
+    return reports
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    from data_pipeline.loader import load_city_records
+
+    parser = argparse.ArgumentParser(description="CMA-ES search over signal-timing parameters")
+    parser.add_argument("--city", action="append", help="city name; repeat for several (default: uniform demand only)")
+    parser.add_argument("--generations", type=int, default=8)
+    parser.add_argument("--popsize", type=int, default=8)
+    parser.add_argument("--seeds", type=int, default=2, help="seeded runs averaged per candidate")
+    parser.add_argument("--sim-time", type=int, default=300)
+    parser.add_argument("--trade-offs", type=float, nargs="+", default=[0.0, 0.5, 2.0])
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache", help="JSON file of earlier runs to reuse and extend")
+    parser.add_argument("--output", help="write the report JSON here")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    base = SimConfig.from_env()
+    base.sim_time = args.sim_time
+    profiles = {"uniform": base}
+    if args.city:
+        wanted = {name.lower() for name in args.city}
+        for record in load_city_records():
+            if record.city.lower() in wanted:
+                profiles[record.city] = city_profile(record, base)
+
+    reports = optimize_profiles(
+        profiles,
+        cache_path=args.cache,
+        max_workers=args.workers,
+        seeds=range(args.seeds),
+        generations=args.generations,
+        popsize=args.popsize,
+        trade_offs=args.trade_offs,
+    )
+    text = json.dumps(reports, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
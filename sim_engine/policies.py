@@ -0,0 +1,144 @@
+"""Signal-timing policies the engine consults when it plans the next green.
+
+The engine calls :meth:`SignalPolicy.decide` at the same moment simulation.py
+runs ``setTime()``: when the red timer of the upcoming signal reaches
+``detection_time``.  Policies get a read-only :class:`QueueView` and return
+which approach goes green next and for how long.
+"""
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from typing import Dict, Optional, Type
+
+import numpy as np
+
+from .config import VEHICLE_CLASSES, SimConfig
+
+_BIKE = VEHICLE_CLASSES.index("bike")
+
+
+@dataclass(frozen=True)
+class QueueView:
+    # Uncrossed vehicles per (approach, lane, class); read-only
+    counts: np.ndarray
+    # Seconds already spent waiting by the vehicles still queued, per approach; read-only
+    waits: np.ndarray
+    current_green: int
+    next_green: int
+    time_elapsed: int
+    config: SimConfig
+
+    @property
+    def queue_lengths(self) -> np.ndarray:
+        return self.counts.sum(axis=(1, 2))
+
+    def workload(self) -> np.ndarray:
+        """Seconds of green each approach needs under setTime()'s pass times."""
+        pass_times = np.array([self.config.pass_times[name] for name in VEHICLE_CLASSES])
+        per_class = self.counts[:, 1:].sum(axis=1)
+        # setTime() counts everything in lane 0 as bikes
+        per_class[:, _BIKE] += self.counts[:, 0].sum(axis=1)
+        return per_class @ pass_times
+
+
+@dataclass(frozen=True)
+class PhaseDecision:
+    phase: int
+    green: int
+
+
+def formula_green(view: QueueView, phase: int) -> int:
+    config = view.config
+    green = math.ceil(float(view.workload()[phase]) / (config.no_of_lanes + 1))
+    return min(max(green, config.min_green), config.max_green)
+
+
+class SignalPolicy:
+    name = "policy"
+
+    def decide(self, view: QueueView) -> PhaseDecision:
+        raise NotImplementedError
+
+
+class FixedTimePolicy(SignalPolicy):
+    name = "fixed"
+
+    def __init__(self, green: Optional[int] = None):
+        self.green = green
+
+    def decide(self, view: QueueView) -> PhaseDecision:
+        green = self.green if self.green is not None else view.config.default_green
+        return PhaseDecision(view.next_green, green)
+
+
+class AdaptiveFormulaPolicy(SignalPolicy):
+    """The weighted-count rule from setTime() with the fixed cyclic phase order."""
+
+    name = "adaptive"
+
+    def decide(self, view: QueueView) -> PhaseDecision:
+        return PhaseDecision(view.next_green, formula_green(view, view.next_green))
+
+
+class _AcyclicPolicy(SignalPolicy):
+    # Picks any approach other than the one currently green, sized by the setTime() formula.
+
+    def scores(self, view: QueueView) -> np.ndarray:
+        raise NotImplementedError
+
+    def decide(self, view: QueueView) -> PhaseDecision:
+        scores = np.asarray(self.scores(view), dtype=np.float64).copy()
+        scores[view.current_green] = -np.inf
+        if not np.isfinite(scores).any() or scores.max() <= 0:
+            phase = view.next_green
+        else:
+            phase = int(np.argmax(scores))
+        return PhaseDecision(phase, formula_green(view, phase))
+
+
+class MaxPressurePolicy(_AcyclicPolicy):
+    """Serves the approach with the most pending work.
+
+    Every movement discharges into an empty exit road at this junction, so the
+    pressure of an approach reduces to its queued workload.
+    """
+
+    name = "max-pressure"
+
+    def scores(self, view: QueueView) -> np.ndarray:
+        return view.workload()
+
+
+class LongestQueueFirstPolicy(_AcyclicPolicy):
+    name = "longest-queue"
+
+    def scores(self, view: QueueView) -> np.ndarray:
+        return view.queue_lengths
+
+
+class OldestWaitFirstPolicy(_AcyclicPolicy):
+    name = "oldest-wait"
+
+    def scores(self, view: QueueView) -> np.ndarray:
+        return view.waits
+
+
+POLICIES: Dict[str, Type[SignalPolicy]] = {
+    policy.name: policy
+    for policy in (
+        FixedTimePolicy,
+        AdaptiveFormulaPolicy,
+        MaxPressurePolicy,
+        LongestQueueFirstPolicy,
+        OldestWaitFirstPolicy,
+    )
+}
+
+
+def make_policy(name: str) -> SignalPolicy:
+    try:
+        return POLICIES[name]()
+    except KeyError:
+        raise ValueError(f"unknown policy {name!r}; choose from {', '.join(POLICIES)}") from None
+
@@ -0,0 +1,314 @@
+"""Per-vehicle trajectory recording to a chunked, compressed column file.
+
+Rows (one per vehicle per recorded frame) are appended into preallocated
+column buffers.  A full buffer is handed to a background thread that
+zlib-compresses each column and appends the chunk to the file, while
+recording carries on in a spare buffer.  The file ends with a JSON index of
+the chunks and their frame, time and vehicle-id ranges, so
+:class:`TrajectoryReader` can memory-map the file and decompress only the
+chunks a time window or a vehicle touches.
+
+    recorder = TrajectoryRecorder("run.traj")
+    engine.recorder = recorder
+    engine.run()
+    recorder.close()
+    TrajectoryReader("run.traj").vehicle(42)["speed"]
+
+simulation.py records the same file when started with ``SIM_TRAJECTORY=run.traj``.
+"""
+from __future__ import annotations
+
+import json
+import mmap
+import queue
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from .engine import Engine
+
+MAGIC = b"SIMTRAJ1"
+_FOOTER = struct.Struct("<Q8s")
+
+COLUMNS: Tuple[Tuple[str, Any], ...] = (
+    ("frame", np.int64),
+    ("time", np.float32),
+    ("vehicle", np.int32),
+    ("x", np.float32),
+    ("y", np.float32),
+    ("speed", np.float32),
+    ("direction", np.int8),
+    ("lane", np.int8),
+    ("vclass", np.int8),
+    ("flags", np.uint8),
+)
+
+FLAG_CROSSED = 1
+FLAG_TURNED = 2
+FLAG_WILL_TURN = 4
+
+Columns = Dict[str, np.ndarray]
+
+
+def _empty(rows: int) -> Columns:
+    return {name: np.empty(rows, dtype=dtype) for name, dtype in COLUMNS}
+
+
+class TrajectoryRecorder:
+    """Write trajectories to ``path``; ``every`` records one frame in that many."""
+
+    def __init__(self, path: str, chunk_rows: int = 1 << 16, every: int = 1, level: int = 6, buffers: int = 3):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.every = max(1, every)
+        self.level = level
+        self.rows = 0
+
+        self._handle = open(path, "wb")
+        self._handle.write(MAGIC)
+        self._index: List[Dict[str, Any]] = []
+        self._free: "queue.Queue[Columns]" = queue.Queue()
+        for _ in range(max(2, buffers)):
+            self._free.put(_empty(chunk_rows))
+        self._pending: "queue.Queue[Optional[Tuple[Columns, int]]]" = queue.Queue()
+        self._buffer = self._free.get()
+        self._fill = 0
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        # Last recorded position of each vehicle id, for the speed column
+        self._last_x = np.zeros(0, dtype=np.float64)
+        self._last_y = np.zeros(0, dtype=np.float64)
+        self._last_frame = np.zeros(0, dtype=np.int64)
+
+        self._writer = threading.Thread(name="trajectory-writer", target=self._write_chunks, daemon=True)
+        self._writer.start()
+
+    def __enter__(self) -> "TrajectoryRecorder":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    # --------------------------------------------------------------- recording
+    def record(self, engine: "Engine") -> None:
+        if engine.frame % self.every:
+            return
+        idx = np.flatnonzero(engine.active[: engine.count])
+        x0, y0, x1, y1 = engine.boxes(idx)
+        direction = engine.direction[idx]
+        will_turn = engine.will_turn[idx]
+        turned = will_turn & (engine.pos[idx] > engine._mid[direction])
+        flags = engine.crossed[idx] * FLAG_CROSSED | turned * FLAG_TURNED | will_turn * FLAG_WILL_TURN
+        self.append(
+            engine.frame,
+            engine.now,
+            idx,
+            (x0 + x1) / 2,
+            (y0 + y1) / 2,
+            direction,
+            engine.lane[idx],
+            engine.vclass[idx],
+            flags,
+        )
+
+    def append(
+        self,
+        frame: int,
+        time: float,
+        vehicle: np.ndarray,
+        x: np.ndarray,
+        y: np.ndarray,
+        direction: np.ndarray,
+        lane: np.ndarray,
+        vclass: np.ndarray,
+        flags: np.ndarray,
+    ) -> None:
+        """Add one frame; speed is the distance moved per frame since the vehicle was last recorded."""
+        if self._error is not None:
+            raise RuntimeError("trajectory writer failed") from self._error
+        vehicle = np.asarray(vehicle, dtype=np.int64)
+        if not vehicle.size:
+            return
+        speed = self._speeds(frame, vehicle, np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+        rows = {
+            "frame": frame,
+            "time": time,
+            "vehicle": vehicle,
+            "x": x,
+            "y": y,
+            "speed": speed,
+            "direction": direction,
+            "lane": lane,
+            "vclass": vclass,
+            "flags": flags,
+        }
+        start = 0
+        while start < vehicle.size:
+            take = min(vehicle.size - start, self.chunk_rows - self._fill)
+            for name, values in rows.items():
+                column = self._buffer[name]
+                if np.ndim(values):
+                    column[self._fill : self._fill + take] = values[start : start + take]
+                else:
+                    column[self._fill : self._fill + take] = values
+            self._fill += take
+            start += take
+            if self._fill == self.chunk_rows:
+                self._hand_off()
+        self.rows += vehicle.size
+
+    def _speeds(self, frame: int, vehicle: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        needed = int(vehicle.max()) + 1
+        if needed > self._last_x.size:
+            size = max(needed, 2 * self._last_x.size)
+            self._last_x = np.resize(self._last_x, size)
+            self._last_y = np.resize(self._last_y, size)
+            grown = np.full(size, -1, dtype=np.int64)
+            grown[: self._last_frame.size] = self._last_frame
+            self._last_frame = grown
+        previous = self._last_frame[vehicle]
+        seen = previous >= 0
+        elapsed = np.maximum(frame - previous, 1)
+        speed = np.where(seen, np.hypot(x - self._last_x[vehicle], y - self._last_y[vehicle]) / elapsed, 0.0)
+        self._last_x[vehicle] = x
+        self._last_y[vehicle] = y
+        self._last_frame[vehicle] = frame
+        return speed
+
+    def _hand_off(self) -> None:
+        self._pending.put((self._buffer, self._fill))
+        self._buffer = self._free.get()
+        self._fill = 0
+
+    # ----------------------------------------------------------------- writing
+    def _write_chunks(self) -> None:
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            buffer, rows = item
+            try:
+                if self._error is None:
+                    self._write_chunk(buffer, rows)
+            except BaseException as exc:  # surfaced to the recording thread on its next call
+                self._error = exc
+            finally:
+                self._free.put(buffer)
+
+    def _write_chunk(self, buffer: Columns, rows: int) -> None:
+        entry: Dict[str, Any] = {
+            "offset": self._handle.tell(),
+            "rows": rows,
+            "frame": [int(buffer["frame"][0]), int(buffer["frame"][rows - 1])],
+            "time": [float(buffer["time"][0]), float(buffer["time"][rows - 1])],
+            "vehicle": [int(buffer["vehicle"][:rows].min()), int(buffer["vehicle"][:rows].max())],
+            "sizes": [],
+        }
+        for name, _ in COLUMNS:
+            payload = zlib.compress(buffer[name][:rows].tobytes(), self.level)
+            self._handle.write(payload)
+            entry["sizes"].append(len(payload))
+        self._index.append(entry)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._fill:
+            self._pending.put((self._buffer, self._fill))
+        self._pending.put(None)
+        self._writer.join()
+        try:
+            if self._error is None:
+                footer_offset = self._handle.tell()
+                columns = [[name, np.dtype(dtype).str] for name, dtype in COLUMNS]
+                self._handle.write(json.dumps({"columns": columns, "chunks": self._index}).encode("utf-8"))
+                self._handle.write(_FOOTER.pack(footer_offset, MAGIC))
+        finally:
+            self._handle.close()
+        if self._error is not None:
+            raise RuntimeError("trajectory writer failed") from self._error
+
+
+class TrajectoryReader:
+    """Memory-mapped access to a file written by :class:`TrajectoryRecorder`."""
+
+    def __init__(self, path: str, cached_chunks: int = 8):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        footer_offset, magic = _FOOTER.unpack_from(self._map, len(self._map) - _FOOTER.size)
+        if magic != MAGIC or self._map[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a trajectory file")
+        meta = json.loads(self._map[footer_offset : len(self._map) - _FOOTER.size].decode("utf-8"))
+        self.dtypes = {name: np.dtype(dtype) for name, dtype in meta["columns"]}
+        self.chunks: List[Dict[str, Any]] = meta["chunks"]
+        self._cache: "OrderedDict[int, Columns]" = OrderedDict()
+        self._cached_chunks = cached_chunks
+
+    def __len__(self) -> int:
+        return sum(chunk["rows"] for chunk in self.chunks)
+
+    def close(self) -> None:
+        self._cache.clear()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> "TrajectoryReader":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def chunk(self, number: int) -> Columns:
+        if number in self._cache:
+            self._cache.move_to_end(number)
+            return self._cache[number]
+        entry = self.chunks[number]
+        view = memoryview(self._map)
+        offset = entry["offset"]
+        columns: Columns = {}
+        try:
+            for (name, dtype), size in zip(self.dtypes.items(), entry["sizes"]):
+                columns[name] = np.frombuffer(zlib.decompress(view[offset : offset + size]), dtype=dtype)
+                offset += size
+        finally:
+            view.release()
+        self._cache[number] = columns
+        if len(self._cache) > self._cached_chunks:
+            self._cache.popitem(last=False)
+        return columns
+
+    def _gather(self, numbers: List[int], select) -> Columns:
+        parts = [select(self.chunk(number)) for number in numbers]
+        if not parts:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in self.dtypes.items()}
+        return {name: np.concatenate([part[name] for part in parts]) for name in self.dtypes}
+
+    def window(self, start: float, stop: float) -> Columns:
+        """Rows recorded at simulated times ``start <= time < stop``."""
+        numbers = [k for k, chunk in enumerate(self.chunks) if chunk["time"][0] < stop and chunk["time"][1] >= start]
+
+        def select(columns: Columns) -> Columns:
+            times = columns["time"]
+            lo, hi = np.searchsorted(times, start, side="left"), np.searchsorted(times, stop, side="left")
+            return {name: values[lo:hi] for name, values in columns.items()}
+
+        return self._gather(numbers, select)
+
+    def vehicle(self, vehicle_id: int) -> Columns:
+        """Every recorded row of one vehicle, in frame order."""
+        numbers = [k for k, chunk in enumerate(self.chunks) if chunk["vehicle"][0] <= vehicle_id <= chunk["vehicle"][1]]
+
+        def select(columns: Columns) -> Columns:
+            mask = columns["vehicle"] == vehicle_id
+            return {name: values[mask] for name, values in columns.items()}
+
+        return self._gather(numbers, select)
+
+    def read(self) -> Columns:
+        return self._gather(list(range(len(self.chunks))), lambda columns: columns)
@@ -0,0 +1,91 @@
+"""Draw headless engine state with the sprites simulation.py uses.
+
+Works without a window: everything is drawn onto an off-screen Surface, so
+frames can be produced under ``SDL_VIDEODRIVER=dummy`` or in worker processes.
+"""
+from __future__ import annotations
+
+import os
+import pathlib
+from typing import Dict, Optional, Tuple
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import numpy as np
+import pygame
+
+from .config import DIRECTIONS, TURN_DIRECTIONS, VEHICLE_CLASSES
+
+BASE_DIR = pathlib.Path(__file__).resolve().parent.parent
+IMAGES_DIR = BASE_DIR / "images"
+
+SCREEN_SIZE: Tuple[int, int] = (1300, 680)
+
+# Coordinates of signal images, as signalCoods in simulation.py
+SIGNAL_COORDS = [(530, 230), (810, 230), (810, 570), (530, 570)]
+
+
+class SceneRenderer:
+    def __init__(
+        self,
+        size: Tuple[int, int] = SCREEN_SIZE,
+        background: str = "mod_int.png",
+        draw_signals: bool = True,
+    ):
+        self.surface = pygame.Surface(size)
+        self.background = pygame.image.load(str(IMAGES_DIR / background))
+        self.draw_signals = draw_signals
+        self.signal_images = {
+            name: pygame.image.load(str(IMAGES_DIR / "signals" / f"{name}.png")) for name in ("red", "yellow", "green")
+        }
+        # sprites[direction][class]; a turned vehicle is drawn with the sprite of the way it now faces
+        self.sprites = [
+            [pygame.image.load(str(IMAGES_DIR / direction / f"{name}.png")) for name in VEHICLE_CLASSES]
+            for direction in DIRECTIONS
+        ]
+        self._facing_after_turn = np.array([DIRECTIONS.index(TURN_DIRECTIONS[name]) for name in DIRECTIONS])
+
+    def draw(self, engine, surface: Optional[pygame.Surface] = None) -> pygame.Surface:
+        target = surface or self.surface
+        target.blit(self.background, (0, 0))
+        if self.draw_signals:
+            for number, coords in enumerate(SIGNAL_COORDS):
+                target.blit(self.signal_images[self._signal_state(engine, number)], coords)
+
+        idx = np.flatnonzero(engine.active[: engine.count])
+        if idx.size:
+            x0, y0, _, _ = engine.boxes(idx)
+            direction = engine.direction[idx]
+            turned = engine.will_turn[idx] & (engine.pos[idx] > engine._mid[direction])
+            facing = np.where(turned, self._facing_after_turn[direction], direction)
+            vclass = engine.vclass[idx]
+            sprites = self.sprites
+            target.blits(
+                [
+                    (sprites[f][c], (x, y))
+                    for f, c, x, y in zip(facing.tolist(), vclass.tolist(), x0.tolist(), y0.tolist())
+                ],
+                doreturn=False,
+            )
+        return target
+
+    @staticmethod
+    def _signal_state(engine, number: int) -> str:
+        if number != engine.current_green:
+            return "red"
+        return "yellow" if engine.current_yellow else "green"
+
+    def visible_boxes(self, engine) -> Dict[str, np.ndarray]:
+        """Active vehicles whose bounding box is at least partly on this surface, clipped to it."""
+        idx = np.flatnonzero(engine.active[: engine.count])
+        x0, y0, x1, y1 = engine.boxes(idx)
+        width, height = self.surface.get_size()
+        visible = (x1 > 0) & (y1 > 0) & (x0 < width) & (y0 < height)
+        return {
+            "index": idx[visible],
+            "vclass": engine.vclass[idx[visible]],
+            "x0": np.clip(x0[visible], 0, width),
+            "y0": np.clip(y0[visible], 0, height),
+            "x1": np.clip(x1[visible], 0, width),
+            "y1": np.clip(y1[visible], 0, height),
+        }
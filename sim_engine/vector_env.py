@@ -0,0 +1,170 @@
+"""Vectorised reinforcement-learning environment over many headless intersections.
+
+Each of the ``num_envs`` intersections is reduced to the quantities setTime()
+works with: uncrossed vehicles per (approach, lane, class).  All intersections
+advance in lock-step with array operations, one decision per step:
+
+* action: the approach (0-3, ``DIRECTIONS`` order) to serve next.  Keeping the
+  current approach extends its green; switching costs ``default_yellow``
+  seconds of lost time at the start of the step.
+* observation: the flattened queue counts followed by a one-hot of the
+  approach that is green.
+* reward: vehicles discharged minus ``delay_weight`` times the
+  vehicle-seconds spent queueing during the step.
+
+Arrivals follow generateVehicles() in simulation.py (one vehicle every
+``spawn_interval`` seconds, same class, lane and direction mix), and a green
+approach discharges ``no_of_lanes + 1`` seconds of pass-time work per second,
+which is exactly the rate the setTime() formula assumes.
+
+gymnasium is optional: with it installed this is a ``gymnasium.vector.VectorEnv``
+with proper spaces and same-step autoreset; without it the class keeps the
+same reset()/step() contract.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from .config import DIRECTIONS, LANES_PER_APPROACH, VEHICLE_CLASSES, SimConfig
+
+try:
+    import gymnasium
+    from gymnasium import spaces
+    from gymnasium.vector import AutoresetMode
+
+    _VectorEnvBase: Any = gymnasium.vector.VectorEnv
+except ImportError:  # gymnasium is optional
+    gymnasium = None
+    _VectorEnvBase = object
+
+_APPROACHES = len(DIRECTIONS)
+_CELLS = _APPROACHES * LANES_PER_APPROACH * len(VEHICLE_CLASSES)
+
+
+def arrival_probabilities(config: SimConfig) -> np.ndarray:
+    """Probability of a spawned vehicle landing in each (approach, lane, class) cell."""
+    classes = len(VEHICLE_CLASSES)
+    bike = VEHICLE_CLASSES.index("bike")
+    weights = np.asarray(config.direction_weights, dtype=np.float64)
+    direction = weights / weights.sum()
+    lane_class = np.zeros((LANES_PER_APPROACH, classes))
+    lane_class[0, bike] = 1.0 / classes
+    for vclass in range(classes):
+        if vclass != bike:
+            lane_class[1:, vclass] = 1.0 / classes / (LANES_PER_APPROACH - 1)
+    return (direction[:, None, None] * lane_class[None]).reshape(-1)
+
+
+class TrafficVectorEnv(_VectorEnvBase):
+    metadata: Dict[str, Any] = {"render_modes": []}
+    if gymnasium is not None:
+        metadata["autoreset_mode"] = AutoresetMode.SAME_STEP
+
+    def __init__(
+        self,
+        num_envs: int = 64,
+        config: Optional[SimConfig] = None,
+        decision_interval: Optional[int] = None,
+        delay_weight: float = 0.02,
+        seed: Optional[int] = None,
+    ):
+        self.num_envs = num_envs
+        self.config = config or SimConfig()
+        self.decision_interval = decision_interval or self.config.min_green
+        self.delay_weight = delay_weight
+        self.np_random = np.random.default_rng(seed)
+
+        self._arrival_p = arrival_probabilities(self.config)
+        pass_times = np.array([self.config.pass_times[name] for name in VEHICLE_CLASSES])
+        self._cell_pass_time = np.broadcast_to(pass_times, (_APPROACHES, LANES_PER_APPROACH, len(VEHICLE_CLASSES)))
+        self._capacity = float(self.config.no_of_lanes + 1)
+        self._arrival_rate = 1.0 / self.config.spawn_interval
+
+        self.queues = np.zeros((num_envs, _APPROACHES, LANES_PER_APPROACH, len(VEHICLE_CLASSES)))
+        self.current_green = np.zeros(num_envs, dtype=np.int64)
+        self.elapsed = np.zeros(num_envs, dtype=np.int64)
+        self.spawn_clock = np.zeros(num_envs)
+
+        obs_size = _CELLS + _APPROACHES
+        if gymnasium is not None:
+            self.single_observation_space = spaces.Box(0.0, np.inf, shape=(obs_size,), dtype=np.float32)
+            self.single_action_space = spaces.Discrete(_APPROACHES)
+            self.observation_space = spaces.Box(0.0, np.inf, shape=(num_envs, obs_size), dtype=np.float32)
+            self.action_space = spaces.MultiDiscrete(np.full(num_envs, _APPROACHES))
+
+    # ------------------------------------------------------------------- api
+    def reset(
+        self,
+        *,
+        seed: Optional[int] = None,
+        options: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[np.ndarray, Dict[str, Any]]:
+        if seed is not None:
+            self.np_random = np.random.default_rng(seed)
+        self._reset_envs(np.ones(self.num_envs, dtype=bool))
+        return self._observe(), {}
+
+    def step(self, actions: Any) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, Dict[str, Any]]:
+        actions = np.asarray(actions, dtype=np.int64).reshape(self.num_envs)
+        if actions.min() < 0 or actions.max() >= _APPROACHES:
+            raise ValueError(f"actions must be approach numbers in [0, {_APPROACHES})")
+
+        switching = actions != self.current_green
+        lost = np.where(switching, self.config.default_yellow, 0)
+        self.current_green = actions
+
+        served_total = np.zeros(self.num_envs)
+        queued_seconds = np.zeros(self.num_envs)
+        green_mask = np.eye(_APPROACHES, dtype=bool)[actions][:, :, None, None]
+        for second in range(self.decision_interval):
+            self._arrive()
+            queued_seconds += self.queues.sum(axis=(1, 2, 3))
+            serving = (second >= lost)[:, None, None, None] & green_mask
+            served_total += self._discharge(serving)
+        self.elapsed += self.decision_interval
+
+        rewards = served_total - self.delay_weight * queued_seconds
+        terminations = np.zeros(self.num_envs, dtype=bool)
+        truncations = self.elapsed >= self.config.sim_time
+        infos: Dict[str, Any] = {"served": served_total, "queued_seconds": queued_seconds}
+
+        if truncations.any():
+            infos["final_obs"] = self._observe()
+            infos["_final_obs"] = truncations.copy()
+            infos["final_info"] = {"elapsed": self.elapsed.copy(), "_elapsed": truncations.copy()}
+            self._reset_envs(truncations)
+        return self._observe(), rewards.astype(np.float32), terminations, truncations, infos
+
+    def close(self, **kwargs: Any) -> None:
+        pass
+
+    # ------------------------------------------------------------- internals
+    def _reset_envs(self, mask: np.ndarray) -> None:
+        self.queues[mask] = 0.0
+        self.current_green[mask] = 0
+        self.elapsed[mask] = 0
+        self.spawn_clock[mask] = 0.0
+
+    def _arrive(self) -> None:
+        # Whole vehicles only: carry the fractional part of the spawn rate over
+        self.spawn_clock += self._arrival_rate
+        arrivals = np.floor(self.spawn_clock).astype(np.int64)
+        self.spawn_clock -= arrivals
+        cells = self.np_random.multinomial(arrivals, self._arrival_p)
+        self.queues += cells.reshape(self.queues.shape)
+
+    def _discharge(self, serving: np.ndarray) -> np.ndarray:
+        # Fluid discharge: the green approach clears `capacity` seconds of pass-time work per second
+        workload = (self.queues * self._cell_pass_time * serving).sum(axis=(1, 2, 3))
+        fraction = np.minimum(1.0, self._capacity / np.maximum(workload, 1e-9))
+        served = self.queues * serving * fraction[:, None, None, None]
+        self.queues -= served
+        return served.sum(axis=(1, 2, 3))
+
+    def _observe(self) -> np.ndarray:
+        obs = np.empty((self.num_envs, _CELLS + _APPROACHES), dtype=np.float32)
+        obs[:, :_CELLS] = self.queues.reshape(self.num_envs, _CELLS)
+        obs[:, _CELLS:] = np.eye(_APPROACHES, dtype=np.float32)[self.current_green]
+        return obs
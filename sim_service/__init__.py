@@ -0,0 +1,3 @@
+"""Job scheduling and bookkeeping behind the web dashboard's simulation runs."""
+from .history import RunHistory
+from .jobs import Job, JobQueue, Rejected
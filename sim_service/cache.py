@@ -0,0 +1,51 @@
+"""Keys for memoising seeded simulation runs.
+
+A run with a seed is identified by its parameters, the seed, the scenario
+file and a hash of the simulation code, so editing simulation.py, the
+sim_engine package or the scenario invalidates earlier results.
+Finished runs are looked up by key in :class:`~sim_service.history.RunHistory`;
+:class:`InFlight` remembers which run is currently computing each key so that
+identical requests arriving meanwhile attach to it instead of starting
+another process.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+
+def code_version(paths: Iterable[str]) -> str:
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as handle:
+            digest.update(handle.read())
+    return digest.hexdigest()[:16]
+
+
+def run_key(params: Dict[str, Any], version: str) -> str:
+    blob = json.dumps({"params": params, "version": version}, sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class InFlight:
+    """Run id currently computing each key."""
+
+    def __init__(self):
+        self._runs: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key: str, run_id: str) -> str:
+        """Register ``run_id`` for ``key`` unless another run holds it; returns the run that does."""
+        with self._lock:
+            return self._runs.setdefault(key, run_id)
+
+    def release(self, key: str, run_id: str) -> None:
+        with self._lock:
+            if self._runs.get(key) == run_id:
+                del self._runs[key]
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._runs.get(key)
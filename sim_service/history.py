@@ -0,0 +1,182 @@
+"""Finished dashboard runs kept in SQLite so they survive restarts and can be queried.
+
+Parameters and headline stats are plain columns, indexed for the filters the
+history endpoints offer; lane details and the full stats dict are stored as
+JSON next to them.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+PARAM_COLUMNS: Tuple[str, ...] = ("sim_time", "min_green", "max_green")
+STAT_COLUMNS: Tuple[str, ...] = ("total_vehicles", "total_time", "throughput", "average_wait", "traffic_density")
+SORT_ORDERS: Dict[str, str] = {
+    "newest": "submitted_at DESC",
+    "oldest": "submitted_at ASC",
+    "throughput": "throughput DESC, submitted_at DESC",
+    "wait": "average_wait ASC, submitted_at DESC",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    client TEXT,
+    sim_time INTEGER,
+    min_green INTEGER,
+    max_green INTEGER,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    total_vehicles INTEGER,
+    total_time INTEGER,
+    throughput REAL,
+    average_wait REAL,
+    traffic_density REAL,
+    params TEXT NOT NULL,
+    stats TEXT NOT NULL,
+    cache_key TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_params ON runs (sim_time, min_green, max_green, submitted_at);
+CREATE INDEX IF NOT EXISTS runs_submitted ON runs (submitted_at);
+CREATE INDEX IF NOT EXISTS runs_finished ON runs (finished_at);
+CREATE INDEX IF NOT EXISTS runs_status ON runs (status, submitted_at);
+CREATE INDEX IF NOT EXISTS runs_cache_key ON runs (cache_key, status);
+"""
+
+
+class RunHistory:
+    def __init__(self, path: str):
+        self.path = path
+        # One connection shared by the request and worker threads, serialised by the lock
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            if path != ":memory:":
+                self._connection.execute("PRAGMA journal_mode=WAL")
+            # Databases written before cache keys were stored gain the column first
+            self._connection.execute(_SCHEMA.split(";")[0])
+            columns = {row["name"] for row in self._connection.execute("PRAGMA table_info(runs)")}
+            if "cache_key" not in columns:
+                self._connection.execute("ALTER TABLE runs ADD COLUMN cache_key TEXT")
+            self._connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def record(self, run: Dict[str, Any]) -> None:
+        """Insert or replace a run given as ``run_id``, ``status``, ``client``, ``params``, ``stats`` and timestamps."""
+        params, stats = run.get("params", {}), run.get("stats", {})
+        row = {
+            "run_id": run["run_id"],
+            "status": run["status"],
+            "client": run.get("client"),
+            "submitted_at": run["submitted_at"],
+            "started_at": run.get("started_at"),
+            "finished_at": run.get("finished_at"),
+            "params": json.dumps(params, sort_keys=True),
+            "stats": json.dumps(stats, sort_keys=True),
+            "cache_key": run.get("cache_key"),
+        }
+        row.update({name: params.get(name) for name in PARAM_COLUMNS})
+        row.update({name: stats.get(name) for name in STAT_COLUMNS})
+        columns = ", ".join(row)
+        placeholders = ", ".join(f":{name}" for name in row)
+        with self._lock, self._connection:
+            self._connection.execute(f"INSERT OR REPLACE INTO runs ({columns}) VALUES ({placeholders})", row)
+
+    def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connection.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        return _to_dict(row) if row else None
+
+    def find_cached(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Most recent run that finished normally under ``cache_key``."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT * FROM runs WHERE cache_key = ? AND status = 'finished' ORDER BY finished_at DESC LIMIT 1",
+                (cache_key,),
+            ).fetchone()
+        return _to_dict(row) if row else None
+
+    def query(
+        self,
+        filters: Optional[Dict[str, Any]] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        order: str = "newest",
+        limit: int = 20,
+        offset: int = 0,
+    ) -> Dict[str, Any]:
+        """Page of runs matching exact parameter/status ``filters`` and a submit-time window."""
+        clauses, values = [], []
+        for name, value in (filters or {}).items():
+            if name not in PARAM_COLUMNS and name != "status":
+                raise ValueError(f"cannot filter on {name!r}")
+            clauses.append(f"{name} = ?")
+            values.append(value)
+        if since is not None:
+            clauses.append("submitted_at >= ?")
+            values.append(since)
+        if until is not None:
+            clauses.append("submitted_at < ?")
+            values.append(until)
+        if order not in SORT_ORDERS:
+            raise ValueError(f"unknown order {order!r}, expected one of {sorted(SORT_ORDERS)}")
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        limit = max(1, min(int(limit), 200))
+        offset = max(0, int(offset))
+
+        with self._lock:
+            total = self._connection.execute(f"SELECT COUNT(*) FROM runs {where}", values).fetchone()[0]
+            rows = self._connection.execute(
+                f"SELECT * FROM runs {where} ORDER BY {SORT_ORDERS[order]} LIMIT ? OFFSET ?",
+                [*values, limit, offset],
+            ).fetchall()
+        return {
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "next_offset": offset + limit if offset + limit < total else None,
+            "items": [_to_dict(row) for row in rows],
+        }
+
+    def compare(self, run_ids: Sequence[str]) -> Dict[str, Any]:
+        """Runs side by side, with each headline stat's difference from the first run."""
+        placeholders = ", ".join("?" for _ in run_ids)
+        with self._lock:
+            rows = self._connection.execute(f"SELECT * FROM runs WHERE run_id IN ({placeholders})", list(run_ids)).fetchall()
+        found = {row["run_id"]: _to_dict(row) for row in rows}
+        ordered = [found[run_id] for run_id in run_ids if run_id in found]
+        if not ordered:
+            return {"baseline": None, "runs": [], "missing": list(run_ids)}
+
+        baseline = ordered[0]["stats"]
+        for run in ordered:
+            run["delta"] = {
+                name: round((run["stats"].get(name) or 0) - (baseline.get(name) or 0), 3) for name in STAT_COLUMNS
+            }
+        return {
+            "baseline": ordered[0]["run_id"],
+            "runs": ordered,
+            "missing": [run_id for run_id in run_ids if run_id not in found],
+        }
+
+
+def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "run_id": row["run_id"],
+        "status": row["status"],
+        "params": json.loads(row["params"]),
+        "stats": json.loads(row["stats"]),
+        "timings": {
+            "submitted_at": row["submitted_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+        },
+    }
@@ -0,0 +1,157 @@
+"""Bounded queue of simulation jobs run by a fixed pool of worker threads.
+
+Admission is decided on submit: a client that already has ``per_client``
+jobs queued or running, or a queue already holding ``max_queued`` jobs, is
+turned away with :class:`Rejected`.  Its ``retry_after`` is the time until
+the earliest running job that would make room is expected to finish, taken
+from the ``estimate`` each job is submitted with.  At most ``workers`` jobs
+run at once, so the number of simulation processes stays bounded however
+many requests arrive.
+"""
+from __future__ import annotations
+
+import logging
+import math
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Rejected(Exception):
+    """Raised by :meth:`JobQueue.submit` when a job is not admitted."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class Job:
+    job_id: str
+    client: str
+    target: Callable[[], None]
+    estimate: float = 60.0  # expected run time in seconds
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.finished_at is not None:
+            return "finished"
+        return "running" if self.started_at is not None else "queued"
+
+
+class JobQueue:
+    def __init__(self, workers: int = 2, max_queued: int = 8, per_client: int = 2):
+        self.workers = max(1, workers)
+        self.max_queued = max(0, max_queued)
+        self.per_client = max(1, per_client)
+        self._queued: Deque[Job] = deque()
+        self._running: Dict[str, Job] = {}
+        self._client_jobs: Dict[str, int] = {}
+        self._condition = threading.Condition()
+        self._closed = False
+        self._threads = [
+            threading.Thread(name=f"simulation-worker-{n}", target=self._work, daemon=True)
+            for n in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, job_id: str, client: str, target: Callable[[], None], estimate: float = 60.0) -> Job:
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("job queue has been shut down")
+            now = time.time()
+            if self._client_jobs.get(client, 0) >= self.per_client:
+                raise Rejected("too many simulations for this client", self._retry_after(now, client))
+            # Only jobs that have to wait count against the queue depth
+            idle_workers = self.workers - len(self._running) - len(self._queued)
+            if idle_workers <= 0 and len(self._queued) >= self.max_queued:
+                raise Rejected("simulation queue is full", self._retry_after(now))
+            job = Job(job_id, client, target, estimate=estimate, submitted_at=now)
+            self._queued.append(job)
+            self._client_jobs[client] = self._client_jobs.get(client, 0) + 1
+            self._condition.notify()
+            return job
+
+    def cancel(self, job_id: str) -> bool:
+        """Drop a job that has not started yet; running jobs are left to their owner to stop."""
+        with self._condition:
+            for job in self._queued:
+                if job.job_id == job_id:
+                    self._queued.remove(job)
+                    self._release(job)
+                    return True
+            return False
+
+    def position(self, job_id: str) -> Optional[int]:
+        """1-based place in the queue, or None once the job has started or left."""
+        with self._condition:
+            for number, job in enumerate(self._queued, start=1):
+                if job.job_id == job_id:
+                    return number
+            return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "workers": self.workers,
+                "running": len(self._running),
+                "queued": len(self._queued),
+                "max_queued": self.max_queued,
+                "per_client": self.per_client,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop taking jobs; queued jobs are dropped and running ones finish."""
+        with self._condition:
+            self._closed = True
+            while self._queued:
+                self._release(self._queued.popleft())
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _retry_after(self, now: float, client: Optional[str] = None) -> int:
+        running: List[Job] = list(self._running.values())
+        own = [job for job in running if job.client == client]
+        candidates = own or running
+        if not candidates:
+            return 1
+        remaining = min(job.started_at + job.estimate - now for job in candidates)
+        return max(1, int(math.ceil(remaining)))
+
+    def _release(self, job: Job) -> None:
+        left = self._client_jobs.get(job.client, 0) - 1
+        if left > 0:
+            self._client_jobs[job.client] = left
+        else:
+            self._client_jobs.pop(job.client, None)
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                while not self._queued and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                job = self._queued.popleft()
+                job.started_at = time.time()
+                self._running[job.job_id] = job
+            try:
+                job.target()
+            except Exception:
+                LOGGER.exception("simulation job %s failed", job.job_id)
+            finally:
+                with self._condition:
+                    job.finished_at = time.time()
+                    del self._running[job.job_id]
+                    self._release(job)
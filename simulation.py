@@ -5,6 +5,8 @@ import threading
 import pygame
 import sys
 import os
+import json
+import signal
 
 
 # Default values of signal times
@@ -32,6 +34,10 @@ except ValueError:
     simTime = 120
 timeElapsed = 0
 
+# SIM_SEED fixes the sequence of generated vehicles (class, lane, direction, turns)
+if os.environ.get("SIM_SEED"):
+    random.seed(int(os.environ["SIM_SEED"]))
+
 stopSimulation = False
 
 currentGreen = 0   # Indicates which signal is green
@@ -58,6 +64,48 @@ detectionTime = 5
 
 speeds = {'car':1.575, 'bus':1.26, 'truck':1.26, 'rickshaw':1.4, 'bike':1.75}  # average speeds of vehicles
 
+# Arrival pattern: one vehicle every spawnInterval seconds, direction picked by weight
+spawnInterval = 0.75
+directionWeights = [300, 300, 200, 200]
+vehicleClassWeights = None    # None picks every vehicle class with equal chance
+
+# A scenario file written by sim_engine/calibration.py replaces the values above
+scenarioPath = os.environ.get("SIM_SCENARIO")
+if scenarioPath:
+    with open(scenarioPath) as scenarioFile:
+        scenario = json.load(scenarioFile).get("config", {})
+    passTimes = scenario.get("pass_times", {})
+    carTime = passTimes.get("car", carTime)
+    busTime = passTimes.get("bus", busTime)
+    truckTime = passTimes.get("truck", truckTime)
+    rickshawTime = passTimes.get("rickshaw", rickshawTime)
+    bikeTime = passTimes.get("bike", bikeTime)
+    speeds.update(scenario.get("speeds", {}))
+    spawnInterval = scenario.get("spawn_interval", spawnInterval)
+    directionWeights = scenario.get("direction_weights", directionWeights)
+    vehicleClassWeights = scenario.get("class_weights", vehicleClassWeights)
+directionThresholds = [round(1000*sum(directionWeights[:i+1])/sum(directionWeights)) for i in range(noOfSignals)]
+
+# Per-vehicle trajectories are written to this file when SIM_TRAJECTORY is set (see sim_engine/recorder.py)
+trajectoryRecorder = None
+trajectoryPath = os.environ.get("SIM_TRAJECTORY")
+if trajectoryPath:
+    from sim_engine.recorder import TrajectoryRecorder, FLAG_CROSSED, FLAG_TURNED, FLAG_WILL_TURN
+    trajectoryRecorder = TrajectoryRecorder(trajectoryPath)
+
+# The web app stops a run with SIGTERM; end it like a finished run so the trajectory file gets its index
+def requestStop(signum, frame):
+    global stopSimulation
+    stopSimulation = True
+
+signal.signal(signal.SIGTERM, requestStop)
+
+# SIM_FRAME_STATS=1 times every frame of the render loop and prints FRAME_STATS at the end (see sim_engine/benchmark.py)
+frameTimes = [] if os.environ.get("SIM_FRAME_STATS") else None
+vehicleCount = 0
+frameCount = 0
+recordingStart = time.time()
+
 # Coordinates of start
 x = {'right':[0,0,0], 'down':[755,727,697], 'left':[1400,1400,1400], 'up':[602,627,657]}    
 y = {'right':[348,370,398], 'down':[0,0,0], 'left':[498,466,436], 'up':[800,800,800]}
@@ -84,8 +132,12 @@ rotationAngle = 3
 gap = 15    # stopping gap
 gap2 = 15   # moving gap
 
+# Screensize 
+screenWidth = 1300
+screenHeight = 680
+
 pygame.init()
-simulation = pygame.sprite.Group()
+simulation = []    # vehicles on the road, in spawn order
 
 class TrafficSignal:
     def __init__(self, red, yellow, green, minimum, maximum):
@@ -97,9 +149,47 @@ class TrafficSignal:
         self.signalText = "30"
         self.totalGreenTime = 0
         
-class Vehicle(pygame.sprite.Sprite):
+# Vehicle images are loaded once and shared by every vehicle of that class and direction,
+# and each step of a turn is rotated only once
+vehicleImages = {}
+rotatedImages = {}
+
+def loadImage(path, alpha=True):
+    # Converted to the display's pixel format once the window exists, so blits need no per-frame conversion
+    image = pygame.image.load(path)
+    if pygame.display.get_surface() is None:
+        return image
+    return image.convert_alpha() if alpha else image.convert()
+
+def vehicleImage(direction, vehicleClass):
+    key = (direction, vehicleClass)
+    if key not in vehicleImages:
+        vehicleImages[key] = loadImage("images/" + direction + "/" + vehicleClass + ".png")
+    return vehicleImages[key]
+
+def rotatedImage(direction, vehicleClass, angle):
+    key = (direction, vehicleClass, angle)
+    if key not in rotatedImages:
+        rotatedImages[key] = pygame.transform.rotate(vehicleImage(direction, vehicleClass), -angle)
+    return rotatedImages[key]
+
+# Vehicles that have left the screen wait here to be reused by the next spawn
+vehiclePool = []
+# Held while vehicles join or leave the lane lists (generateVehicles, setTime and the main loop run in different threads)
+vehicleLock = threading.Lock()
+
+class Vehicle:
+    __slots__ = ('id', 'lane', 'vehicleClass', 'speed', 'direction_number', 'direction', 'x', 'y', 'crossed',
+                 'willTurn', 'turned', 'rotateAngle', 'stop', 'leader', 'follower', 'originalImage', 'currentImage',
+                 'width', 'height')
+
     def __init__(self, lane, vehicleClass, direction_number, direction, will_turn):
-        pygame.sprite.Sprite.__init__(self)
+        self.reset(lane, vehicleClass, direction_number, direction, will_turn)
+
+    def reset(self, lane, vehicleClass, direction_number, direction, will_turn):
+        global vehicleCount
+        self.id = vehicleCount
+        vehicleCount += 1
         self.lane = lane
         self.vehicleClass = vehicleClass
         self.speed = speeds[vehicleClass]
@@ -111,101 +201,119 @@ class Vehicle(pygame.sprite.Sprite):
         self.willTurn = will_turn
         self.turned = 0
         self.rotateAngle = 0
+        # The vehicle ahead in the same lane, None once it has left the screen
+        self.leader = vehicles[direction][lane][-1] if vehicles[direction][lane] else None
+        self.follower = None
+        if self.leader is not None:
+            self.leader.follower = self
         vehicles[direction][lane].append(self)
-        # self.stop = stops[direction][lane]
-        self.index = len(vehicles[direction][lane]) - 1
-        path = "images/" + direction + "/" + vehicleClass + ".png"
-        self.originalImage = pygame.image.load(path)
-        self.currentImage = pygame.image.load(path)
+        self.originalImage = vehicleImage(direction, vehicleClass)
+        self.setImage(self.originalImage)
 
-    
         if(direction=='right'):
-            if(len(vehicles[direction][lane])>1 and vehicles[direction][lane][self.index-1].crossed==0):    # if more than 1 vehicle in the lane of vehicle before it has crossed stop line
-                self.stop = vehicles[direction][lane][self.index-1].stop - vehicles[direction][lane][self.index-1].currentImage.get_rect().width - gap         # setting stop coordinate as: stop coordinate of next vehicle - width of next vehicle - gap
+            if(self.leader is not None and self.leader.crossed==0):    # if the vehicle before it in the lane has not crossed stop line
+                self.stop = self.leader.stop - self.leader.width - gap         # setting stop coordinate as: stop coordinate of next vehicle - width of next vehicle - gap
             else:
                 self.stop = defaultStop[direction]
             # Set new starting and stopping coordinate
-            temp = self.currentImage.get_rect().width + gap    
+            temp = self.width + gap    
             x[direction][lane] -= temp
             stops[direction][lane] -= temp
         elif(direction=='left'):
-            if(len(vehicles[direction][lane])>1 and vehicles[direction][lane][self.index-1].crossed==0):
-                self.stop = vehicles[direction][lane][self.index-1].stop + vehicles[direction][lane][self.index-1].currentImage.get_rect().width + gap
+            if(self.leader is not None and self.leader.crossed==0):
+                self.stop = self.leader.stop + self.leader.width + gap
             else:
                 self.stop = defaultStop[direction]
-            temp = self.currentImage.get_rect().width + gap
+            temp = self.width + gap
             x[direction][lane] += temp
             stops[direction][lane] += temp
         elif(direction=='down'):
-            if(len(vehicles[direction][lane])>1 and vehicles[direction][lane][self.index-1].crossed==0):
-                self.stop = vehicles[direction][lane][self.index-1].stop - vehicles[direction][lane][self.index-1].currentImage.get_rect().height - gap
+            if(self.leader is not None and self.leader.crossed==0):
+                self.stop = self.leader.stop - self.leader.height - gap
             else:
                 self.stop = defaultStop[direction]
-            temp = self.currentImage.get_rect().height + gap
+            temp = self.height + gap
             y[direction][lane] -= temp
             stops[direction][lane] -= temp
         elif(direction=='up'):
-            if(len(vehicles[direction][lane])>1 and vehicles[direction][lane][self.index-1].crossed==0):
-                self.stop = vehicles[direction][lane][self.index-1].stop + vehicles[direction][lane][self.index-1].currentImage.get_rect().height + gap
+            if(self.leader is not None and self.leader.crossed==0):
+                self.stop = self.leader.stop + self.leader.height + gap
             else:
                 self.stop = defaultStop[direction]
-            temp = self.currentImage.get_rect().height + gap
+            temp = self.height + gap
             y[direction][lane] += temp
             stops[direction][lane] += temp
-        simulation.add(self)
+        simulation.append(self)
+
+    def setImage(self, image):
+        self.currentImage = image
+        self.width, self.height = image.get_size()
+
+    def retire(self):
+        # Called with vehicleLock held once the vehicle is off screen for good; a vehicle can leave before
+        # the one ahead of it (a turner), so its follower is linked to that vehicle instead
+        if self.follower is not None:
+            self.follower.leader = self.leader
+        if self.leader is not None:
+            self.leader.follower = self.follower
+        self.leader = None
+        self.follower = None
+        vehicles[self.direction][self.lane].remove(self)
+        simulation.remove(self)
+        vehiclePool.append(self)
 
     def render(self, screen):
         screen.blit(self.currentImage, (self.x, self.y))
 
     def move(self):
         if(self.direction=='right'):
-            if(self.crossed==0 and self.x+self.currentImage.get_rect().width>stopLines[self.direction]):   # if the image has crossed stop line now
+            if(self.crossed==0 and self.x+self.width>stopLines[self.direction]):   # if the image has crossed stop line now
                 self.crossed = 1
                 vehicles[self.direction]['crossed'] += 1
                 vehicles[self.direction]['types'][self.vehicleClass] += 1
             if(self.willTurn==1):
-                if(self.crossed==0 or self.x+self.currentImage.get_rect().width<mid[self.direction]['x']):
-                    if((self.x+self.currentImage.get_rect().width<=self.stop or (currentGreen==0 and currentYellow==0) or self.crossed==1) and (self.index==0 or self.x+self.currentImage.get_rect().width<(vehicles[self.direction][self.lane][self.index-1].x - gap2) or vehicles[self.direction][self.lane][self.index-1].turned==1)):                
+                if(self.crossed==0 or self.x+self.width<mid[self.direction]['x']):
+                    if((self.x+self.width<=self.stop or (currentGreen==0 and currentYellow==0) or self.crossed==1) and (self.leader is None or self.x+self.width<(self.leader.x - gap2) or self.leader.turned==1)):                
                         self.x += self.speed
                 else:   
                     if(self.turned==0):
                         self.rotateAngle += rotationAngle
-                        self.currentImage = pygame.transform.rotate(self.originalImage, -self.rotateAngle)
+                        self.setImage(rotatedImage(self.direction, self.vehicleClass, self.rotateAngle))
                         self.x += 2
                         self.y += 1.8
                         if(self.rotateAngle==90):
                             self.turned = 1
                     else:
-                        if(self.index==0 or self.y+self.currentImage.get_rect().height<(vehicles[self.direction][self.lane][self.index-1].y - gap2) or self.x+self.currentImage.get_rect().width<(vehicles[self.direction][self.lane][self.index-1].x - gap2)):
+                        if(self.leader is None or self.y+self.height<(self.leader.y - gap2) or self.x+self.width<(self.leader.x - gap2)):
                             self.y += self.speed
             else: 
-                if((self.x+self.currentImage.get_rect().width<=self.stop or self.crossed == 1 or (currentGreen==0 and currentYellow==0)) and (self.index==0 or self.x+self.currentImage.get_rect().width<(vehicles[self.direction][self.lane][self.index-1].x - gap2) or (vehicles[self.direction][self.lane][self.index-1].turned==1))):                
+                if((self.x+self.width<=self.stop or self.crossed == 1 or (currentGreen==0 and currentYellow==0)) and (self.leader is None or self.x+self.width<(self.leader.x - gap2) or (self.leader.turned==1))):                
                 # (if the image has not reached its stop coordinate or has crossed stop line or has green signal) and (it is either the first vehicle in that lane or it is has enough gap to the next vehicle in that lane)
                     self.x += self.speed  # move the vehicle
 
 
 
         elif(self.direction=='down'):
-            if(self.crossed==0 and self.y+self.currentImage.get_rect().height>stopLines[self.direction]):
+            if(self.crossed==0 and self.y+self.height>stopLines[self.direction]):
                 self.crossed = 1
                 vehicles[self.direction]['crossed'] += 1
             if(self.willTurn==1):
-                if(self.crossed==0 or self.y+self.currentImage.get_rect().height<mid[self.direction]['y']):
-                    if((self.y+self.currentImage.get_rect().height<=self.stop or (currentGreen==1 and currentYellow==0) or self.crossed==1) and (self.index==0 or self.y+self.currentImage.get_rect().height<(vehicles[self.direction][self.lane][self.index-1].y - gap2) or vehicles[self.direction][self.lane][self.index-1].turned==1)):                
+                if(self.crossed==0 or self.y+self.height<mid[self.direction]['y']):
+                    if((self.y+self.height<=self.stop or (currentGreen==1 and currentYellow==0) or self.crossed==1) and (self.leader is None or self.y+self.height<(self.leader.y - gap2) or self.leader.turned==1)):                
                         self.y += self.speed
                 else:   
                     if(self.turned==0):
                         self.rotateAngle += rotationAngle
-                        self.currentImage = pygame.transform.rotate(self.originalImage, -self.rotateAngle)
+                        self.setImage(rotatedImage(self.direction, self.vehicleClass, self.rotateAngle))
                         self.x -= 2.5
                         self.y += 2
                         if(self.rotateAngle==90):
                             self.turned = 1
                     else:
-                        if(self.index==0 or self.x>(vehicles[self.direction][self.lane][self.index-1].x + vehicles[self.direction][self.lane][self.index-1].currentImage.get_rect().width + gap2) or self.y<(vehicles[self.direction][self.lane][self.index-1].y - gap2)):
+                        if(self.leader is None or self.x>(self.leader.x + self.leader.width + gap2) or self.y<(self.leader.y - gap2)):
                             self.x -= self.speed
             else: 
-                if((self.y+self.currentImage.get_rect().height<=self.stop or self.crossed == 1 or (currentGreen==1 and currentYellow==0)) and (self.index==0 or self.y+self.currentImage.get_rect().height<(vehicles[self.direction][self.lane][self.index-1].y - gap2) or (vehicles[self.direction][self.lane][self.index-1].turned==1))):                
+                if((self.y+self.height<=self.stop or self.crossed == 1 or (currentGreen==1 and currentYellow==0)) and (self.leader is None or self.y+self.height<(self.leader.y - gap2) or (self.leader.turned==1))):                
                     self.y += self.speed
             
         elif(self.direction=='left'):
@@ -215,21 +323,21 @@ class Vehicle(pygame.sprite.Sprite):
                 vehicles[self.direction]['types'][self.vehicleClass] += 1
             if(self.willTurn==1):
                 if(self.crossed==0 or self.x>mid[self.direction]['x']):
-                    if((self.x>=self.stop or (currentGreen==2 and currentYellow==0) or self.crossed==1) and (self.index==0 or self.x>(vehicles[self.direction][self.lane][self.index-1].x + vehicles[self.direction][self.lane][self.index-1].currentImage.get_rect().width + gap2) or vehicles[self.direction][self.lane][self.index-1].turned==1)):                
+                    if((self.x>=self.stop or (currentGreen==2 and currentYellow==0) or self.crossed==1) and (self.leader is None or self.x>(self.leader.x + self.leader.width + gap2) or self.leader.turned==1)):                
                         self.x -= self.speed
                 else: 
                     if(self.turned==0):
                         self.rotateAngle += rotationAngle
-                        self.currentImage = pygame.transform.rotate(self.originalImage, -self.rotateAngle)
+                        self.setImage(rotatedImage(self.direction, self.vehicleClass, self.rotateAngle))
                         self.x -= 1.8
                         self.y -= 2.5
                         if(self.rotateAngle==90):
                             self.turned = 1
                     else:
-                        if(self.index==0 or self.y>(vehicles[self.direction][self.lane][self.index-1].y + vehicles[self.direction][self.lane][self.index-1].currentImage.get_rect().height +  gap2) or self.x>(vehicles[self.direction][self.lane][self.index-1].x + gap2)):
+                        if(self.leader is None or self.y>(self.leader.y + self.leader.height +  gap2) or self.x>(self.leader.x + gap2)):
                             self.y -= self.speed
             else: 
-                if((self.x>=self.stop or self.crossed == 1 or (currentGreen==2 and currentYellow==0)) and (self.index==0 or self.x>(vehicles[self.direction][self.lane][self.index-1].x + vehicles[self.direction][self.lane][self.index-1].currentImage.get_rect().width + gap2) or (vehicles[self.direction][self.lane][self.index-1].turned==1))):                
+                if((self.x>=self.stop or self.crossed == 1 or (currentGreen==2 and currentYellow==0)) and (self.leader is None or self.x>(self.leader.x + self.leader.width + gap2) or (self.leader.turned==1))):                
                 # (if the image has not reached its stop coordinate or has crossed stop line or has green signal) and (it is either the first vehicle in that lane or it is has enough gap to the next vehicle in that lane)
                     self.x -= self.speed  # move the vehicle  
         elif(self.direction=='up'):
@@ -239,23 +347,45 @@ class Vehicle(pygame.sprite.Sprite):
                 vehicles[self.direction]['types'][self.vehicleClass] += 1
             if(self.willTurn==1):
                 if(self.crossed==0 or self.y>mid[self.direction]['y']):
-                    if((self.y>=self.stop or (currentGreen==3 and currentYellow==0) or self.crossed == 1) and (self.index==0 or self.y>(vehicles[self.direction][self.lane][self.index-1].y + vehicles[self.direction][self.lane][self.index-1].currentImage.get_rect().height +  gap2) or vehicles[self.direction][self.lane][self.index-1].turned==1)):
+                    if((self.y>=self.stop or (currentGreen==3 and currentYellow==0) or self.crossed == 1) and (self.leader is None or self.y>(self.leader.y + self.leader.height +  gap2) or self.leader.turned==1)):
                         self.y -= self.speed
                 else:   
                     if(self.turned==0):
                         self.rotateAngle += rotationAngle
-                        self.currentImage = pygame.transform.rotate(self.originalImage, -self.rotateAngle)
+                        self.setImage(rotatedImage(self.direction, self.vehicleClass, self.rotateAngle))
                         self.x += 1
                         self.y -= 1
                         if(self.rotateAngle==90):
                             self.turned = 1
                     else:
-                        if(self.index==0 or self.x<(vehicles[self.direction][self.lane][self.index-1].x - vehicles[self.direction][self.lane][self.index-1].currentImage.get_rect().width - gap2) or self.y>(vehicles[self.direction][self.lane][self.index-1].y + gap2)):
+                        if(self.leader is None or self.x<(self.leader.x - self.leader.width - gap2) or self.y>(self.leader.y + gap2)):
                             self.x += self.speed
             else: 
-                if((self.y>=self.stop or self.crossed == 1 or (currentGreen==3 and currentYellow==0)) and (self.index==0 or self.y>(vehicles[self.direction][self.lane][self.index-1].y + vehicles[self.direction][self.lane][self.index-1].currentImage.get_rect().height + gap2) or (vehicles[self.direction][self.lane][self.index-1].turned==1))):                
+                if((self.y>=self.stop or self.crossed == 1 or (currentGreen==3 and currentYellow==0)) and (self.leader is None or self.y>(self.leader.y + self.leader.height + gap2) or (self.leader.turned==1))):                
                     self.y -= self.speed
 
+def spawnVehicle(lane, vehicleClass, direction_number, direction, will_turn):
+    with vehicleLock:
+        if vehiclePool:
+            vehicle = vehiclePool.pop()
+            vehicle.reset(lane, vehicleClass, direction_number, direction, will_turn)
+        else:
+            vehicle = Vehicle(lane, vehicleClass, direction_number, direction, will_turn)
+    return vehicle
+
+# Rendered HUD text per slot, kept until the value shown in that slot changes
+hudTexts = {}
+
+def hudText(font, slot, value, colour, background):
+    cached = hudTexts.get(slot)
+    if cached is None or cached[0] != value:
+        cached = (value, font.render(str(value), True, colour, background))
+        hudTexts[slot] = cached
+    return cached[1]
+
+def offScreen(vehicle):
+    return vehicle.x>screenWidth or vehicle.x+vehicle.width<0 or vehicle.y>screenHeight or vehicle.y+vehicle.height<0
+
 # Initialization of signals with default values
 def initialize():
     ts1 = TrafficSignal(0, defaultYellow, defaultGreen, defaultMinimum, defaultMaximum)
@@ -274,24 +404,25 @@ def setTime():
     global carTime, busTime, truckTime, rickshawTime, bikeTime
 
     noOfCars, noOfBuses, noOfTrucks, noOfRickshaws, noOfBikes = 0,0,0,0,0
-    for j in range(len(vehicles[directionNumbers[nextGreen]][0])):
-        vehicle = vehicles[directionNumbers[nextGreen]][0][j]
-        if(vehicle.crossed==0):
-            vclass = vehicle.vehicleClass
-            noOfBikes += 1
-    for i in range(1,3):
-        for j in range(len(vehicles[directionNumbers[nextGreen]][i])):
-            vehicle = vehicles[directionNumbers[nextGreen]][i][j]
+    with vehicleLock:
+        for j in range(len(vehicles[directionNumbers[nextGreen]][0])):
+            vehicle = vehicles[directionNumbers[nextGreen]][0][j]
             if(vehicle.crossed==0):
                 vclass = vehicle.vehicleClass
-                if(vclass=='car'):
-                    noOfCars += 1
-                elif(vclass=='bus'):
-                    noOfBuses += 1
-                elif(vclass=='truck'):
-                    noOfTrucks += 1
-                elif(vclass=='rickshaw'):
-                    noOfRickshaws += 1
+                noOfBikes += 1
+        for i in range(1,3):
+            for j in range(len(vehicles[directionNumbers[nextGreen]][i])):
+                vehicle = vehicles[directionNumbers[nextGreen]][i][j]
+                if(vehicle.crossed==0):
+                    vclass = vehicle.vehicleClass
+                    if(vclass=='car'):
+                        noOfCars += 1
+                    elif(vclass=='bus'):
+                        noOfBuses += 1
+                    elif(vclass=='truck'):
+                        noOfTrucks += 1
+                    elif(vclass=='rickshaw'):
+                        noOfRickshaws += 1
     greenTime = math.ceil(((noOfCars*carTime) + (noOfRickshaws*rickshawTime) + (noOfBuses*busTime) + (noOfTrucks*truckTime)+ (noOfBikes*bikeTime))/(noOfLanes+1))
     if(greenTime<defaultMinimum):
         greenTime = defaultMinimum
@@ -315,10 +446,11 @@ def repeat():
     currentYellow = 1   # set yellow signal on
     vehicleCountTexts[currentGreen] = "0"
     # reset stop coordinates of lanes and vehicles 
-    for i in range(0,3):
-        stops[directionNumbers[currentGreen]][i] = defaultStop[directionNumbers[currentGreen]]
-        for vehicle in vehicles[directionNumbers[currentGreen]][i]:
-            vehicle.stop = defaultStop[directionNumbers[currentGreen]]
+    with vehicleLock:
+        for i in range(0,3):
+            stops[directionNumbers[currentGreen]][i] = defaultStop[directionNumbers[currentGreen]]
+            for vehicle in vehicles[directionNumbers[currentGreen]][i]:
+                vehicle.stop = defaultStop[directionNumbers[currentGreen]]
     while(signals[currentGreen].yellow>0 and not stopSimulation):  # while the timer of current yellow signal is not zero
         printStatus()
         emitLaneStats()
@@ -369,6 +501,43 @@ def emitLaneStats():
             flush=True
         )
 
+def recordTrajectories():
+    global frameCount
+    frameCount += 1
+    with vehicleLock:
+        current = list(simulation)
+    if not current:
+        return
+    classNumbers = {name: number for number, name in vehicleTypes.items()}
+    centres = [(vehicle.x + vehicle.width/2, vehicle.y + vehicle.height/2) for vehicle in current]
+    trajectoryRecorder.append(
+        frameCount,
+        time.time() - recordingStart,
+        [vehicle.id for vehicle in current],
+        [centre[0] for centre in centres],
+        [centre[1] for centre in centres],
+        [vehicle.direction_number for vehicle in current],
+        [vehicle.lane for vehicle in current],
+        [classNumbers[vehicle.vehicleClass] for vehicle in current],
+        [vehicle.crossed*FLAG_CROSSED | vehicle.turned*FLAG_TURNED | vehicle.willTurn*FLAG_WILL_TURN for vehicle in current],
+    )
+
+def emitFrameStats():
+    if not frameTimes:
+        return
+    ordered = sorted(frameTimes)
+    def percentile(p):
+        return ordered[min(len(ordered)-1, int(p/100*len(ordered)))]*1000
+    print(
+        "FRAME_STATS",
+        f"frames={len(ordered)}",
+        f"mean_ms={sum(ordered)/len(ordered)*1000:.4f}",
+        f"p50_ms={percentile(50):.4f}",
+        f"p95_ms={percentile(95):.4f}",
+        f"p99_ms={percentile(99):.4f}",
+        flush=True
+    )
+
 def printSummaryStats():
     totalVehicles = sum(vehicles[direction]['crossed'] for direction in directionNumbers.values())
     throughput = 0.0
@@ -400,7 +569,10 @@ def generateVehicles():
     while(True):
         if stopSimulation:
             return
-        vehicle_type = random.randint(0,4)
+        if vehicleClassWeights:
+            vehicle_type = random.choices(range(5), weights=vehicleClassWeights)[0]
+        else:
+            vehicle_type = random.randint(0,4)
         if(vehicle_type==4):
             lane_number = 0
         else:
@@ -414,7 +586,7 @@ def generateVehicles():
                 will_turn = 0
         temp = random.randint(0,999)
         direction_number = 0
-        a = [300,600,800,1000]
+        a = directionThresholds
         if(temp<a[0]):
             direction_number = 0
         elif(temp<a[1]):
@@ -423,8 +595,8 @@ def generateVehicles():
             direction_number = 2
         elif(temp<a[3]):
             direction_number = 3
-        Vehicle(lane_number, vehicleTypes[vehicle_type], direction_number, directionNumbers[direction_number], will_turn)
-        time.sleep(0.75)
+        spawnVehicle(lane_number, vehicleTypes[vehicle_type], direction_number, directionNumbers[direction_number], will_turn)
+        time.sleep(spawnInterval)
 
 def simulationTime():
     global timeElapsed, simTime, stopSimulation
@@ -435,9 +607,9 @@ def simulationTime():
         time.sleep(1)
         printSummaryStats()
         if(timeElapsed>=simTime):
-            stopSimulation = True
             emitLaneStats()
             print('SIMULATION_COMPLETE', flush=True)
+            stopSimulation = True    # set last, the render loop exits as soon as it sees it
             return
     
 
@@ -455,20 +627,18 @@ class Main:
     white = (255, 255, 255)
 
     # Screensize 
-    screenWidth = 1300
-    screenHeight = 680
     screenSize = (screenWidth, screenHeight)
 
-    # Setting background image 
-    background = pygame.image.load('images/mod_int.png')
-
     screen = pygame.display.set_mode(screenSize)
     pygame.display.set_caption("SIMULATION")
 
+    # Setting background image 
+    background = loadImage('images/mod_int.png', alpha=False)
+
     # Loading signal images and font
-    redSignal = pygame.image.load('images/signals/red.png')
-    yellowSignal = pygame.image.load('images/signals/yellow.png')
-    greenSignal = pygame.image.load('images/signals/green.png')
+    redSignal = loadImage('images/signals/red.png')
+    yellowSignal = loadImage('images/signals/yellow.png')
+    greenSignal = loadImage('images/signals/green.png')
     font = pygame.font.Font(None, 30)
 
     thread3 = threading.Thread(name="generateVehicles",target=generateVehicles, args=())    # Generating vehicles
@@ -476,9 +646,12 @@ class Main:
     thread3.start()
 
     while True:
+        frameStart = time.perf_counter()
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 stopSimulation = True
+                if trajectoryRecorder:
+                    trajectoryRecorder.close()
                 pygame.quit()
                 sys.exit()
 
@@ -506,26 +679,40 @@ class Main:
                 else:
                     signals[i].signalText = "---"
                 screen.blit(redSignal, signalCoods[i])
-        signalTexts = ["","","",""]
 
         # display signal timer and vehicle count
         for i in range(0,noOfSignals):  
-            signalTexts[i] = font.render(str(signals[i].signalText), True, white, black)
-            screen.blit(signalTexts[i],signalTimerCoods[i]) 
+            screen.blit(hudText(font, ('signal', i), signals[i].signalText, white, black), signalTimerCoods[i]) 
             displayText = vehicles[directionNumbers[i]]['crossed']
-            vehicleCountTexts[i] = font.render(str(displayText), True, black, white)
+            vehicleCountTexts[i] = hudText(font, ('count', i), displayText, black, white)
             screen.blit(vehicleCountTexts[i],vehicleCountCoods[i])
 
-        timeElapsedText = font.render(("Time Elapsed: "+str(timeElapsed)), True, black, white)
+        timeElapsedText = hudText(font, 'time', "Time Elapsed: "+str(timeElapsed), black, white)
         screen.blit(timeElapsedText,(1100,50))
 
-        # display the vehicles
-        for vehicle in simulation:  
-            screen.blit(vehicle.currentImage, [vehicle.x, vehicle.y])
-            # vehicle.render(screen)
+        # The spawn thread appends to simulation, so work on a copy taken under the lock
+        with vehicleLock:
+            current = list(simulation)
+        # display the vehicles, all in one blits() call
+        screen.blits([(vehicle.currentImage, (vehicle.x, vehicle.y)) for vehicle in current], False)
+        retired = []
+        for vehicle in current:  
             vehicle.move()
+            if(vehicle.crossed==1 and offScreen(vehicle)):
+                retired.append(vehicle)
+        if retired:
+            with vehicleLock:
+                for vehicle in retired:
+                    vehicle.retire()
+        if trajectoryRecorder:
+            recordTrajectories()
         pygame.display.update()
+        if frameTimes is not None:
+            frameTimes.append(time.perf_counter() - frameStart)
         if stopSimulation:
+            emitFrameStats()
+            if trajectoryRecorder:
+                trajectoryRecorder.close()
             pygame.quit()
             sys.exit()
 
@@ -2,10 +2,20 @@ const resultsContainer = document.getElementById("cityResults");
 const form = document.getElementById("citySearchForm");
 const input = document.getElementById("citySearchInput");
 const countLabel = document.getElementById("citySearchCount");
+const suggestions = document.getElementById("citySuggestions");
+let searchTimer = null;
+// requests still in flight; a newer keystroke aborts them so a slow stale answer never overwrites a newer one
+let searchController = null;
+let suggestController = null;
 
-async function fetchCities(query = "") {
+function restartRequest(controller) {
+  controller?.abort();
+  return new AbortController();
+}
+
+async function fetchCities(query = "", signal = undefined) {
   const url = query ? `/api/cities?q=${encodeURIComponent(query)}` : "/api/cities";
-  const response = await fetch(url);
+  const response = await fetch(url, { signal });
   if (!response.ok) {
     throw new Error(`Failed to fetch cities: ${response.statusText}`);
   }
@@ -101,11 +111,15 @@ function renderCityResults(data) {
 async function handleSearch(event) {
   event.preventDefault();
   const query = input.value.trim();
+  searchController = restartRequest(searchController);
+  const { signal } = searchController;
   try {
     countLabel.textContent = "Loading...";
-    const data = await fetchCities(query);
+    const data = await fetchCities(query, signal);
+    if (signal.aborted) return;
     renderCityResults(data);
   } catch (error) {
+    if (signal.aborted) return;
     console.error(error);
     resultsContainer.innerHTML = `
       <div class="city-error">
@@ -117,7 +131,38 @@ async function handleSearch(event) {
   }
 }
 
+async function updateSuggestions(query) {
+  if (!suggestions) return;
+  suggestController = restartRequest(suggestController);
+  if (!query) {
+    suggestions.innerHTML = "";
+    return;
+  }
+  const { signal } = suggestController;
+  let data;
+  try {
+    const response = await fetch(`/api/cities/suggest?q=${encodeURIComponent(query)}`, { signal });
+    if (!response.ok) return;
+    data = await response.json();
+  } catch (error) {
+    if (signal.aborted) return;
+    throw error;
+  }
+  if (signal.aborted) return;
+  suggestions.innerHTML = data.items.map((item) => `<option value="${item.city}">${item.state}</option>`).join("");
+}
+
+// search as the user types; the delay only spares requests, and each one aborts the previous one still in flight
+function handleTyping() {
+  clearTimeout(searchTimer);
+  searchTimer = setTimeout(() => {
+    updateSuggestions(input.value.trim()).catch((error) => console.error(error));
+    handleSearch(new Event("submit"));
+  }, 120);
+}
+
 form?.addEventListener("submit", handleSearch);
+input?.addEventListener("input", handleTyping);
 
 // auto-load featured cities
 fetchCities()
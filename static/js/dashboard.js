@@ -284,6 +284,7 @@ async function startSimulation(event) {
   const simTime = Number(document.getElementById("simTime").value || 120);
   const minGreen = Number(document.getElementById("minGreen").value || 10);
   const maxGreen = Number(document.getElementById("maxGreen").value || 60);
+  const seedValue = (document.getElementById("seed") || {}).value;
   startBtnEl = startBtnEl || document.getElementById("startBtn");
   stopBtnEl = stopBtnEl || document.getElementById("stopBtn");
   logViewEl = logViewEl || document.getElementById("logView");
@@ -296,11 +297,19 @@ async function startSimulation(event) {
     const resp = await fetch("/api/run", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ sim_time: simTime, min_green: minGreen, max_green: maxGreen }),
+      body: JSON.stringify({
+        sim_time: simTime,
+        min_green: minGreen,
+        max_green: maxGreen,
+        seed: seedValue === "" || seedValue === undefined ? null : Number(seedValue),
+      }),
     });
 
     if (!resp.ok) {
-      if (logViewEl) logViewEl.textContent += `Failed to start simulation: ${resp.statusText}\n`;
+      const error = await resp.json().catch(() => ({}));
+      const reason = error.error || resp.statusText;
+      const retry = error.retry_after ? ` (try again in ${error.retry_after} s)` : "";
+      if (logViewEl) logViewEl.textContent += `Failed to start simulation: ${reason}${retry}\n`;
       if (startBtnEl) startBtnEl.disabled = false;
       return;
     }
@@ -308,7 +317,8 @@ async function startSimulation(event) {
     const data = await resp.json();
     currentRunId = data.run_id;
     resetVisualState();
-    if (logViewEl) logViewEl.textContent += `Simulation started (run id: ${currentRunId})\n`;
+    const origin = data.cached ? " from stored result" : data.coalesced ? " (joined identical run)" : "";
+    if (logViewEl) logViewEl.textContent += `Simulation started${origin} (run id: ${currentRunId})\n`;
     if (stopBtnEl) stopBtnEl.disabled = false;
 
     pollTimer = setInterval(pollStatus, 1000);
@@ -375,7 +385,11 @@ async function pollStatus() {
     const laneDetails = stats.lane_details || {};
 
     currentPhaseLabel = stats.phase || "";
-    phaseLabel.textContent = currentPhaseLabel || "—";
+    if (data.status === "queued") {
+      phaseLabel.textContent = `Queued (position ${data.queue_position || "—"})`;
+    } else {
+      phaseLabel.textContent = currentPhaseLabel || "—";
+    }
 
     for (let i = 0; i < 4; i++) {
       const index = i + 1;
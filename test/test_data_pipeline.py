@@ -0,0 +1,226 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from data_pipeline import search as search_module
+from data_pipeline.catalog import CityCatalog, aggregate_home_metrics, record_to_payload, score_city
+from data_pipeline.columns import CityColumns
+from data_pipeline.loader import CityRecord, load_city_records
+from data_pipeline.refresh import fetch_source_records, refresh_city_dataset
+from data_pipeline.reloader import DatasetReloader
+from data_pipeline.search import SearchIndex, edit_distance
+from data_pipeline.snapshot import CitySnapshot, write_snapshot
+
+
+def make_record(city, state="Karnataka", classification="metro", population=1.0, speed=20.0, delay=20.0):
+    return CityRecord(
+        city=city,
+        state=state,
+        classification=classification,
+        population_millions=population,
+        avg_peak_speed_kmph=speed,
+        avg_delay_minutes=delay,
+        vehicle_mix={"car": 0.5, "two_wheeler": 0.5},
+        issues=["Signal timing"],
+        recommended_actions=["Adaptive signals"],
+    )
+
+
+def test_catalog_precomputes_payloads_orders_and_versions():
+    records = [
+        make_record("Mysuru", delay=15.0, population=1.2),
+        make_record("Bengaluru", delay=40.0, speed=17.0, population=13.0),
+        make_record("Kochi", state="Kerala", delay=25.0),
+    ]
+    catalog = CityCatalog(records)
+
+    assert [catalog.records[n].city for n in catalog.search("")] == ["Bengaluru", "Kochi", "Mysuru"]
+    assert [catalog.records[n].city for n in catalog.orders["city"]] == ["Bengaluru", "Kochi", "Mysuru"]
+    assert [catalog.records[n].city for n in catalog.search("karnataka", "population")] == ["Bengaluru", "Mysuru"]
+    assert catalog.payloads[1] == record_to_payload(records[1], score_city(records[1]))
+    assert catalog.home_metrics == aggregate_home_metrics(records)
+    assert catalog.lookup("bengaluru") == 1 and catalog.lookup("nowhere") is None
+
+    listing = catalog.listing_json(catalog.search(""), cache_as="default")
+    assert listing is catalog.listing_json([], cache_as="default")
+    assert '"count":3' in listing
+
+    assert catalog.version == CityCatalog(list(records)).version
+    assert catalog.etag("cities", "", None) != catalog.etag("cities", "ko", None)
+    changed = CityCatalog(records[:2] + [make_record("Kochi", state="Kerala", delay=26.0)])
+    assert changed.version != catalog.version
+
+
+def test_search_index_ranks_exact_prefix_infix_and_typos():
+    index = SearchIndex(
+        [
+            ("Hyderabad", "Telangana", "metro"),
+            ("Ahmedabad", "Gujarat", "metro"),
+            ("Navi Mumbai", "Maharashtra", "smart_city"),
+            ("Mumbai", "Maharashtra", "metro"),
+            ("Pune", "Maharashtra", "tier_1"),
+        ],
+        popularity=[4, 3, 1, 0, 2],
+    )
+    names = ["Hyderabad", "Ahmedabad", "Navi Mumbai", "Mumbai", "Pune"]
+
+    def search(query):
+        return [names[record] for record, _ in index.search(query)]
+
+    assert search("mumbai") == ["Mumbai", "Navi Mumbai"]
+    assert search("mum") == ["Mumbai", "Navi Mumbai"]
+    assert search("bad") == ["Ahmedabad", "Hyderabad"]
+    assert search("hydrabad") == ["Hyderabad"]
+    assert search("pnue") == ["Pune"]
+    assert search("maharashtra navi") == ["Navi Mumbai"]
+    assert search("metro")[:1] == ["Mumbai"] and search("xyz") == []
+    assert [names[record] for record in index.complete("navi m")] == ["Navi Mumbai"]
+    assert [names[record] for record in index.complete("m")] == ["Mumbai", "Navi Mumbai"]
+    assert edit_distance("pnue", "pune", 1) == 1 and edit_distance("pune", "delhi", 1) == 2
+
+
+def test_search_index_scores_rare_words_first_and_bounds_short_prefixes(monkeypatch):
+    monkeypatch.setattr(search_module, "PREFIX_EXPANSION", 4)
+    states = ["Karnataka", "Kerala", "Goa"]
+    index = SearchIndex([(f"Mysuru {n}", states[n % 3], "tier_2") for n in range(300)])
+
+    def intersected(*query_words):
+        scores = [index.match_word(word, bounded=False) for word in query_words]
+        totals = {record: sum(score[record] for score in scores) for record in set.intersection(*map(set, scores))}
+        return sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+
+    # "1" expands to more words than the other words have records, so it is scored against those records
+    for query in ("mysuru 1", "1 kerala", "mysru 12 goa"):
+        assert index.search(query, limit=300) == intersected(*query.split())
+    # Alone, a short prefix is expanded to the words of the most popular records only, which still rank first
+    assert [record for record, _ in index.search("1", limit=3)] == [1, 10, 11]
+
+
+def test_city_columns_score_and_round_trip_records():
+    records = [
+        make_record("Delhi", state="Delhi", delay=47.0, speed=18.0, population=30.3),
+        make_record("Mysuru", delay=12.0, speed=9.0, population=21.7),
+        make_record("Udupi", delay=8.0, speed=35.0, population=0.2),
+    ]
+    records[2].vehicle_mix = {"car": 0.7}
+    columns = CityColumns.from_records(records)
+
+    composite, bands = columns.scores()
+    scalar = [score_city(record) for record in records]
+    assert composite.tolist() == [score["score"] for score in scalar]
+    assert [("High", "Medium", "Moderate")[band] for band in bands] == [score["priority"] for score in scalar]
+    assert columns.state.values == ["Delhi", "Karnataka"] and columns.state.codes.tolist() == [0, 1, 1]
+    assert [columns.city[n] for n in columns.order("delay", composite)] == ["Delhi", "Mysuru", "Udupi"]
+    assert [columns.record(n) for n in range(3)] == records
+
+
+def test_reloader_swaps_in_changed_dataset_and_keeps_last_good_one(tmp_path):
+    path = tmp_path / "traffic_latest.json"
+    path.write_text(json.dumps([make_record("Pune").__dict__]), encoding="utf-8")
+    reloader = DatasetReloader(path, interval=0).start()
+    first = reloader.current
+    assert first.number == 1 and first.source == str(path) and reloader.check() is False
+
+    path.write_text(json.dumps([make_record("Pune").__dict__, make_record("Nagpur").__dict__]), encoding="utf-8")
+    assert reloader.check() is True
+    assert reloader.current.number == 2 and len(reloader.catalog) == 2
+    assert len(first.catalog) == 1
+
+    path.write_text('[{"city": "Pune", ', encoding="utf-8")
+    os.utime(path, ns=(1, 1))
+    assert reloader.check() is False and reloader.current.number == 2
+
+
+def test_refresh_fetches_pages_concurrently_and_rewrites_only_changes(monkeypatch, tmp_path):
+    feeds = {
+        "paged": [{"city": f"city {n}"} for n in range(449)] + [{"city": "pune", "avg_delay_minutes": 1}],
+        "unpaged": [{"city": f"town {n}"} for n in range(229)] + [{"city": "pune", "avg_delay_minutes": 2}],
+    }
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            feed, query = url.path.rsplit("/", 1)[-1], parse_qs(url.query)
+            offset, limit = int(query["offset"][0]), int(query["limit"][0])
+            requests_seen.append((feed, offset))
+            if (feed, offset) == ("paged", 200) and requests_seen.count((feed, offset)) == 1:
+                self.send_response(503)
+                self.end_headers()
+                return
+            body = {"records": feeds[feed][offset : offset + limit]}
+            if feed == "paged":
+                body["total"] = len(feeds[feed])
+            payload = json.dumps(body).encode("utf-8")
+            etag = f'"{hash(payload)}"'
+            if self.headers.get("If-None-Match") == etag:
+                payload = b""
+            self.send_response(200 if payload else 304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/resource/"
+    sources = [{"name": name, "resource_id": name, "base_url": base_url} for name in feeds]
+    output = tmp_path / "traffic_latest.json"
+    monkeypatch.setenv("DATA_GOV_IN_API_KEY", "test")
+    try:
+        fetched = fetch_source_records(sources, rate_limit=0)
+        pages = sorted((number, offset, len(page), status) for number, offset, page, status in fetched)
+        retried = requests_seen.count(("paged", 200))
+        first = refresh_city_dataset(sources=sources, output=output)
+        written_at = os.stat(output).st_mtime_ns
+        second = refresh_city_dataset(sources=sources, output=output)
+        rewritten = os.stat(output).st_mtime_ns != written_at
+        feeds["unpaged"][-1]["avg_delay_minutes"] = 3
+        third = refresh_city_dataset(sources=sources, output=output)
+    finally:
+        server.shutdown()
+
+    assert [page[:3] for page in pages] == [(0, 0, 200), (0, 200, 200), (0, 400, 50), (1, 0, 200), (1, 200, 30)]
+    assert retried == 2 and {page[3] for page in pages} == {"fetched"}
+    assert first["written"] and first["source_counts"] == {"paged": 450, "unpaged": 230}
+    assert len(first["changes"]["added"]) == first["written_records"]
+
+    assert not second["written"] and not rewritten
+    assert second["pages"] == {"fetched": 0, "not_modified": 5, "cached": 0}
+    assert second["changes"]["unchanged"] == first["written_records"]
+
+    assert third["written"] and third["changes"]["changed"] == ["Pune"] and third["pages"]["fetched"] == 1
+    pune = next(item for item in json.loads(output.read_text(encoding="utf-8")) if item["city"] == "Pune")
+    assert pune["avg_delay_minutes"] == 3
+
+
+def test_snapshot_round_trips_records_through_a_memory_map(tmp_path):
+    records = [
+        make_record("Bengaluru", delay=40.0, speed=17.0, population=13.0),
+        make_record("Thiruvananthapuram", state="Kerala", classification="tier_2"),
+        make_record("Ahmedabad", state="Gujarat"),
+    ]
+    records[1].vehicle_mix = {"auto_rickshaw": 0.3}
+    records[1].issues = ["Parking", "Signal timing", "Kanjirampara–Pettah junction"]
+    records[2].recommended_actions = []
+    path = tmp_path / "cities.citysnap"
+    write_snapshot(records, path)
+
+    snapshot = load_city_records(path)
+    assert isinstance(snapshot, CitySnapshot) and len(snapshot) == 3
+    assert snapshot[1] == records[1] and snapshot[-1] == records[2] and list(snapshot) == records
+    assert snapshot.columns().state.values == ["Karnataka", "Kerala", "Gujarat"]
+    catalog, eager = CityCatalog(snapshot), CityCatalog(records)
+    assert catalog.version == eager.version
+    assert catalog.lookup("thiruvananthapuram") == 1 and catalog.search("kerala") == [1]
+    # Payloads are built from the mapped columns as they are served, identical to those of the records
+    assert catalog.payload_json[-1] == eager.payload_json[2]
+    assert catalog.listing_json(catalog.search("")) == eager.listing_json(eager.search(""))
+
+    write_snapshot([], path)
+    assert list(load_city_records(path)) == []
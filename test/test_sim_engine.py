@@ -0,0 +1,350 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+from sim_engine import (
+    VEHICLE_CLASSES,
+    AdaptiveFormulaPolicy,
+    Engine,
+    EngineSnapshot,
+    FixedTimePolicy,
+    MaxPressurePolicy,
+    SimConfig,
+)
+from sim_engine.benchmark import run_scenario
+from sim_engine.branching import compare_what_if
+from sim_engine.calibration import calibrate, read_crossings, read_detections
+from sim_engine.conflicts import ConflictDetector, SpatialHash
+from sim_engine.corridor import run_corridor
+from sim_engine.detection import DetectionPolicy
+from sim_engine.evaluation import evaluate_policies
+from sim_engine.mesoscopic import CityDemand, GridNetwork, MesoscopicModel
+from sim_engine.optimize import PARAMETERS, ResultCache, apply_params, decode, optimize_profile, pareto_front
+from sim_engine.recorder import TrajectoryReader, TrajectoryRecorder
+from sim_engine.replay import ArrivalLog, ReplayDemand, backtest
+from sim_engine.synthetic import ANNOTATION_DIR, IMAGE_DIR, SceneSpec, render_scene, transform_boxes
+from sim_engine.vector_env import TrafficVectorEnv
+
+
+def test_seeded_runs_are_reproducible():
+    first = Engine(SimConfig(sim_time=60), seed=7).run()
+    second = Engine(SimConfig(sim_time=60), seed=7).run()
+    assert first == second
+    assert first["total"] > 0
+
+
+def test_restored_snapshot_continues_like_the_original():
+    engine = Engine(SimConfig(sim_time=90), seed=3)
+    engine.run_for(40)
+    restored = Engine.from_snapshot(EngineSnapshot.from_bytes(engine.snapshot().to_bytes()))
+
+    engine.run_for(30)
+    restored.run_for(30)
+
+    assert restored.summary() == engine.summary()
+    np.testing.assert_array_equal(restored.pos[: restored.count], engine.pos[: engine.count])
+
+
+def test_fork_is_independent_of_the_original():
+    engine = Engine(seed=5)
+    engine.run_for(20)
+    fork = engine.fork()
+    fork.extend_green(10)
+    fork.run_for(10)
+    assert engine.time_elapsed == 20
+    assert fork.time_elapsed == 30
+
+
+def test_compare_what_if_reports_both_branches():
+    engine = Engine(seed=11)
+    engine.run_for(15)
+    result = compare_what_if(engine, seconds=30, green_extension=10)
+    assert set(result) == {"baseline", "branch", "delta"}
+    assert result["baseline"]["time"] == result["branch"]["time"] == 45
+
+
+def test_acyclic_policies_never_repeat_the_current_green():
+    class RecordingPolicy(MaxPressurePolicy):
+        def __init__(self):
+            self.decisions = []
+
+        def decide(self, view):
+            decision = super().decide(view)
+            assert not view.counts.flags.writeable
+            self.decisions.append((view.current_green, decision.phase))
+            return decision
+
+    policy = RecordingPolicy()
+    Engine(SimConfig(sim_time=300), seed=2, policy=policy).run()
+    assert policy.decisions
+    assert all(current != chosen for current, chosen in policy.decisions)
+
+
+def test_policies_see_identical_demand():
+    config = SimConfig(sim_time=120)
+    report = evaluate_policies([FixedTimePolicy(), AdaptiveFormulaPolicy()], seeds=[0, 1], config=config, max_workers=2)
+    assert set(report) == {"fixed", "adaptive"}
+    fixed = Engine(config, seed=0, policy=FixedTimePolicy()).run()
+    adaptive = Engine(config, seed=0, policy=AdaptiveFormulaPolicy()).run()
+    assert fixed["spawned"] == adaptive["spawned"]
+
+
+def test_vector_env_steps_all_intersections_in_lock_step():
+    env = TrafficVectorEnv(num_envs=8, config=SimConfig(sim_time=40), seed=0)
+    obs, _ = env.reset(seed=0)
+    assert obs.shape == (8, 64)
+
+    truncated = np.zeros(8, dtype=bool)
+    for _ in range(4):
+        obs, rewards, terminated, truncated, infos = env.step(np.arange(8) % 4)
+        assert rewards.shape == (8,)
+        assert not terminated.any()
+    assert truncated.all()
+    assert "final_obs" in infos
+    # finished intersections are reset in the same step
+    assert (env.elapsed == 0).all()
+    assert obs[:, :60].sum() == 0
+
+
+def test_spatial_hash_tracks_moves_incrementally():
+    grid = SpatialHash(10.0)
+    ids = np.array([1, 2, 3])
+    grid.update(ids, grid.cell_ranges(np.array([0.0, 5.0, 50.0]), np.zeros(3), np.array([8.0, 12.0, 58.0]), np.full(3, 8.0)))
+    assert grid.candidate_pairs() == {(1, 2)}
+
+    grid.update(ids[1:], grid.cell_ranges(np.array([52.0, 50.0]), np.zeros(2), np.array([59.0, 58.0]), np.full(2, 8.0)))
+    assert grid.candidate_pairs() == {(2, 3)}
+    assert 1 not in grid.ranges
+
+
+def test_gap_acceptance_reduces_junction_conflicts():
+    config = SimConfig(sim_time=300, default_yellow=1)
+    free = ConflictDetector()
+    Engine(config, seed=1, conflicts=free).run()
+    yielding = ConflictDetector(gap_acceptance=True)
+    Engine(config, seed=1, conflicts=yielding).run()
+    assert free.total > 0
+    assert yielding.total < free.total
+    assert sum(free.report()["per_movement"].values()) == 2 * free.total
+
+
+def test_benchmark_scenario_reports_every_phase():
+    result = run_scenario(density=50, steps=20, render=False)
+    assert result["density"] == 50
+    assert result["steps_per_sec"] > 0
+    assert set(result["phases"]) == {"signals", "spawn", "move", "render"}
+    assert result["phases"]["render"] is None
+    assert result["phases"]["move"]["p95_ms"] >= result["phases"]["move"]["p50_ms"]
+
+
+def test_mesoscopic_spillback_shares_link_space_between_feeders():
+    network = GridNetwork(rows=1, cols=3)
+    target, straight_feeder, turn_feeder = 4, 0, 9  # junction 1 "right", fed from junctions 0 and 2
+    assert network.straight_target[straight_feeder] == target
+    network.turn_target[turn_feeder] = target
+    model = MesoscopicModel(network, demand=CityDemand(local_rate=0.0), link_capacity=10.0, seed=0)
+    model.yellow_left[:] = 0
+    model.green_left[:] = 5
+    model.current_green[:] = [0, 2, 1]
+    model.queues[[straight_feeder, turn_feeder], 0] = 40.0
+    model.queues[target, 0] = 9.5
+    model.step()
+    assert 0 < model.transit_count[target] <= 0.5 + 1e-9
+
+
+def test_mesoscopic_model_conserves_vehicles():
+    model = MesoscopicModel(GridNetwork(rows=4, cols=5), seed=0)
+    summary = model.run(600)
+    on_network = model.queues.sum() + model.in_transit.sum()
+    assert summary["junctions"] == 20
+    assert abs(model.entered - model.exited - on_network) < 1e-6 * model.entered
+    assert (model.current_green >= 0).all() and (model.current_green < 4).all()
+
+
+def test_corridor_hands_vehicles_across_worker_boundaries():
+    report = run_corridor(junctions=4, workers=2, seconds=40, seed=0)
+    assert report["workers"] == 2
+    assert len(report["per_junction"]) == 4
+    assert report["through_transfers"] > 0
+    # handed-over vehicles arrive on top of each junction's own 40 / 0.75 spawns
+    spawned = [summary["spawned"] for summary in report["per_junction"]]
+    assert max(spawned) > 40 / 0.75 + 1
+    # every transfer is a vehicle injected into a neighbour, none of them one leaving the corridor
+    assert report["through_transfers"] == sum(spawned) - 4 * (int(40 / 0.75) + 1)
+
+
+def test_corridor_raises_instead_of_hanging_when_a_worker_fails():
+    with pytest.raises(RuntimeError, match="OverflowError"):
+        run_corridor(junctions=4, workers=2, seconds=40, seed=0, channel_capacity=0)
+
+
+def test_optimizer_reuses_cached_runs_and_reports_pareto_front():
+    cache = ResultCache()
+    config = SimConfig(sim_time=30)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        report = optimize_profile("uniform", config, pool, cache, seeds=[0], generations=1, popsize=4, trade_offs=[0.0])
+        misses = cache.misses
+        again = optimize_profile("uniform", config, pool, cache, seeds=[0], generations=1, popsize=4, trade_offs=[0.0])
+    assert cache.misses == misses
+    assert again["pareto"] == report["pareto"]
+    front = report["pareto"]
+    assert front == pareto_front(front)
+    assert all(a["throughput"] < b["throughput"] for a, b in zip(front, front[1:]))
+
+
+def test_decoded_signal_timings_always_reach_the_policy():
+    class CountingPolicy(AdaptiveFormulaPolicy):
+        decisions = 0
+
+        def decide(self, view):
+            CountingPolicy.decisions += 1
+            return super().decide(view)
+
+    corners = np.zeros(len(PARAMETERS))
+    names = [name for name, *_ in PARAMETERS]
+    for yellow, detection in ((1.0, 0.0), (0.0, 0.0), (1.0, 1.0), (0.0, 1.0)):
+        x = corners.copy()
+        x[names.index("default_yellow")], x[names.index("detection_time")] = yellow, detection
+        params = decode(x)
+        assert params["default_yellow"] <= params["detection_time"] < params["default_yellow"] + params["min_green"]
+        CountingPolicy.decisions = 0
+        Engine(apply_params(SimConfig(sim_time=120), params), seed=1, policy=CountingPolicy()).run()
+        assert CountingPolicy.decisions > 0, params
+
+
+def test_result_cache_drops_runs_from_another_engine_version(tmp_path):
+    path = str(tmp_path / "cache.json")
+    config = SimConfig(sim_time=30)
+    old = ResultCache(path, version="old")
+    old.put(config, 0, {"throughput": 1.0})
+    old.save()
+    assert ResultCache(path, version="old").get(config, 0) == {"throughput": 1.0}
+    current = ResultCache(path)
+    assert current.get(config, 0) is None and current.entries == {}
+
+
+def test_calibration_recovers_pass_times_and_speeds(tmp_path):
+    rng = np.random.default_rng(0)
+    truth = {"car": 2.0, "bus": 3.0, "bike": 0.9}
+    labels = rng.choice(["car", "bus", "motorbike"], size=600)
+    rows, clock = [], 0.0
+    for k, label in enumerate(labels):
+        name = "bike" if label == "motorbike" else label
+        # a new platoon every 20 vehicles; otherwise the headway is the pass time shared by 3 lanes
+        clock += 30.0 if k % 20 == 0 else truth[name] / 3 + rng.normal(0, 0.02)
+        rows.append({"time": str(clock), "approach": "right", "label": label})
+    crossings = read_crossings(rows)
+
+    frames = [
+        json.dumps({
+            "time": f,
+            "approach": "right",
+            "detections": [{"label": "car", "topleft": {"x": 30 * f, "y": 0}, "bottomright": {"x": 30 * f + 50, "y": 20}}],
+        })
+        for f in range(int(clock))
+    ]
+    scenario = calibrate(read_detections(frames), crossings)
+
+    fitted = scenario["config"]["pass_times"]
+    for name, value in truth.items():
+        assert abs(fitted[name] - value) < 0.05
+    assert abs(scenario["config"]["speeds"]["car"] - 30 / 60) < 1e-6
+    assert scenario["config"]["direction_weights"] == [1000, 0, 0, 0]
+
+    path = tmp_path / "scenario.json"
+    path.write_text(json.dumps(scenario))
+    config = SimConfig.from_scenario(str(path))
+    assert config.pass_times["bus"] == fitted["bus"]
+    assert config.pass_times["truck"] == SimConfig().pass_times["truck"]
+    assert Engine(replace(config, sim_time=20), seed=0).run()["spawned"] > 0
+
+
+def test_trajectory_recorder_round_trip(tmp_path):
+    path = str(tmp_path / "run.traj")
+    engine = Engine(SimConfig(sim_time=20), seed=3)
+    with TrajectoryRecorder(path, chunk_rows=1000, every=2) as recorder:
+        engine.recorder = recorder
+        engine.run()
+
+    with TrajectoryReader(path) as reader:
+        rows = reader.read()
+        assert len(reader) == recorder.rows == rows["frame"].size
+        assert len(reader.chunks) > 1
+        assert (rows["frame"] % 2 == 0).all()
+
+        window = reader.window(5.0, 6.0)
+        expected = (rows["time"] >= 5.0) & (rows["time"] < 6.0)
+        assert np.array_equal(window["vehicle"], rows["vehicle"][expected])
+
+        track = reader.vehicle(0)
+        assert np.array_equal(track["frame"], rows["frame"][rows["vehicle"] == 0])
+        moving = track["speed"][track["speed"] > 0]
+        assert np.isclose(np.median(moving), engine._speed[engine.vclass[0]], atol=1e-3)
+
+
+def test_replayed_counts_spawn_the_same_vehicles_for_every_policy():
+    rows = [
+        {"second": "3600", "approach": "right", "label": "car", "count": "3"},
+        {"second": "3601", "approach": "up", "label": "motorbike", "count": "1"},
+        {"second": "3630", "approach": "down", "label": "bus", "count": "2"},
+        {"second": "3630", "approach": "left", "label": "person", "count": "4"},
+    ]
+    log = ArrivalLog.from_counts(rows)
+    assert log.time.tolist() == [0.0, 1 / 3, 2 / 3, 1.0, 30.0, 30.5]
+    assert log.duration == 30.5
+
+    engine = Engine(SimConfig(sim_time=10), seed=0, demand=ReplayDemand(log))
+    engine.run_for(1)
+    assert engine.count == 3
+    fork = engine.fork()
+    engine.run_for(31)
+    fork.run_for(31)
+    assert engine.count == fork.count == 6
+
+    report = backtest(log, [FixedTimePolicy(), MaxPressurePolicy()], max_workers=2)
+    assert {row["spawned"] for row in report.values()} == {6}
+
+
+def test_detected_boxes_map_back_to_approach_lane_and_class():
+    engine = Engine(SimConfig(sim_time=60), seed=2)
+    engine.run_for(25)
+    policy = DetectionPolicy(detector=None).attach(engine)
+    crops = policy.capture()
+    assert [crop.shape[:2] for crop in crops] == [(y1 - y0, x1 - x0) for x0, y0, x1, y1 in policy.regions]
+
+    # Boxes a perfect detector would report for every queued vehicle fully inside a crop
+    idx = np.flatnonzero(engine.active[: engine.count] & ~engine.crossed[: engine.count])
+    x0, y0, x1, y1 = engine.boxes(idx)
+    results, expected = [], np.zeros((4, 3, 5), dtype=np.int64)
+    for rx0, ry0, rx1, ry1 in policy.regions:
+        inside = (x0 >= rx0) & (y0 >= ry0) & (x1 <= rx1) & (y1 <= ry1)
+        results.append([
+            {"label": "motorbike" if engine.vclass[i] == 4 else VEHICLE_CLASSES[engine.vclass[i]],
+             "topleft": {"x": a - rx0, "y": b - ry0}, "bottomright": {"x": c - rx0, "y": d - ry0}}
+            for i, a, b, c, d in zip(idx[inside], x0[inside], y0[inside], x1[inside], y1[inside])
+        ])
+        np.add.at(expected, (engine.direction[idx[inside]], engine.lane[idx[inside]], engine.vclass[idx[inside]]), 1)
+    assert expected.sum() > 0
+    assert np.array_equal(policy.counts(results), expected)
+
+
+def test_synthetic_scene_writes_voc_annotations_darkflow_can_parse(tmp_path, monkeypatch):
+    from darkflow.utils.pascal_voc_clean_xml import pascal_voc_clean_xml
+
+    box = np.array([[10.0, 20.0, 40.0, 30.0]])
+    turned, size = transform_boxes(box, (100, 50), quarter_turns=1, mirror=True)
+    assert size == (50, 100)
+    assert turned.tolist() == [[20.0, 10.0, 30.0, 40.0]]
+
+    (tmp_path / IMAGE_DIR).mkdir()
+    (tmp_path / ANNOTATION_DIR).mkdir()
+    counts = render_scene(str(tmp_path), SceneSpec(first_index=0, frames=3, seed=5))
+    assert len(list((tmp_path / IMAGE_DIR).iterdir())) == 3
+
+    monkeypatch.chdir(tmp_path)
+    dumps = pascal_voc_clean_xml(str(tmp_path / ANNOTATION_DIR), list(VEHICLE_CLASSES))
+    assert len(dumps) == 3
+    assert sum(len(objects) for _, (_, _, objects) in dumps) == sum(counts.values()) > 0
@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+from sim_service import JobQueue, Rejected, RunHistory
+from sim_service.cache import InFlight, run_key
+
+
+def test_job_queue_bounds_workers_clients_and_depth():
+    release = threading.Event()
+    started = []
+    lock = threading.Lock()
+
+    def job(name):
+        def target():
+            with lock:
+                started.append(name)
+            release.wait(5)
+
+        return target
+
+    queue = JobQueue(workers=1, max_queued=1, per_client=2)
+    try:
+        queue.submit("a", "alice", job("a"), estimate=30)
+        while queue.position("a") is not None:
+            time.sleep(0.01)
+        queue.submit("b", "alice", job("b"), estimate=30)
+        with pytest.raises(Rejected) as per_client:
+            queue.submit("c", "alice", job("c"))
+        assert 1 <= per_client.value.retry_after <= 30
+
+        with pytest.raises(Rejected) as full:
+            queue.submit("d", "bob", job("d"))
+        assert full.value.reason == "simulation queue is full"
+        assert queue.position("b") == 1
+        assert queue.snapshot()["running"] == 1
+
+        assert queue.cancel("b")
+        queue.submit("e", "bob", job("e"))
+        release.set()
+    finally:
+        queue.shutdown()
+    assert started[0] == "a" and "b" not in started
+
+
+def test_run_history_filters_pages_and_compares(tmp_path):
+    history = RunHistory(str(tmp_path / "runs.db"))
+    for number in range(5):
+        history.record(
+            {
+                "run_id": f"run-{number}",
+                "status": "finished",
+                "params": {"sim_time": 60, "min_green": 10 if number < 3 else 15, "max_green": 60},
+                "stats": {"total_vehicles": 20 + number, "throughput": 0.3 + number / 10, "lane_details": {"1": {"car": 2}}},
+                "submitted_at": 1000.0 + number,
+                "finished_at": 1060.0 + number,
+            }
+        )
+    history.close()
+
+    history = RunHistory(str(tmp_path / "runs.db"))
+    page = history.query({"min_green": 10}, order="oldest", limit=2)
+    assert page["total"] == 3 and page["next_offset"] == 2
+    assert [item["run_id"] for item in page["items"]] == ["run-0", "run-1"]
+    assert history.query({"min_green": 10}, since=1002.0)["total"] == 1
+    assert history.get("run-4")["stats"]["lane_details"] == {"1": {"car": 2}}
+
+    comparison = history.compare(["run-0", "run-4", "missing"])
+    assert comparison["baseline"] == "run-0" and comparison["missing"] == ["missing"]
+    assert comparison["runs"][1]["delta"]["total_vehicles"] == 4
+    with pytest.raises(ValueError):
+        history.query({"client": "x"})
+
+
+def test_seeded_runs_are_found_by_key_and_coalesced():
+    params = {"sim_time": 60, "min_green": 10, "max_green": 60, "seed": 1}
+    key = run_key(params, "v1")
+    assert key == run_key(dict(reversed(list(params.items()))), "v1")
+    assert key != run_key(params, "v2") and key != run_key({**params, "seed": 2}, "v1")
+
+    in_flight = InFlight()
+    assert in_flight.claim(key, "first") == "first"
+    assert in_flight.claim(key, "second") == "first"
+
+    history = RunHistory(":memory:")
+    history.record({"run_id": "stopped", "status": "stopped", "params": params, "stats": {}, "submitted_at": 1.0, "cache_key": key})
+    assert history.find_cached(key) is None
+    history.record({"run_id": "first", "status": "finished", "params": params, "stats": {}, "submitted_at": 2.0, "finished_at": 62.0, "cache_key": key})
+    in_flight.release(key, "first")
+    assert history.find_cached(key)["run_id"] == "first"
+    assert in_flight.get(key) is None
@@ -1,12 +1,15 @@
+import copy
+import glob
 import os
 import sys
 import threading
+import time
 import uuid
 import subprocess
-import statistics
 from typing import Dict, Any, List, Optional
 
 from flask import Flask, jsonify, request, render_template
+from werkzeug.middleware.proxy_fix import ProxyFix
 from ultralytics import YOLO
 
 MODEL_PATH = "/mnt/data/yolov12s.pt"
@@ -22,23 +25,29 @@ else:
     print("⚠️ YOLO v12s model not found. Detection disabled.")
 
 
-from data_pipeline.loader import (
-    CityRecord,
-    build_index,
-    load_city_records,
-    normalize_key,
-)
+from data_pipeline.catalog import SORT_ORDERS as CITY_SORT_ORDERS
+from data_pipeline.loader import LATEST_DATA_FILE
+from data_pipeline.reloader import DatasetReloader
+from sim_service import JobQueue, Rejected, RunHistory
+from sim_service.cache import InFlight, code_version, run_key
+from sim_service.history import SORT_ORDERS
 
 
 app = Flask(__name__)
 
 
 class SimulationRun:
-    def __init__(self, run_id: str, params: Dict[str, Any]):
+    def __init__(self, run_id: str, params: Dict[str, Any], client: str = ""):
         self.run_id = run_id
         self.params = params
+        self.client = client
+        self.cache_key: Optional[str] = None  # set for seeded runs, whose results are reused
         self.log_lines: List[str] = []
-        self.status: str = "running"  # "running" | "finished" | "error"
+        self.status: str = "queued"  # "queued" | "running" | "finished" | "error" | "stopped"
+        self.submitted_at: float = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.archived_at: Optional[float] = None
         self.stats: Dict[str, Any] = {
             "phase": "",
             "lanes": {1: 0, 2: 0, 3: 0, 4: 0},
@@ -61,100 +70,65 @@ class SimulationRun:
 runs: Dict[str, SimulationRun] = {}
 runs_lock = threading.Lock()
 
-city_records: List[CityRecord] = load_city_records()
-city_index: Dict[str, CityRecord] = build_index(city_records)
-
-
-def _score_city(record: CityRecord) -> Dict[str, Any]:
-    # Composite score favouring high delays, low peak speed and large population influence.
-    delay_score = min(1.0, record.avg_delay_minutes / 45.0)
-    speed_score = 1.0 - min(1.0, record.avg_peak_speed_kmph / 40.0)
-    population_score = min(1.0, record.population_millions / 15.0)
-    composite = round((delay_score * 0.45 + speed_score * 0.35 + population_score * 0.2) * 100, 1)
-
-    priority_band = "Moderate"
-    if composite >= 70:
-        priority_band = "High"
-    elif composite >= 45:
-        priority_band = "Medium"
-
-    return {
-        "score": composite,
-        "priority": priority_band,
-        "rationale": [
-            f"Average delay of {record.avg_delay_minutes:.0f} minutes",
-            f"Peak speed around {record.avg_peak_speed_kmph:.0f} km/h",
-            f"Population ~{record.population_millions:.1f}M",
-        ],
-    }
-
-
-def _aggregate_home_metrics(records: List[CityRecord]) -> Dict[str, Any]:
-    total = len(records)
-    if not records:
-        return {
-            "density": 0,
-            "avg_wait": 0,
-            "travel_speed": 0,
-            "city_count": 0,
-            "priority_high_pct": 0,
-            "priority_medium_pct": 0,
-        }
-
-    delays = [record.avg_delay_minutes for record in records]
-    speeds = [record.avg_peak_speed_kmph for record in records]
-    density = round(min(95.0, max(15.0, statistics.mean(delays) / 45.0 * 100.0)))
-    avg_wait = round(statistics.mean(delays))
-    travel_speed = round(statistics.mean(speeds), 1)
-
-    priority_counts = {"High": 0, "Medium": 0, "Moderate": 0}
-    for record in records:
-        priority_counts[_score_city(record)["priority"]] += 1
-
-    def pct(value: int) -> int:
-        return round(value / total * 100) if total else 0
-
-    return {
-        "density": density,
-        "avg_wait": avg_wait,
-        "travel_speed": travel_speed,
-        "city_count": total,
-        "priority_high_pct": pct(priority_counts["High"]),
-        "priority_medium_pct": pct(priority_counts["Medium"]),
-        "priority_moderate_pct": pct(priority_counts["Moderate"]),
-    }
-
-
-home_metrics: Dict[str, Any] = _aggregate_home_metrics(city_records)
 
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+# Clients are told apart by address for SIM_MAX_PER_CLIENT.  Behind a reverse proxy set SIM_PROXY_HOPS to the
+# number of proxies in front of the app so the address comes from the X-Forwarded-For entry they appended;
+# entries further left are set by the client and are never trusted
+proxy_hops = _env_int("SIM_PROXY_HOPS", 0)
+if proxy_hops > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxy_hops)
+
+# Finished runs outlive the process in SQLite; `runs` holds this process's runs until SIM_RUN_RETENTION
+# seconds after they are archived, after which status requests are answered from the history
+RUN_RETENTION = _env_int("SIM_RUN_RETENTION", 300)
+history = RunHistory(
+    os.environ.get("SIM_HISTORY_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "run_history.db"))
+)
 
-def _record_to_payload(record: CityRecord) -> Dict[str, Any]:
-    suitability = _score_city(record)
-    return {
-        "city": record.city,
-        "state": record.state,
-        "classification": record.classification,
-        "population_millions": record.population_millions,
-        "avg_peak_speed_kmph": record.avg_peak_speed_kmph,
-        "avg_delay_minutes": record.avg_delay_minutes,
-        "vehicle_mix": record.vehicle_mix,
-        "issues": record.issues,
-        "recommended_actions": record.recommended_actions,
-        "suitability": suitability,
-    }
+# Seeded runs are memoised per (params, seed, scenario file, simulation and engine code); identical requests
+# share one execution
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+CODE_VERSION = code_version(
+    [os.path.join(PROJECT_ROOT, "simulation.py")] + sorted(glob.glob(os.path.join(PROJECT_ROOT, "sim_engine", "*.py")))
+)
+in_flight = InFlight()
 
 
-def _search_records(query: Optional[str]) -> List[CityRecord]:
-    if not query:
-        return sorted(city_records, key=lambda r: (-r.avg_delay_minutes, r.city))
+def _scenario_version() -> Optional[str]:
+    # simulation.py reads SIM_SCENARIO relative to the project root; a missing file keys on its path alone
+    path = os.environ.get("SIM_SCENARIO")
+    if not path:
+        return None
+    try:
+        return code_version([os.path.join(PROJECT_ROOT, path)])
+    except OSError:
+        return f"missing:{path}"
+
+# Each worker runs one simulation.py process at a time
+jobs = JobQueue(
+    workers=_env_int("SIM_WORKERS", min(2, os.cpu_count() or 1)),
+    max_queued=_env_int("SIM_MAX_QUEUED", 8),
+    per_client=_env_int("SIM_MAX_PER_CLIENT", 2),
+)
 
-    needle = query.strip().lower()
-    matches: List[CityRecord] = []
-    for record in city_records:
-        haystack = f"{record.city.lower()} {record.state.lower()} {record.classification.lower()}"
-        if needle in haystack:
-            matches.append(record)
-    return matches[:50]
+# Scores, payloads and sort orders are computed once per dataset version; a refreshed
+# data/traffic_latest.json (or the JSON or snapshot named by CITY_DATA_FILE) is picked up in the
+# background (CITY_RELOAD_INTERVAL=0 disables it)
+try:
+    city_reload_interval = float(os.environ.get("CITY_RELOAD_INTERVAL", "5"))
+except ValueError:
+    city_reload_interval = 5.0
+city_data = DatasetReloader(
+    path=os.environ.get("CITY_DATA_FILE", LATEST_DATA_FILE),
+    interval=city_reload_interval,
+).start()
 
 
 def _parse_stats_from_line(run: SimulationRun, line: str) -> None:
@@ -267,15 +241,62 @@ def _update_summary_metrics(run: SimulationRun) -> None:
     run.stats["congestion_level"] = run.stats["traffic_density"]
 
 
-def _run_simulation_subprocess(run: SimulationRun) -> None:
-    """Background thread target: run simulation.py and capture output."""
+def _archive(run: SimulationRun) -> None:
+    """Store a run that has ended; called once per run, without holding runs_lock."""
+    with runs_lock:
+        entry = {
+            "run_id": run.run_id,
+            "status": run.status,
+            "client": run.client,
+            "params": dict(run.params),
+            "stats": copy.deepcopy(run.stats),
+            "submitted_at": run.submitted_at,
+            "started_at": run.started_at,
+            "finished_at": run.finished_at,
+            "cache_key": run.cache_key,
+        }
     try:
-        project_root = os.path.dirname(os.path.abspath(__file__))
+        history.record(entry)
+        stored = True
+    except Exception as exc:  # pragma: no cover - keep serving if the disk is unavailable
+        stored = False
+        with runs_lock:
+            run.log_lines.append(f"[backend error] could not save run history: {exc}")
+    # Released only after the result is stored, so the next identical request finds it
+    if run.cache_key:
+        in_flight.release(run.cache_key, run.run_id)
+    # Runs that could not be stored stay in memory, the only place their status is kept
+    if stored:
+        with runs_lock:
+            run.archived_at = time.time()
+
 
+def _prune_runs(now: float) -> None:
+    """Forget runs archived more than RUN_RETENTION seconds ago; the caller holds runs_lock."""
+    for run_id in [run_id for run_id, run in runs.items() if run.archived_at and now - run.archived_at > RUN_RETENTION]:
+        del runs[run_id]
+
+
+def _run_simulation_subprocess(run: SimulationRun) -> None:
+    """Job queue target: run simulation.py and capture output."""
+    with runs_lock:
+        # Stopped after a worker took the job but before it started; this thread still owns the archive
+        stopped = run.status == "stopped"
+        if stopped:
+            run.finished_at = run.finished_at or time.time()
+        else:
+            run.status = "running"
+            run.started_at = time.time()
+    if stopped:
+        _archive(run)
+        return
+    try:
         env = os.environ.copy()
         env["SIM_TIME"] = str(run.params.get("sim_time", 120))
         env["MIN_GREEN_TIME"] = str(run.params.get("min_green", 10))
         env["MAX_GREEN_TIME"] = str(run.params.get("max_green", 60))
+        if run.params.get("seed") is not None:
+            env["SIM_SEED"] = str(run.params["seed"])
         env.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
         if not env.get("DISPLAY") and os.name != "nt":
             env.setdefault("SDL_VIDEODRIVER", "dummy")
@@ -283,9 +304,9 @@ def _run_simulation_subprocess(run: SimulationRun) -> None:
 
         python_executable = sys.executable or "python"
 
-        run.process = subprocess.Popen(
+        process = subprocess.Popen(
             [python_executable, "simulation.py"],
-            cwd=project_root,
+            cwd=PROJECT_ROOT,
             env=env,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
@@ -293,32 +314,58 @@ def _run_simulation_subprocess(run: SimulationRun) -> None:
             bufsize=1,
         )
 
-        assert run.process.stdout is not None
+        with runs_lock:
+            run.process = process
+            # A stop that arrived while the process was starting found nothing to terminate
+            if run.status == "stopped":
+                process.terminate()
+
+        assert process.stdout is not None
 
-        for line in run.process.stdout:
+        for line in process.stdout:
             with runs_lock:
                 run.log_lines.append(line.rstrip("\n"))
                 _parse_stats_from_line(run, line)
 
-        run.process.wait()
+        process.wait()
         with runs_lock:
             if run.status == "stopped":
                 run.log_lines.append("[system] simulation halted by user")
             else:
-                if run.process.returncode == 0:
+                if process.returncode == 0:
                     run.status = "finished"
                 else:
                     run.status = "error"
             run.process = None
+            run.finished_at = time.time()
     except Exception as exc:  # pragma: no cover - debug aid
         with runs_lock:
             run.log_lines.append(f"[backend error] {exc}")
             run.status = "error"
+            run.process = None
+            run.finished_at = time.time()
+    _archive(run)
+
+
+def _client_id() -> str:
+    # The peer address, rewritten by ProxyFix from trusted X-Forwarded-For hops only
+    return request.remote_addr or "unknown"
+
+
+def _timings(run: SimulationRun) -> Dict[str, Any]:
+    end = run.finished_at or time.time()
+    return {
+        "submitted_at": run.submitted_at,
+        "started_at": run.started_at,
+        "finished_at": run.finished_at,
+        "queued_seconds": round((run.started_at or end) - run.submitted_at, 3),
+        "run_seconds": round(end - run.started_at, 3) if run.started_at else None,
+    }
 
 
 @app.route("/")
 def home():
-    return render_template("home.html", home_metrics=home_metrics)
+    return render_template("home.html", home_metrics=city_data.catalog.home_metrics)
 
 
 @app.route("/dashboard")
@@ -336,24 +383,50 @@ def cities():
     return render_template("cities.html")
 
 
+def _cached_json(etag: str, build_body, dataset_version: int):
+    # Unchanged responses cost a header comparison; the body is only assembled on a miss
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(build_body(), mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Dataset-Version"] = str(dataset_version)
+    return response
+
+
 @app.route("/api/cities", methods=["GET"])
 def api_cities():
+    dataset = city_data.current
+    catalog = dataset.catalog
     query = request.args.get("q", "").strip()
-    records = _search_records(query)
-    payload = [_record_to_payload(record) for record in records]
-    return jsonify({"count": len(payload), "items": payload})
+    order = request.args.get("sort") or None
+    if order is not None and order not in CITY_SORT_ORDERS:
+        return jsonify({"error": f"unknown sort {order!r}", "sorts": sorted(CITY_SORT_ORDERS)}), 400
+
+    def body() -> str:
+        positions = catalog.search(query, order)
+        return catalog.listing_json(positions, cache_as=None if query else (order or "default"))
+
+    return _cached_json(catalog.etag("cities", query.lower(), order), body, dataset.number)
+
+
+@app.route("/api/cities/suggest", methods=["GET"])
+def api_city_suggest():
+    dataset = city_data.current
+    catalog = dataset.catalog
+    prefix = request.args.get("q", "").strip().lower()
+    return _cached_json(catalog.etag("suggest", prefix), lambda: catalog.suggest_json(prefix), dataset.number)
 
 
 @app.route("/api/cities/<slug>", methods=["GET"])
 def api_city_detail(slug: str):
-    key = normalize_key(slug)
-    record = city_index.get(key)
-    if not record:
-        # allow matching on raw city names if slug not found
-        record = city_index.get(normalize_key(slug.replace("-", " ")))
-    if not record:
+    dataset = city_data.current
+    catalog = dataset.catalog
+    number = catalog.lookup(slug)
+    if number is None:
         return jsonify({"error": "city not found"}), 404
-    return jsonify(_record_to_payload(record))
+    return _cached_json(catalog.etag("city", number), lambda: catalog.payload_json[number], dataset.number)
 
 
 @app.route("/api/run", methods=["POST"])
@@ -362,30 +435,51 @@ def api_run():
     sim_time = int(payload.get("sim_time", 120))
     min_green = int(payload.get("min_green", 10))
     max_green = int(payload.get("max_green", 60))
+    seed = payload.get("seed")
+    params: Dict[str, Any] = {"sim_time": sim_time, "min_green": min_green, "max_green": max_green}
+    if seed not in (None, ""):
+        params["seed"] = int(seed)
 
     run_id = str(uuid.uuid4())
-    run = SimulationRun(
-        run_id,
-        {"sim_time": sim_time, "min_green": min_green, "max_green": max_green},
-    )
+    run = SimulationRun(run_id, params, client=_client_id())
 
+    if "seed" in params:
+        run.cache_key = run_key({**params, "scenario": _scenario_version()}, CODE_VERSION)
+        cached = history.find_cached(run.cache_key)
+        if cached:
+            return jsonify({"run_id": cached["run_id"], "status": cached["status"], "cached": True})
     with runs_lock:
+        _prune_runs(time.time())
+        if run.cache_key:
+            owner = in_flight.claim(run.cache_key, run_id)
+            if owner != run_id:
+                return jsonify({"run_id": owner, "status": runs[owner].status, "coalesced": True})
         runs[run_id] = run
+    try:
+        # simulation.py runs in real time, so a run takes about sim_time seconds
+        jobs.submit(run_id, run.client, lambda: _run_simulation_subprocess(run), estimate=sim_time)
+    except Rejected as exc:
+        with runs_lock:
+            runs.pop(run_id, None)
+            if run.cache_key:
+                in_flight.release(run.cache_key, run_id)
+        response = jsonify({"error": exc.reason, "retry_after": exc.retry_after, "queue": jobs.snapshot()})
+        return response, 429, {"Retry-After": str(exc.retry_after)}
 
-    thread = threading.Thread(target=_run_simulation_subprocess, args=(run,))
-    thread.daemon = True
-    thread.start()
-
-    return jsonify({"run_id": run_id, "status": run.status})
+    return jsonify({"run_id": run_id, "status": run.status, "queue_position": jobs.position(run_id)})
 
 
 @app.route("/api/status/<run_id>", methods=["GET"])
 def api_status(run_id: str):
     with runs_lock:
         run = runs.get(run_id)
-        if not run:
+    if not run:
+        archived = history.get(run_id)
+        if not archived:
             return jsonify({"error": "run not found"}), 404
+        return jsonify({**archived, "log": []})
 
+    with runs_lock:
         # Return last 300 log lines to avoid huge payloads
         log_tail = run.log_lines[-300:]
 
@@ -396,6 +490,9 @@ def api_status(run_id: str):
                 "params": run.params,
                 "log": log_tail,
                 "stats": run.stats,
+                "queue_position": jobs.position(run_id) if run.status == "queued" else None,
+                "queue": jobs.snapshot(),
+                "timings": _timings(run),
             }
         )
 
@@ -406,21 +503,68 @@ def api_stop(run_id: str):
         run = runs.get(run_id)
         if not run:
             return jsonify({"error": "run not found"}), 404
-
+        if run.status in ("finished", "error", "stopped"):
+            # Already over and archived; stopping must not overwrite the outcome
+            return jsonify({"run_id": run_id, "status": run.status})
+
+        # A cancelled job never reaches a worker, so it is archived here; otherwise the worker archives it
+        cancelled = jobs.cancel(run_id)
+        if cancelled:
+            run.log_lines.append("[system] queued simulation cancelled by user")
+            run.finished_at = time.time()
         proc = run.process
         if proc and proc.poll() is None:
             run.log_lines.append("[system] stop requested by user")
-            proc.terminate()
-            try:
-                proc.wait(timeout=3)
-            except subprocess.TimeoutExpired:
-                proc.kill()
         run.status = "stopped"
-        run.process = None
+
+    if cancelled:
+        _archive(run)
+    elif proc and proc.poll() is None:
+        proc.terminate()
+        try:
+            proc.wait(timeout=3)
+        except subprocess.TimeoutExpired:
+            proc.kill()
 
     return jsonify({"run_id": run_id, "status": "stopped"})
 
 
+@app.route("/api/history", methods=["GET"])
+def api_history():
+    args = request.args
+    try:
+        filters = {name: int(args[name]) for name in ("sim_time", "min_green", "max_green") if args.get(name)}
+        if args.get("status"):
+            filters["status"] = args["status"]
+        page = history.query(
+            filters,
+            since=float(args["since"]) if args.get("since") else None,
+            until=float(args["until"]) if args.get("until") else None,
+            order=args.get("order", "newest"),
+            limit=int(args.get("limit", 20)),
+            offset=int(args.get("offset", 0)),
+        )
+    except ValueError as exc:
+        return jsonify({"error": str(exc), "orders": sorted(SORT_ORDERS)}), 400
+    return jsonify(page)
+
+
+@app.route("/api/history/compare", methods=["GET"])
+def api_history_compare():
+    run_ids = [run_id for run_id in request.args.get("ids", "").split(",") if run_id]
+    if not 2 <= len(run_ids) <= 10:
+        return jsonify({"error": "pass between 2 and 10 comma-separated run ids in ?ids="}), 400
+    return jsonify(history.compare(run_ids))
+
+
+@app.route("/api/history/<run_id>", methods=["GET"])
+def api_history_detail(run_id: str):
+    archived = history.get(run_id)
+    if not archived:
+        return jsonify({"error": "run not found"}), 404
+    return jsonify(archived)
+
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=5000, debug=True)